@@ -0,0 +1,57 @@
+"""
+Cold-import benchmark for the theta_agents package.
+
+Imports the package in fresh interpreters, reports the median wall time and
+fails if it exceeds the budget or if any heavy dependency was imported eagerly.
+
+    python benchmarks/bench_import.py --runs 10 --budget-ms 150
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES = ['langgraph', 'langchain_core', 'web3', 'solcx', 'gradio_client', 'openai', 'httpx', 'requests', 'yaml', 'dotenv']
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import theta_agents
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "loaded": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def run_once(repo_root):
+    env = dict(os.environ, PYTHONPATH=repo_root + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    output = subprocess.check_output([sys.executable, '-c', PROBE], cwd=repo_root, env=env)
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--budget-ms', type=float, default=float(os.getenv('THETA_IMPORT_BUDGET_MS', 150)))
+    args = parser.parse_args()
+
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = [run_once(repo_root) for _ in range(args.runs)]
+    timings_ms = [result["seconds"] * 1000 for result in results]
+    median_ms = statistics.median(timings_ms)
+    loaded = sorted({module for result in results for module in result["loaded"]})
+
+    print(f"import theta_agents: median {median_ms:.2f} ms, max {max(timings_ms):.2f} ms over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+    failed = False
+    if loaded:
+        print(f"FAIL: heavy modules imported eagerly: {', '.join(loaded)}")
+        failed = True
+    if median_ms > args.budget_ms:
+        print("FAIL: cold import exceeded budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
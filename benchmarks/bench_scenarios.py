@@ -0,0 +1,505 @@
+"""
+Offline scenario benchmarks for ThetaAgent and the Theta tools.
+
+Starts local fakes for the LLM (OpenAI-compatible chat and images), a gradio app,
+EdgeStore, the Video API and an eth-tester chain, points the SDK at them through a
+generated config file and runs each scenario, reporting p50/p99 latency, throughput
+and peak traced Python memory. Results can be saved as a baseline and compared
+against on later runs; the exit status is 1 if any metric regressed past the tolerance.
+
+    python benchmarks/bench_scenarios.py --iterations 20 --save-baseline baseline.json
+    python benchmarks/bench_scenarios.py --iterations 20 --baseline baseline.json --tolerance 0.2
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_streaming import percentile  # noqa: E402
+from benchmarks.fakes import (  # noqa: E402
+    FakeChainHandler, FakeEdgeStoreHandler, FakeGradioHandler, FakeOpenAIHandler, FakeServer, FakeVideoAPIHandler
+)
+
+SCENARIOS = ['single_turn', 'multi_tool', 'bulk_upload', 'burst_deploys', 'media_pipeline', 'image_burst', 'image_burst_batched',
+             'throttled_burst', 'throttled_burst_scheduled', 'repeated_questions', 'repeated_questions_cached']
+
+# Init code of a contract whose runtime code returns 42; the constructor takes one ignored
+# uint256 so every deployment has different calldata. Precompiled so no solc is needed.
+CONTRACT_ABI = [{"type": "constructor", "inputs": [{"name": "seed", "type": "uint256"}], "stateMutability": "nonpayable"}]
+CONTRACT_BYTECODE = '0x69602a60005260206000f3600052600a6016f3'
+
+# Metrics where a larger value is a regression; for the others a smaller one is
+HIGHER_IS_WORSE = {'p50_ms': True, 'p99_ms': True, 'throughput_per_s': False, 'peak_memory_kb': True}
+
+CONFIG_TEMPLATE = """
+llm_endpoint: "{llm}/v1"
+llm_model_name: "fake-model"
+llm_api_key_env: "FAKE_LLM_API_KEY"
+checkpointer:
+  backend: "memory"
+uploads:
+  journal_dir: "{tmp}/journals"
+capabilities:
+  image_tools:
+    create_image_from_prompt:
+      edgecloud_endpoint: "{image_endpoint}"
+      edgecloud_endpoint_type: "{image_backend}"
+      model_name: "fake-image-model"
+      api_key_env: "FAKE_LLM_API_KEY"
+      batch_api_name: "/predict_batch"
+  video_tools:
+    create_video_from_image:
+      edgecloud_endpoint: "{gradio}"
+      edgecloud_endpoint_type: "gradio"
+  smart_contract_tools:
+    deploy_smart_contract:
+      theta_wallet_private_key_env: "FAKE_WALLET_PRIVATE_KEY"
+      rpc_url: "{chain}"
+      chain_id: {chain_id}
+      min_gas_price: 0
+      receipt_poll_interval: {receipt_poll_interval}
+  theta_edgestore_tools:
+    upload_to_edgestore:
+      api_url: "{edgestore}/api/v2/data"
+      theta_wallet_private_key_env: "FAKE_WALLET_PRIVATE_KEY"
+      bulk_max_workers: {upload_workers}
+      manifest_path: "{tmp}/edgestore_manifest.json"
+  theta_video_tools:
+    upload_video_to_theta:
+      api_url: "{video}"
+      service_account_id: "fake-service-account"
+      service_account_secret_env: "FAKE_VIDEO_SA_SECRET"
+      job_db_path: "{tmp}/transcode_jobs.db"
+      poll_initial_interval: 0.05
+      poll_max_interval: 0.2
+      transcode_wait_timeout: 30
+"""
+
+
+class Environment:
+    """
+    The running fakes, a funded wallet and the temporary directory the generated config points at.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.servers = {}
+        self.tmp = tempfile.mkdtemp(prefix='theta_bench_')
+        self._stack = contextlib.ExitStack()
+
+    def __enter__(self):
+        args = self.args
+        start = lambda name, handler, **settings: self.servers.setdefault(name, self._stack.enter_context(FakeServer(handler, **settings)))
+        start('llm', FakeOpenAIHandler, first_token_latency=args.llm_latency, image_latency=args.image_latency,
+              batch_item_latency=args.batch_item_latency)
+        start('gradio', FakeGradioHandler, latency=args.image_latency, batch_item_latency=args.batch_item_latency)
+        start('edgestore', FakeEdgeStoreHandler, latency=args.upload_latency)
+        start('video', FakeVideoAPIHandler, latency=args.upload_latency, transcode_latency=args.transcode_latency)
+        start('chain', FakeChainHandler)
+
+        from eth_account import Account
+        from web3 import Web3
+        self.wallet = Account.create()
+        FakeChainHandler.fund(self.servers['chain'], self.wallet.address)
+        chain_id = Web3(Web3.HTTPProvider(self.servers['chain'].url)).eth.chain_id
+
+        image_endpoint = self.servers['gradio'].url if args.image_backend == 'gradio' else f"{self.servers['llm'].url}/v1"
+        config_path = os.path.join(self.tmp, 'config.yaml')
+        with open(config_path, 'w') as file:
+            file.write(CONFIG_TEMPLATE.format(
+                llm=self.servers['llm'].url, image_endpoint=image_endpoint, image_backend=args.image_backend,
+                gradio=self.servers['gradio'].url,
+                chain=self.servers['chain'].url, chain_id=chain_id, receipt_poll_interval=args.receipt_poll_interval,
+                edgestore=self.servers['edgestore'].url, video=self.servers['video'].url,
+                upload_workers=args.upload_workers, tmp=self.tmp
+            ))
+        os.environ.update({
+            'CONFIG_FILE': config_path,
+            'FAKE_LLM_API_KEY': 'fake-key',
+            'FAKE_WALLET_PRIVATE_KEY': self.wallet.key.hex(),
+            'FAKE_VIDEO_SA_SECRET': 'fake-secret',
+            'GRADIO_ANALYTICS_ENABLED': 'False'
+        })
+        return self
+
+    def __exit__(self, *exc):
+        from theta_agents.clients import shutdown_clients
+        shutdown_clients()
+        self._stack.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def write_files(self, directory, count, size_kb, seed=''):
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for index in range(count):
+            path = os.path.join(directory, f"file_{index:04d}.bin")
+            with open(path, 'wb') as file:
+                file.write(f"{seed}:{index}:".encode('utf-8').ljust(size_kb * 1024, b'.'))
+            paths.append(path)
+        return paths
+
+    def upstream_counts(self):
+        return {name: dict(server.counts) for name, server in self.servers.items()}
+
+
+def single_turn(env):
+    """
+    One conversational turn without tools.
+    """
+    from theta_agents import ThetaAgent
+    env.servers['llm'].settings['tool_calls'] = []
+    agent = ThetaAgent(capabilities=[])
+
+    def step(index):
+        agent(f"hello {index}")
+        return 1, None
+    return step
+
+
+def multi_tool(env):
+    """
+    One turn in which the model calls three tools at once: image generation, an
+    EdgeStore upload and a Video API upload with transcode, then answers.
+    """
+    from theta_agents import ThetaAgent, create_image_from_prompt, upload_to_edgestore, upload_video_to_theta
+    video, asset = env.write_files(os.path.join(env.tmp, 'media'), 2, env.args.file_kb)
+    env.servers['llm'].settings['tool_calls'] = [
+        {"name": "create_image_from_prompt", "args": {"prompt": "a monkey on a bicycle"}},
+        {"name": "upload_to_edgestore", "args": {"filepath": asset}},
+        {"name": "upload_video_to_theta", "args": {"filepath": video}}
+    ]
+    agent = ThetaAgent(capabilities=[create_image_from_prompt, upload_to_edgestore, upload_video_to_theta])
+
+    def step(index):
+        agent(f"make an image and upload my files ({index})")
+        return 1, None
+    return step
+
+
+def bulk_upload(env):
+    """
+    `upload_directory_to_edgestore` over a directory of fresh files; throughput is files per second.
+    """
+    from theta_agents import upload_directory_to_edgestore
+    args = env.args
+    manifest_path = os.path.join(env.tmp, 'edgestore_manifest.json')
+    directory = os.path.join(env.tmp, 'bulk')
+    env.write_files(directory, args.files, args.file_kb)
+
+    def step(index):
+        # Forget earlier uploads so every file is sent again
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(manifest_path)
+        results = upload_directory_to_edgestore(directory)
+        failed = [path for path, result in results.items() if isinstance(result, str) and result.startswith('Error')]
+        if failed:
+            raise RuntimeError(f"{len(failed)} uploads failed, e.g. {results[failed[0]]}")
+        return len(results), None
+    return step
+
+
+def burst_deploys(env):
+    """
+    `--burst` contract deployments submitted at once from one wallet; latency is per
+    deployment, from submission until the contract address is known.
+    """
+    from theta_agents.tools.tx_pipeline import get_deploy_pipeline
+    args = env.args
+    pipeline = get_deploy_pipeline()
+    private_key = env.wallet.key.hex()
+    executor = ThreadPoolExecutor(max_workers=args.burst)
+    counter = iter(range(10 ** 9))
+    counter_lock = threading.Lock()
+
+    def deploy():
+        with counter_lock:
+            seed = next(counter)
+        start = time.perf_counter()
+        pipeline.submit(CONTRACT_ABI, CONTRACT_BYTECODE, (seed,), private_key).result(timeout=60)
+        return time.perf_counter() - start
+
+    def step(index):
+        latencies = list(executor.map(lambda _: deploy(), range(args.burst)))
+        return len(latencies), latencies
+    return step
+
+
+def media_pipeline(env):
+    """
+    `create_videos_from_prompts` over `--pipeline-items` prompts: image, video and Video API
+    upload per prompt with the stages overlapping; latency is per item, from entering the
+    pipeline until its upload finished.
+    """
+    from theta_agents.tools.pipeline_tools import video_pipeline
+    pipeline = video_pipeline("theta_video")
+
+    def step(index):
+        results = pipeline.run([f"campaign shot {index}.{item}" for item in range(env.args.pipeline_items)])
+        failed = [result for result in results if not result.ok]
+        if failed:
+            raise RuntimeError(f"{len(failed)} items failed, e.g. {failed[0].failed_stage}: {failed[0].error}")
+        return len(results), [result.elapsed for result in results]
+    return step
+
+
+def _image_burst(env, batched):
+    from theta_agents import create_image_from_prompt
+    from theta_agents.config.default_config import global_config
+    args = env.args
+    executor = ThreadPoolExecutor(max_workers=args.burst)
+
+    def generate(prompt):
+        start = time.perf_counter()
+        url = create_image_from_prompt(prompt)
+        if url.startswith('Error'):
+            raise RuntimeError(url)
+        return time.perf_counter() - start
+
+    def step(index):
+        global_config["batching"]["enabled"] = batched
+        try:
+            # One prompt per burst, as when several variations of an image are requested
+            latencies = list(executor.map(generate, [f"burst {index}"] * args.burst))
+        finally:
+            global_config["batching"]["enabled"] = False
+        return len(latencies), latencies
+    return step
+
+
+def image_burst(env):
+    """
+    `--burst` concurrent `create_image_from_prompt` calls, each sent on its own; latency is per image.
+    """
+    return _image_burst(env, batched=False)
+
+
+def image_burst_batched(env):
+    """
+    The same burst with `batching` enabled, so the calls reach the endpoint as batched requests.
+    """
+    return _image_burst(env, batched=True)
+
+
+def _throttled_burst(env, scheduled):
+    from theta_agents import create_image_from_prompt
+    from theta_agents.clients import shutdown_clients
+    from theta_agents.config.default_config import global_config
+    from theta_agents.scheduler import Scheduler, set_scheduler
+    args = env.args
+    llm = env.servers['llm']
+    executor = ThreadPoolExecutor(max_workers=args.burst)
+
+    def generate(prompt):
+        start = time.perf_counter()
+        ok = not create_image_from_prompt(prompt).startswith('Error')
+        return ok, time.perf_counter() - start
+
+    def step(index):
+        llm.settings['quota_per_second'] = args.quota
+        global_config["scheduler"]["enabled"] = scheduled
+        # A burst of 1 paces requests evenly, so no rolling second ever holds more than the quota
+        set_scheduler(Scheduler(endpoints={llm.url: {"requests_per_second": args.quota, "burst": 1}}))
+        # Pooled clients pick up the scheduler when they are created
+        shutdown_clients()
+        try:
+            outcomes = list(executor.map(generate, [f"throttled {index} {n}" for n in range(args.burst)]))
+        finally:
+            llm.settings['quota_per_second'] = 0
+            global_config["scheduler"]["enabled"] = False
+            set_scheduler(None)
+            shutdown_clients()
+        # Only images that were actually created count towards throughput
+        return sum(ok for ok, _ in outcomes), [latency for _, latency in outcomes]
+    return step
+
+
+def throttled_burst(env):
+    """
+    `--burst` concurrent image calls against an OpenAI endpoint that allows `--quota`
+    requests per second and answers the rest with 429 and Retry-After.
+    """
+    return _throttled_burst(env, scheduled=False)
+
+
+def throttled_burst_scheduled(env):
+    """
+    The same burst with the `scheduler` admitting `--quota` requests per second to the endpoint.
+    """
+    return _throttled_burst(env, scheduled=True)
+
+
+# Opening turns as users type them: the same few questions with different case, punctuation and filler
+REPEATED_QUESTIONS = [
+    "Hello!", "hello", "Hello.", "What can you do?", "what can you do", "What can you do??",
+    "I need a campaign about monkeys with an image and a video",
+    "please, I need a campaign about monkeys with an image and a video",
+    "I need a campaign about monkeys with a video and an image"
+]
+
+
+def _repeated_questions(env, cached):
+    from theta_agents import ThetaAgent
+    from theta_agents.config.default_config import global_config
+    from theta_agents.semantic_cache import HashingEmbedder, SemanticCache, set_semantic_cache
+    env.servers['llm'].settings['tool_calls'] = []
+    # In memory and empty, so every run starts cold
+    threshold = global_config["semantic_cache"]["threshold"]
+    set_semantic_cache(SemanticCache(HashingEmbedder(), threshold=float(threshold) if threshold is not None else None))
+
+    def step(index):
+        global_config["semantic_cache"]["enabled"] = cached
+        try:
+            # Each question opens a new conversation
+            ThetaAgent(capabilities=[])(REPEATED_QUESTIONS[index % len(REPEATED_QUESTIONS)])
+        finally:
+            global_config["semantic_cache"]["enabled"] = False
+        return 1, None
+    return step
+
+
+def repeated_questions(env):
+    """
+    First turns of new conversations cycling through a few questions phrased in different ways.
+    """
+    return _repeated_questions(env, cached=False)
+
+
+def repeated_questions_cached(env):
+    """
+    The same turns with the `semantic_cache` answering questions it has seen before.
+    """
+    return _repeated_questions(env, cached=True)
+
+
+def run_scenario(env, name):
+    """
+    Warm up, time `--iterations` steps, then repeat `--memory-iterations` steps under
+    tracemalloc (kept separate so tracing does not skew the latencies).
+    """
+    args = env.args
+    step = globals()[name](env)
+    for index in range(args.warmup):
+        step(-1 - index)
+
+    before = env.upstream_counts()
+    latencies, operations = [], 0
+    start = time.perf_counter()
+    for index in range(args.iterations):
+        step_start = time.perf_counter()
+        count, op_latencies = step(index)
+        latencies.extend(op_latencies if op_latencies is not None else [time.perf_counter() - step_start])
+        operations += count
+    elapsed = time.perf_counter() - start
+    after = env.upstream_counts()
+
+    peak = 0
+    if args.memory_iterations:
+        tracemalloc.start()
+        for index in range(args.memory_iterations):
+            step(args.iterations + index)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    upstream = {}
+    for server, counts in after.items():
+        for key, value in counts.items():
+            delta = value - before.get(server, {}).get(key, 0)
+            if delta:
+                upstream[f"{server}.{key}"] = delta
+    return {
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "throughput_per_s": operations / elapsed if elapsed else 0.0,
+        "peak_memory_kb": peak / 1024,
+        "operations": operations,
+        "upstream_calls": upstream
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Print each metric against the baseline and return the regressions beyond `tolerance`.
+    """
+    regressions = []
+    print(f"\n{'scenario':<16} {'metric':<18} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name, metrics in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for metric, higher_is_worse in HIGHER_IS_WORSE.items():
+            old, new = previous.get(metric), metrics[metric]
+            if not old:
+                continue
+            change = (new - old) / old
+            regressed = change > tolerance if higher_is_worse else change < -tolerance
+            if regressed:
+                regressions.append((name, metric, change))
+            print(f"{name:<16} {metric:<18} {old:12.1f} {new:12.1f} {change:+8.1%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='comma-separated subset of ' + ', '.join(SCENARIOS))
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--memory-iterations', type=int, default=3, help='extra steps run under tracemalloc; 0 to skip')
+    parser.add_argument('--llm-latency', type=float, default=0.02, help='fake LLM time to first token, seconds')
+    parser.add_argument('--image-latency', type=float, default=0.05)
+    parser.add_argument('--image-backend', choices=['openai', 'gradio'], default='openai')
+    parser.add_argument('--batch-item-latency', type=float, default=0.005,
+                        help='extra fake image latency per additional item of a batched request')
+    parser.add_argument('--upload-latency', type=float, default=0.01)
+    parser.add_argument('--transcode-latency', type=float, default=0.1)
+    parser.add_argument('--files', type=int, default=32, help='files per bulk upload')
+    parser.add_argument('--file-kb', type=int, default=64)
+    parser.add_argument('--upload-workers', type=int, default=4)
+    parser.add_argument('--burst', type=int, default=16, help='deployments per burst')
+    parser.add_argument('--receipt-poll-interval', type=float, default=0.05)
+    parser.add_argument('--pipeline-items', type=int, default=4, help='prompts per media pipeline run')
+    parser.add_argument('--quota', type=float, default=8, help='requests per second the throttled endpoint allows')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative change before a metric counts as a regression')
+    parser.add_argument('--save-baseline', help='write these results as JSON')
+    parser.add_argument('--log-level', default='WARNING')
+    args = parser.parse_args()
+    # Configured before theta_agents is imported so its own basicConfig call is a no-op
+    logging.basicConfig(level=args.log_level)
+
+    names = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = sorted(set(names) - set(SCENARIOS))
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    results = {}
+    with Environment(args) as env:
+        for name in names:
+            results[name] = result = run_scenario(env, name)
+            print(f"{name:<16} p50 {result['p50_ms']:8.1f} ms   p99 {result['p99_ms']:8.1f} ms   "
+                  f"{result['throughput_per_s']:8.1f} ops/s   peak {result['peak_memory_kb']:8.0f} KiB")
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
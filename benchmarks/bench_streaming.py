@@ -0,0 +1,77 @@
+"""
+Time-to-first-byte benchmark for ThetaAgent.stream against a local fake LLM.
+
+Compares how long a caller waits for the first user-visible text with
+`stream()` against the full-turn latency of `__call__`.
+
+    python benchmarks/bench_streaming.py --turns 20 --token-interval 0.02
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import FakeOpenAIHandler, FakeServer  # noqa: E402
+
+
+def write_config(llm_endpoint):
+    config = tempfile.NamedTemporaryFile('w', suffix='.yaml', delete=False)
+    config.write(f'llm_endpoint: "{llm_endpoint}"\nllm_model_name: "fake-model"\nllm_api_key_env: "FAKE_LLM_API_KEY"\n')
+    # Checkpoints stay in memory, so runs leave nothing in ~/.cache and do not time disk writes
+    config.write('checkpointer:\n  backend: "memory"\n')
+    config.close()
+    os.environ['CONFIG_FILE'] = config.name
+    os.environ['FAKE_LLM_API_KEY'] = 'fake-key'
+    return config.name
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--turns', type=int, default=20)
+    parser.add_argument('--first-token-latency', type=float, default=0.05)
+    parser.add_argument('--token-interval', type=float, default=0.01)
+    args = parser.parse_args()
+
+    reply = '{"planning_text": "", "user_facing_text": "' + 'Streaming tokens to the user as they arrive. ' * 8 + '"}'
+    with FakeServer(FakeOpenAIHandler, reply=reply, first_token_latency=args.first_token_latency,
+                    token_interval=args.token_interval) as server:
+        config_path = write_config(f"{server.url}/v1")
+        try:
+            from theta_agents import ThetaAgent
+            agent = ThetaAgent(capabilities=[])
+
+            ttfb, streamed, blocking = [], [], []
+            for _ in range(args.turns):
+                start = time.perf_counter()
+                first = None
+                for event in agent.stream("hello"):
+                    if first is None and event["type"] == "user_facing_text":
+                        first = time.perf_counter() - start
+                streamed.append(time.perf_counter() - start)
+                ttfb.append(first if first is not None else streamed[-1])
+
+                start = time.perf_counter()
+                agent("hello")
+                blocking.append(time.perf_counter() - start)
+        finally:
+            os.remove(config_path)
+
+    def report(name, values):
+        print(f"{name:<28} p50 {statistics.median(values) * 1000:8.1f} ms   p99 {percentile(values, 0.99) * 1000:8.1f} ms")
+
+    report("stream(): first text delta", ttfb)
+    report("stream(): full turn", streamed)
+    report("__call__(): full turn", blocking)
+
+
+if __name__ == '__main__':
+    main()
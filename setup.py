@@ -5,8 +5,8 @@ setup(
     version='0.1.0',
     packages=find_packages(),
     install_requires=[
-        'gradio', 'langgraph', 'langsmith', 'langchain', 'langchain-openai',
-        'opencv-python', 'scikit-image', 'requests'  # list only necessary dependencies
+        'gradio', 'langgraph>=0.2', 'langsmith', 'langchain', 'langchain-openai',
+        'opencv-python', 'scikit-image', 'requests', 'numpy', 'tiktoken', 'httpx'  # list only necessary dependencies
     ],
     include_package_data=True,
     entry_points={
@@ -1,17 +1,31 @@
-from .agent import ThetaAgent
-from .tools.image_tools import create_image_from_prompt
-from .tools.video_tools import create_video_from_image
-from .tools.smart_contract_tools import generate_smart_contract, analyze_smart_contract, deploy_smart_contract
-from .tools.theta_edgestore_tools import upload_to_edgestore
-from .tools.theta_video_tools import upload_video_to_theta
+import importlib
 
-__all__ = [
-    "ThetaAgent",
-    "create_image_from_prompt",
-    "create_video_from_image",
-    "generate_smart_contract",
-    "analyze_smart_contract",
-    "deploy_smart_contract",
-    "upload_to_edgestore",
-    "upload_video_to_theta"
-]
+# Public names are resolved on first attribute access so `import theta_agents`
+# does not pull in langgraph, web3, solcx, gradio_client or openai.
+_exports = {
+    "ThetaAgent": ".agent",
+    "AgentRuntime": ".runtime",
+    "get_runtime": ".runtime",
+    "create_image_from_prompt": ".tools.image_tools",
+    "create_video_from_image": ".tools.video_tools",
+    "generate_smart_contract": ".tools.smart_contract_tools",
+    "analyze_smart_contract": ".tools.smart_contract_tools",
+    "deploy_smart_contract": ".tools.smart_contract_tools",
+    "upload_to_edgestore": ".tools.theta_edgestore_tools",
+    "upload_directory_to_edgestore": ".tools.theta_edgestore_tools",
+    "upload_video_to_theta": ".tools.theta_video_tools",
+    "create_videos_from_prompts": ".tools.pipeline_tools"
+}
+
+__all__ = list(_exports)
+
+def __getattr__(name):
+    module_name = _exports.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
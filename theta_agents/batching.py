@@ -0,0 +1,183 @@
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Hashable, List
+from theta_agents.config.default_config import config_bool, global_config
+from theta_agents.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+
+def batching_enabled() -> bool:
+    return config_bool(global_config["batching"]["enabled"])
+
+
+class _Batch:
+    def __init__(self, deadline: float):
+        self.deadline = deadline
+        self.entries = []
+        # The batch runs in the context of its first caller, so tracing and cache bypass follow it
+        self.context = contextvars.copy_context()
+
+
+class MicroBatcher:
+    """
+    Collects concurrent calls that share a key and runs them as one batch.
+
+    A batch is sent `max_wait` seconds after its first call arrived, or as soon as it
+    holds `max_batch` calls. `batch_fn(key, items)` returns one result per item, in order;
+    an exception in the returned list fails only that caller, an exception raised fails
+    the whole batch. Calls submitted with `eager=True` are sent at once unless a batch
+    with the same key is pending or in flight, for keys that only coalesce when calls
+    repeat. Options left unset are read from the `batching` section of `global_config`,
+    `max_wait` and `max_batch` on every call and `max_workers` when the batcher is created.
+    """
+
+    def __init__(self, name: str, batch_fn: Callable[[Hashable, List], List], max_wait: float = None,
+                 max_batch: int = None, max_workers: int = None):
+        self.name = name
+        self.batch_fn = batch_fn
+        self._max_wait = max_wait
+        self._max_batch = max_batch
+        if max_workers is None:
+            max_workers = int(global_config["batching"]["max_workers"])
+        self._pending = {}
+        # Batches dispatched and not finished yet, per key
+        self._in_flight = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f'theta-batch-{name}')
+
+    @property
+    def max_wait(self) -> float:
+        return float(self._max_wait if self._max_wait is not None else global_config["batching"]["max_wait"])
+
+    @property
+    def max_batch(self) -> int:
+        return int(self._max_batch if self._max_batch is not None else global_config["batching"]["max_batch"])
+
+    def submit(self, key: Hashable, item, eager: bool = False) -> Future:
+        """
+        Queue `item` for the batch of `key` and return a future resolving to its result.
+        """
+        future = Future()
+        now = time.monotonic()
+        max_wait, max_batch = self.max_wait, self.max_batch
+        with self._cond:
+            if self._closed:
+                raise RuntimeError(f"Batcher {self.name} is closed")
+            batch = self._pending.get(key)
+            if batch is None:
+                # Nothing to join; an eager call does not wait for others that are unlikely to come
+                alone = eager and not self._in_flight.get(key)
+                batch = _Batch(now if alone else now + max_wait)
+                if not alone:
+                    self._pending[key] = batch
+            batch.entries.append((item, future, now))
+            full = len(batch.entries) >= max_batch or max_wait <= 0 or batch.deadline <= now
+            if full:
+                self._pending.pop(key, None)
+                self._in_flight[key] = self._in_flight.get(key, 0) + 1
+            else:
+                self._ensure_thread()
+                self._cond.notify()
+        if full:
+            self._dispatch(key, batch)
+        return future
+
+    def call(self, key: Hashable, item, eager: bool = False):
+        return self.submit(key, item, eager).result()
+
+    async def acall(self, key: Hashable, item, eager: bool = False):
+        return await asyncio.wrap_future(self.submit(key, item, eager))
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, daemon=True, name=f'theta-batcher-{self.name}')
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    due = [key for key, batch in self._pending.items() if batch.deadline <= now or self._closed]
+                    if due or (self._closed and not self._pending):
+                        break
+                    deadline = min((batch.deadline for batch in self._pending.values()), default=None)
+                    self._cond.wait(None if deadline is None else deadline - now)
+                ready = [(key, self._pending.pop(key)) for key in due]
+                for key in due:
+                    self._in_flight[key] = self._in_flight.get(key, 0) + 1
+                closed = self._closed
+            for key, batch in ready:
+                self._dispatch(key, batch)
+            if closed and not ready:
+                return
+
+    def _dispatch(self, key, batch: _Batch):
+        self._executor.submit(batch.context.run, self._send, key, batch)
+
+    def _send(self, key, batch: _Batch):
+        try:
+            self._send_batch(key, batch)
+        finally:
+            with self._cond:
+                remaining = self._in_flight.pop(key) - 1
+                if remaining:
+                    self._in_flight[key] = remaining
+
+    def _send_batch(self, key, batch: _Batch):
+        items = [item for item, _, _ in batch.entries]
+        futures = [future for _, future, _ in batch.entries]
+        metrics = get_metrics()
+        started = time.monotonic()
+        for _, _, queued_at in batch.entries:
+            metrics.observe('theta_batch_queue_delay_seconds', started - queued_at, batcher=self.name)
+        metrics.observe('theta_batch_size', len(items), batcher=self.name)
+        metrics.inc('theta_batches_total', batcher=self.name)
+        metrics.inc('theta_batched_items_total', len(items), batcher=self.name)
+        try:
+            results = self.batch_fn(key, items)
+            if len(results) != len(items):
+                raise ValueError(f"Batch of {len(items)} returned {len(results)} results")
+        except Exception as e:
+            logger.error(f"Batch of {len(items)} for {self.name} failed: {e}")
+            for future in futures:
+                future.set_exception(e)
+            return
+        for future, result in zip(futures, results):
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def close(self):
+        """
+        Send every pending batch and stop accepting calls.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        self._executor.shutdown(wait=True)
+
+
+_batchers = {}
+_batchers_lock = threading.Lock()
+
+def get_batcher(name: str, batch_fn: Callable[[Hashable, List], List]) -> MicroBatcher:
+    """
+    Return the process-wide batcher for `name`, created on first use.
+    """
+    with _batchers_lock:
+        batcher = _batchers.get(name)
+        if batcher is None:
+            batcher = _batchers[name] = MicroBatcher(name, batch_fn)
+        return batcher
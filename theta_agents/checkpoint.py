@@ -0,0 +1,439 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+)
+from theta_agents.config.default_config import global_config
+
+logger = logging.getLogger(__name__)
+
+
+class _HotThread:
+    """
+    Serialized latest checkpoint (and its pending writes) of each namespace of one thread.
+    """
+
+    def __init__(self, expires_at):
+        self.latest = {}
+        self.writes = {}
+        self.expires_at = expires_at
+
+    @property
+    def size(self) -> int:
+        size = 0
+        for checkpoint_id, parent_id, checkpoint, metadata in self.latest.values():
+            size += len(checkpoint[1]) + len(metadata[1]) + len(checkpoint_id)
+        for writes in self.writes.values():
+            size += sum(len(value[1]) for _, _, value, _ in writes.values())
+        return size
+
+
+class SQLiteCheckpointer(BaseCheckpointSaver):
+    """
+    LangGraph checkpointer backed by SQLite with a bounded in-memory tier.
+
+    Every checkpoint is written through to SQLite, so history survives restarts. The latest
+    checkpoint of recently used threads is also kept in memory; once that tier grows past
+    `memory_cap_bytes` the least recently used threads are dropped from memory and are read
+    back from disk when they become active again. Before the memory copy is served it is
+    checked against the newest checkpoint on disk, so several processes can share one file.
+
+    Each thread keeps its latest checkpoint plus `max_history` older ones. Threads expire
+    `thread_ttl` seconds after their last checkpoint; a run can override the TTL with the
+    `thread_ttl` key of its `configurable` dict. Expired threads are purged on access and
+    every `purge_interval` seconds while checkpoints are being written.
+    """
+
+    def __init__(self, path: str = ':memory:', memory_cap_bytes: int = 64 * 1024 * 1024, max_history: int = 10,
+                 thread_ttl: float = None, purge_interval: float = 300, *, serde=None):
+        super().__init__(serde=serde)
+        self.path = path
+        self.memory_cap_bytes = memory_cap_bytes
+        self.max_history = max_history
+        self.thread_ttl = thread_ttl
+        self.purge_interval = purge_interval
+        self._hot = OrderedDict()
+        self._hot_bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "evicted": 0, "expired": 0}
+        self._next_purge = time.monotonic() + purge_interval
+        self._lock = threading.RLock()
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS threads ("
+            "thread_id TEXT PRIMARY KEY, last_access REAL, expires_at REAL);"
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            "thread_id TEXT, checkpoint_ns TEXT, checkpoint_id TEXT, parent_id TEXT, "
+            "checkpoint_type TEXT, checkpoint BLOB, metadata_type TEXT, metadata BLOB, "
+            "PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id));"
+            "CREATE TABLE IF NOT EXISTS writes ("
+            "thread_id TEXT, checkpoint_ns TEXT, checkpoint_id TEXT, task_id TEXT, idx INTEGER, "
+            "channel TEXT, value_type TEXT, value BLOB, task_path TEXT, "
+            "PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx));"
+            "CREATE INDEX IF NOT EXISTS threads_expires_at ON threads (expires_at);"
+        )
+        self._conn.commit()
+
+    # Hot tier
+
+    def _hot_get(self, thread_id: str) -> Optional[_HotThread]:
+        hot = self._hot.get(thread_id)
+        if hot is not None:
+            self._hot.move_to_end(thread_id)
+        return hot
+
+    def _hot_resize(self, thread_id: str, hot: _HotThread, previous_size: int):
+        self._hot_bytes += hot.size - previous_size
+        self._hot.move_to_end(thread_id)
+        # Never evict the thread that is being written; it is the one most likely to be read next
+        while self._hot_bytes > self.memory_cap_bytes and len(self._hot) > 1:
+            evicted_id, evicted = self._hot.popitem(last=False)
+            self._hot_bytes -= evicted.size
+            self._stats["evicted"] += 1
+            logger.debug(f"Evicted idle thread {evicted_id} from the checkpoint memory tier")
+
+    def _hot_drop(self, thread_id: str):
+        hot = self._hot.pop(thread_id, None)
+        if hot is not None:
+            self._hot_bytes -= hot.size
+
+    # Expiry
+
+    def _ttl(self, config: RunnableConfig) -> Optional[float]:
+        ttl = config["configurable"].get("thread_ttl", self.thread_ttl)
+        return float(ttl) if ttl else None
+
+    def _is_expired(self, thread_id: str, now: float) -> bool:
+        hot = self._hot.get(thread_id)
+        if hot is not None:
+            expires_at = hot.expires_at
+        else:
+            row = self._conn.execute("SELECT expires_at FROM threads WHERE thread_id = ?", (thread_id,)).fetchone()
+            expires_at = row[0] if row else None
+        if expires_at is not None and expires_at <= now:
+            self._delete_thread(thread_id)
+            self._conn.commit()
+            self._stats["expired"] += 1
+            return True
+        return False
+
+    def purge_expired(self) -> int:
+        """
+        Delete every thread whose TTL has elapsed. Returns the number of threads removed.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT thread_id FROM threads WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)
+            ).fetchall()
+            for (thread_id,) in rows:
+                self._delete_thread(thread_id)
+            self._conn.commit()
+            self._stats["expired"] += len(rows)
+            self._next_purge = time.monotonic() + self.purge_interval
+        if rows:
+            logger.info(f"Purged {len(rows)} expired conversation threads")
+        return len(rows)
+
+    # Reads
+
+    def _tuple(self, thread_id, checkpoint_ns, checkpoint_id, parent_id, checkpoint, metadata, writes) -> CheckpointTuple:
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+            checkpoint=self.serde.loads_typed(checkpoint),
+            metadata=self.serde.loads_typed(metadata),
+            parent_config=(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_id}}
+                if parent_id else None
+            ),
+            pending_writes=[(task_id, channel, self.serde.loads_typed(value)) for task_id, channel, value, _ in writes]
+        )
+
+    def _load_writes(self, thread_id, checkpoint_ns, checkpoint_id) -> Dict[Tuple[str, int], tuple]:
+        rows = self._conn.execute(
+            "SELECT task_id, idx, channel, value_type, value, task_path FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id)
+        ).fetchall()
+        return {(task_id, idx): (task_id, channel, (value_type, value), task_path)
+                for task_id, idx, channel, value_type, value, task_path in rows}
+
+    def _is_current(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str, hot: _HotThread) -> bool:
+        """
+        Whether the memory copy is still the newest state on disk. Another process sharing the
+        database file may have advanced the thread; both lookups are on primary key prefixes.
+        """
+        if self.path == ':memory:':
+            return True
+        newest_id, write_count = self._conn.execute(
+            "SELECT (SELECT MAX(checkpoint_id) FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?), "
+            "(SELECT COUNT(*) FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?)",
+            (thread_id, checkpoint_ns, thread_id, checkpoint_ns, checkpoint_id)
+        ).fetchone()
+        return newest_id == checkpoint_id and write_count == len(hot.writes[checkpoint_ns])
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        with self._lock:
+            if self._is_expired(thread_id, time.time()):
+                return None
+
+            hot = self._hot_get(thread_id)
+            latest = hot.latest.get(checkpoint_ns) if hot is not None else None
+            if latest is not None and checkpoint_id in (None, latest[0]) and self._is_current(thread_id, checkpoint_ns, latest[0], hot):
+                self._stats["hits"] += 1
+                return self._tuple(thread_id, checkpoint_ns, *latest, hot.writes[checkpoint_ns].values())
+
+            self._stats["misses"] += 1
+            query = (
+                "SELECT checkpoint_id, parent_id, checkpoint_type, checkpoint, metadata_type, metadata "
+                "FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?"
+            )
+            if checkpoint_id:
+                row = self._conn.execute(query + " AND checkpoint_id = ?", (thread_id, checkpoint_ns, checkpoint_id)).fetchone()
+            else:
+                row = self._conn.execute(query + " ORDER BY checkpoint_id DESC LIMIT 1", (thread_id, checkpoint_ns)).fetchone()
+            if row is None:
+                return None
+            found_id, parent_id, checkpoint_type, checkpoint, metadata_type, metadata = row
+            entry = (found_id, parent_id, (checkpoint_type, checkpoint), (metadata_type, metadata))
+            writes = self._load_writes(thread_id, checkpoint_ns, found_id)
+
+            if not checkpoint_id:
+                # Bring a thread that was evicted from memory back into the hot tier
+                if hot is None:
+                    expires_row = self._conn.execute("SELECT expires_at FROM threads WHERE thread_id = ?", (thread_id,)).fetchone()
+                    hot = self._hot[thread_id] = _HotThread(expires_row[0] if expires_row else None)
+                previous_size = hot.size
+                hot.latest[checkpoint_ns] = entry
+                hot.writes[checkpoint_ns] = writes
+                self._hot_resize(thread_id, hot, previous_size)
+            return self._tuple(thread_id, checkpoint_ns, *entry, writes.values())
+
+    def list(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+             before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        clauses, params = [], []
+        if config is not None:
+            clauses.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if config["configurable"].get("checkpoint_ns") is not None:
+                clauses.append("checkpoint_ns = ?")
+                params.append(config["configurable"]["checkpoint_ns"])
+            if get_checkpoint_id(config):
+                clauses.append("checkpoint_id = ?")
+                params.append(get_checkpoint_id(config))
+        if before is not None and get_checkpoint_id(before):
+            clauses.append("checkpoint_id < ?")
+            params.append(get_checkpoint_id(before))
+        where = f"WHERE {' AND '.join(clauses)} " if clauses else ""
+
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_id, checkpoint_type, checkpoint, "
+                f"metadata_type, metadata FROM checkpoints {where}ORDER BY thread_id, checkpoint_ns, checkpoint_id DESC",
+                params
+            ).fetchall()
+
+        for thread_id, checkpoint_ns, checkpoint_id, parent_id, checkpoint_type, checkpoint, metadata_type, metadata in rows:
+            if limit is not None and limit <= 0:
+                break
+            if filter:
+                values = self.serde.loads_typed((metadata_type, metadata))
+                if not all(values.get(key) == value for key, value in filter.items()):
+                    continue
+            with self._lock:
+                writes = self._load_writes(thread_id, checkpoint_ns, checkpoint_id)
+            if limit is not None:
+                limit -= 1
+            yield self._tuple(thread_id, checkpoint_ns, checkpoint_id, parent_id, (checkpoint_type, checkpoint),
+                              (metadata_type, metadata), writes.values())
+
+    # Writes
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        parent_id = config["configurable"].get("checkpoint_id")
+        checkpoint_typed = self.serde.dumps_typed(checkpoint)
+        metadata_typed = self.serde.dumps_typed(self._metadata(config, metadata))
+        now = time.time()
+        ttl = self._ttl(config)
+        expires_at = now + ttl if ttl else None
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id, parent_id, "
+                "checkpoint_type, checkpoint, metadata_type, metadata) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, checkpoint_ns, checkpoint["id"], parent_id, *checkpoint_typed, *metadata_typed)
+            )
+            self._conn.execute(
+                "INSERT INTO threads (thread_id, last_access, expires_at) VALUES (?, ?, ?) ON CONFLICT(thread_id) "
+                "DO UPDATE SET last_access = excluded.last_access, expires_at = excluded.expires_at",
+                (thread_id, now, expires_at)
+            )
+            self._compact(thread_id, checkpoint_ns)
+            self._conn.commit()
+
+            hot = self._hot_get(thread_id)
+            if hot is None:
+                hot = self._hot[thread_id] = _HotThread(expires_at)
+            previous_size = hot.size
+            hot.expires_at = expires_at
+            hot.latest[checkpoint_ns] = (checkpoint["id"], parent_id, checkpoint_typed, metadata_typed)
+            hot.writes[checkpoint_ns] = {}
+            self._hot_resize(thread_id, hot, previous_size)
+
+        if time.monotonic() >= self._next_purge:
+            self.purge_expired()
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    @staticmethod
+    def _metadata(config: RunnableConfig, metadata: CheckpointMetadata) -> dict:
+        # Same merge MemorySaver does: run-level configurable/metadata values are recorded with the checkpoint
+        merged = dict(metadata)
+        for source in (config.get("metadata"), config.get("configurable")):
+            for key, value in (source or {}).items():
+                if key not in merged and not key.startswith("__") and key not in ("checkpoint_id", "checkpoint_ns") \
+                        and isinstance(value, (str, int, float, bool)):
+                    merged[key] = value
+        return merged
+
+    def _compact(self, thread_id: str, checkpoint_ns: str):
+        stale = self._conn.execute(
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+            "ORDER BY checkpoint_id DESC LIMIT -1 OFFSET ?",
+            (thread_id, checkpoint_ns, self.max_history + 1)
+        ).fetchall()
+        if stale:
+            self._conn.executemany(
+                "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                [(thread_id, checkpoint_ns, checkpoint_id) for (checkpoint_id,) in stale]
+            )
+            self._conn.executemany(
+                "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                [(thread_id, checkpoint_ns, checkpoint_id) for (checkpoint_id,) in stale]
+            )
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = []
+        for index, (channel, value) in enumerate(writes):
+            idx = WRITES_IDX_MAP.get(channel, index)
+            rows.append((idx, channel, self.serde.dumps_typed(value)))
+
+        with self._lock:
+            for idx, channel, (value_type, value) in rows:
+                # Regular writes are idempotent per task; special writes (errors, interrupts) replace earlier ones
+                verb = "INSERT OR IGNORE" if idx >= 0 else "INSERT OR REPLACE"
+                self._conn.execute(
+                    f"{verb} INTO writes (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, "
+                    "value_type, value, task_path) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, value_type, value, task_path)
+                )
+            self._conn.commit()
+
+            hot = self._hot.get(thread_id)
+            latest = hot.latest.get(checkpoint_ns) if hot is not None else None
+            if latest is not None and latest[0] == checkpoint_id:
+                previous_size = hot.size
+                hot_writes = hot.writes[checkpoint_ns]
+                for idx, channel, value in rows:
+                    if idx >= 0 and (task_id, idx) in hot_writes:
+                        continue
+                    hot_writes[(task_id, idx)] = (task_id, channel, value, task_path)
+                self._hot_resize(thread_id, hot, previous_size)
+
+    def _delete_thread(self, thread_id: str):
+        self._hot_drop(thread_id)
+        for table in ("checkpoints", "writes", "threads"):
+            self._conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._delete_thread(thread_id)
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, hot_threads=len(self._hot), hot_bytes=self._hot_bytes)
+
+    def close(self):
+        with self._lock:
+            self._hot.clear()
+            self._hot_bytes = 0
+            self._conn.close()
+
+    # Async variants run the SQLite calls off the event loop
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.get_running_loop().run_in_executor(None, self.get_tuple, config)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+                    before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        return await asyncio.get_running_loop().run_in_executor(None, self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                          task_path: str = "") -> None:
+        return await asyncio.get_running_loop().run_in_executor(None, self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        return await asyncio.get_running_loop().run_in_executor(None, self.delete_thread, thread_id)
+
+
+_checkpointer = None
+_checkpointer_lock = threading.Lock()
+
+def get_checkpointer():
+    """
+    Return the checkpointer selected by the `checkpointer` section of `global_config`.
+
+    The SQLite backend is shared by every agent in the process so its memory cap is global;
+    the `memory` backend returns a fresh, unbounded MemorySaver per call.
+    """
+    global _checkpointer
+    config = global_config["checkpointer"]
+    if config["backend"] == 'memory':
+        from langgraph.checkpoint.memory import MemorySaver
+        return MemorySaver()
+    if config["backend"] != 'sqlite':
+        raise ValueError(f"Unknown checkpointer backend: {config['backend']}")
+    with _checkpointer_lock:
+        if _checkpointer is None:
+            thread_ttl = float(config["thread_ttl"])
+            _checkpointer = SQLiteCheckpointer(
+                path=os.path.expanduser(config["sqlite_path"]),
+                memory_cap_bytes=int(float(config["memory_cap_mb"]) * 1024 * 1024),
+                max_history=int(config["max_history"]),
+                thread_ttl=thread_ttl if thread_ttl > 0 else None,
+                purge_interval=float(config["purge_interval"])
+            )
+        return _checkpointer
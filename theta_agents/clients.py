@@ -0,0 +1,421 @@
+import asyncio
+import atexit
+import contextlib
+import functools
+import hashlib
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING
+from theta_agents.config.default_config import ENDPOINT_KEYS, global_config
+from theta_agents.metrics import get_metrics, httpx_event_hooks, instrument_session
+from theta_agents.scheduler import aadmitted, admitted, get_scheduler, scheduling_adapter_class, scheduling_transport
+
+# SDK imports are deferred to the factories below so importing this module stays cheap
+if TYPE_CHECKING:
+    import httpx
+    import requests
+    from gradio_client import Client as client_gradio
+    from openai import AsyncOpenAI, OpenAI
+    from web3 import AsyncWeb3, Web3
+
+logger = logging.getLogger(__name__)
+
+
+def _credentials_fingerprint(credentials) -> str:
+    """
+    Hash credentials so raw secrets are never kept in registry keys or logs.
+    """
+    if not credentials:
+        return ''
+    return hashlib.sha256(str(credentials).encode('utf-8')).hexdigest()[:16]
+
+
+class _PooledClient:
+    def __init__(self, client, closer, loop=None):
+        self.client = client
+        self.closer = closer
+        # The event loop an async client is bound to
+        self.loop = loop
+        self.last_used = time.monotonic()
+        # Calls currently using the client; a busy client is never closed
+        self.in_use = 0
+
+    def close(self):
+        try:
+            self.closer(self.client)
+        except Exception as e:
+            logger.error(f"Failed to close pooled client: {e}")
+
+
+class ClientRegistry:
+    """
+    Hands out long-lived, keep-alive clients keyed by (endpoint, endpoint type, credentials).
+
+    Clients are created on first use and shared by every tool call that targets
+    the same endpoint. Calls hold a client with `lease()` while they use it, and
+    clients are only closed once no lease is held: clients left unused for longer
+    than `idle_timeout` seconds are closed on the next lookup, clients of endpoints
+    removed from the configuration once their calls finish (`retire()`), and async
+    clients are dropped once their event loop is closed. `shutdown()` closes everything.
+    """
+
+    def __init__(self, pool_size: int = 10, idle_timeout: float = 300, request_timeout: float = 60,
+                 max_concurrency_per_endpoint: int = 64):
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.request_timeout = request_timeout
+        self.max_concurrency_per_endpoint = max_concurrency_per_endpoint
+        self._clients = {}
+        self._retired = []
+        self._by_client = {}
+        self._semaphores = {}
+        # Per-key locks held while a client is being created
+        self._creating = {}
+        self._lock = threading.RLock()
+        self._closed = False
+
+    def _get(self, endpoint, endpoint_type, credentials, factory, closer, loop=None):
+        key = (endpoint, endpoint_type, _credentials_fingerprint(credentials))
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Client registry has been shut down.")
+            self.evict_idle()
+            pooled = self._clients.get(key)
+            if pooled is not None:
+                pooled.last_used = time.monotonic()
+                return pooled.client
+            creating = self._creating.setdefault(key, threading.Lock())
+
+        # Factories may do network I/O (the gradio client fetches the Space's schema), so clients
+        # are built under a per-key lock and lookups for other endpoints are not held up
+        with creating:
+            with self._lock:
+                pooled = self._clients.get(key)
+                if pooled is not None:
+                    pooled.last_used = time.monotonic()
+                    return pooled.client
+            try:
+                logger.info(f"Creating {endpoint_type} client for {endpoint}")
+                pooled = _PooledClient(factory(), closer, loop)
+                with self._lock:
+                    if not self._closed:
+                        self._clients[key] = pooled
+                        self._by_client[id(pooled.client)] = pooled
+                        pooled.last_used = time.monotonic()
+                        return pooled.client
+                pooled.close()
+                raise RuntimeError("Client registry has been shut down.")
+            finally:
+                with self._lock:
+                    if self._creating.get(key) is creating:
+                        del self._creating[key]
+
+    @contextlib.contextmanager
+    def lease(self, client):
+        """
+        Mark a client from this registry as in use for the duration of the block, so it is
+        not closed under a running call. Clients from elsewhere are passed through.
+        """
+        with self._lock:
+            pooled = self._by_client.get(id(client))
+            if pooled is not None and pooled.client is client:
+                pooled.in_use += 1
+            else:
+                pooled = None
+        try:
+            yield client
+        finally:
+            if pooled is not None:
+                with self._lock:
+                    pooled.in_use -= 1
+                    pooled.last_used = time.monotonic()
+                if pooled.in_use == 0 and any(retired is pooled for _, retired in self._retired):
+                    self.close_drained()
+
+    def _close(self, pooled: _PooledClient):
+        with self._lock:
+            self._by_client.pop(id(pooled.client), None)
+        pooled.close()
+
+    def _new_session(self) -> 'requests.Session':
+        import requests
+        from requests.adapters import HTTPAdapter
+        session = requests.Session()
+        scheduler = get_scheduler()
+        if scheduler is not None:
+            # Every request waits for admission and honours the endpoint's Retry-After
+            adapter = scheduling_adapter_class()(scheduler, pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        else:
+            adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        metrics = get_metrics()
+        if metrics.enabled:
+            instrument_session(session, metrics)
+        return session
+
+    @staticmethod
+    def _event_hooks(is_async: bool = False) -> dict:
+        metrics = get_metrics()
+        return httpx_event_hooks(metrics, is_async) if metrics.enabled else {}
+
+    def _httpx_options(self, is_async: bool = False) -> dict:
+        """
+        Keyword arguments for a pooled httpx client, routed through the scheduler when it is enabled.
+        """
+        import httpx
+        limits = httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+        options = {"timeout": self.request_timeout, "event_hooks": self._event_hooks(is_async)}
+        scheduler = get_scheduler()
+        if scheduler is not None:
+            options["transport"] = scheduling_transport(scheduler, is_async, limits=limits)
+        else:
+            options["limits"] = limits
+        return options
+
+    def get_session(self, endpoint: str = '', credentials=None) -> 'requests.Session':
+        """
+        Get a keep-alive requests session whose connection pool holds `pool_size` connections per host.
+        """
+        return self._get(endpoint, 'http', credentials, self._new_session, lambda session: session.close())
+
+    def get_openai_client(self, endpoint: str, api_key: str = None) -> 'OpenAI':
+        """
+        Get an OpenAI-compatible client backed by a pooled httpx client.
+        """
+        def factory():
+            import httpx
+            from openai import OpenAI
+            http_client = httpx.Client(**self._httpx_options())
+            return OpenAI(api_key=api_key, base_url=endpoint, http_client=http_client)
+        return self._get(endpoint, 'openai', api_key, factory, lambda client: client.close())
+
+    def get_gradio_client(self, endpoint: str, api_key: str = None) -> 'client_gradio':
+        """
+        Get a gradio client. The Space's API schema is fetched once, when the client is created.
+        """
+        def factory():
+            from gradio_client import Client as client_gradio
+            # The token is positional: it is `hf_token` in older gradio_client releases and `token` in newer ones
+            if api_key:
+                return client_gradio(endpoint, api_key)
+            return client_gradio(endpoint)
+        return self._get(endpoint, 'gradio', api_key, factory, lambda client: None)
+
+    def get_web3(self, endpoint: str) -> 'Web3':
+        """
+        Get a Web3 instance whose HTTP provider reuses a pooled session.
+        """
+        session = {}
+
+        def factory():
+            from web3 import Web3
+            session['value'] = self._new_session()
+            return Web3(Web3.HTTPProvider(endpoint, session=session['value']))
+        return self._get(endpoint, 'web3', None, factory, lambda w3: session['value'].close())
+
+    def get_async_http_client(self, endpoint: str = '', credentials=None) -> 'httpx.AsyncClient':
+        """
+        Get a keep-alive httpx async client bound to the running event loop.
+        """
+        loop = asyncio.get_running_loop()
+
+        def factory():
+            import httpx
+            return httpx.AsyncClient(**self._httpx_options(is_async=True))
+        return self._get(endpoint, f'async-http@{id(loop)}', credentials, factory, _async_closer(loop), loop)
+
+    def get_async_openai_client(self, endpoint: str, api_key: str = None) -> 'AsyncOpenAI':
+        """
+        Get an async OpenAI-compatible client bound to the running event loop.
+        """
+        loop = asyncio.get_running_loop()
+
+        def factory():
+            import httpx
+            from openai import AsyncOpenAI
+            http_client = httpx.AsyncClient(**self._httpx_options(is_async=True))
+            return AsyncOpenAI(api_key=api_key, base_url=endpoint, http_client=http_client)
+        return self._get(endpoint, f'async-openai@{id(loop)}', api_key, factory, _async_closer(loop, 'close'), loop)
+
+    def get_async_web3(self, endpoint: str) -> 'AsyncWeb3':
+        """
+        Get an AsyncWeb3 instance bound to the running event loop.
+        """
+        loop = asyncio.get_running_loop()
+
+        def factory():
+            from web3 import AsyncWeb3
+            return AsyncWeb3(AsyncWeb3.AsyncHTTPProvider(endpoint))
+        return self._get(endpoint, f'async-web3@{id(loop)}', None, factory, _async_closer(loop, _close_async_web3), loop)
+
+    def predict_gradio(self, endpoint: str, api_key: str, *args, api_name: str = '/predict'):
+        """
+        Run a gradio `predict` once the scheduler admits it. gradio_client makes its own HTTP
+        requests, so admission happens here instead of in the transport.
+        """
+        with admitted(endpoint), self.lease(self.get_gradio_client(endpoint, api_key)) as client:
+            return client.predict(*args, api_name=api_name)
+
+    async def apredict_gradio(self, endpoint: str, api_key: str, *args, api_name: str = '/predict'):
+        """
+        Run a gradio `predict` without blocking the event loop. gradio_client has no async API,
+        so the call runs in the default executor under the endpoint's concurrency limit.
+        """
+        loop = asyncio.get_running_loop()
+        async with aadmitted(endpoint), self.endpoint_semaphore(endpoint):
+            client = await loop.run_in_executor(None, self.get_gradio_client, endpoint, api_key)
+            with self.lease(client):
+                return await loop.run_in_executor(None, functools.partial(client.predict, *args, api_name=api_name))
+
+    def endpoint_semaphore(self, endpoint: str) -> asyncio.Semaphore:
+        """
+        Get the semaphore that caps concurrent async calls to `endpoint` on the running event loop.
+        """
+        key = (asyncio.get_running_loop(), endpoint)
+        with self._lock:
+            for closed in [other for other in self._semaphores if other[0].is_closed()]:
+                del self._semaphores[closed]
+            semaphore = self._semaphores.get(key)
+            if semaphore is None:
+                semaphore = asyncio.Semaphore(self.max_concurrency_per_endpoint)
+                self._semaphores[key] = semaphore
+            return semaphore
+
+    def retire(self, endpoints, drain_timeout: float):
+        """
+        Stop handing out clients for `endpoints` and close each one once no call is using it,
+        and no sooner than `drain_timeout` seconds from now, so calls that looked a client up
+        just before the change can still lease it.
+        """
+        endpoints = set(endpoints)
+        deadline = time.monotonic() + drain_timeout
+        with self._lock:
+            keys = [key for key in self._clients if key[0] in endpoints]
+            for key in keys:
+                logger.info(f"Draining {key[1]} client for {key[0]}, removed from the configuration")
+                self._retired.append((deadline, self._clients.pop(key)))
+        if keys:
+            timer = threading.Timer(drain_timeout, self.close_drained)
+            timer.daemon = True
+            timer.start()
+
+    def close_drained(self):
+        """
+        Close retired clients whose drain period is over and that no call is using.
+        """
+        now = time.monotonic()
+        with self._lock:
+            drained = [pooled for deadline, pooled in self._retired if deadline <= now and pooled.in_use == 0]
+            self._retired = [(deadline, pooled) for deadline, pooled in self._retired
+                             if not any(pooled is other for other in drained)]
+        for pooled in drained:
+            self._close(pooled)
+
+    def evict_idle(self):
+        """
+        Close clients that no call is using and that have not been used for `idle_timeout`
+        seconds, and drop async clients whose event loop is closed.
+        """
+        now = time.monotonic()
+        with self._lock:
+            for key, pooled in list(self._clients.items()):
+                if pooled.loop is not None and pooled.loop.is_closed():
+                    logger.info(f"Dropping {key[1]} client for {key[0]}, its event loop is closed")
+                elif self.idle_timeout and pooled.in_use == 0 and now - pooled.last_used > self.idle_timeout:
+                    logger.info(f"Evicting idle {key[1]} client for {key[0]}")
+                else:
+                    continue
+                self._close(self._clients.pop(key))
+
+    def shutdown(self):
+        """
+        Close every pooled client. The registry cannot be used afterwards.
+        """
+        with self._lock:
+            for pooled in list(self._clients.values()) + [pooled for _, pooled in self._retired]:
+                pooled.close()
+            self._clients.clear()
+            self._retired.clear()
+            self._by_client.clear()
+            self._semaphores.clear()
+            self._closed = True
+
+
+def _async_closer(loop, method='aclose'):
+    """
+    Build a closer that schedules an async client's close coroutine on the loop that owns it.
+    `method` is the name of the client's close method, or a coroutine function taking the client.
+    """
+    def closer(client):
+        if loop.is_closed():
+            return
+        coroutine = method(client) if callable(method) else getattr(client, method)()
+        if loop.is_running():
+            asyncio.run_coroutine_threadsafe(coroutine, loop)
+        else:
+            loop.run_until_complete(coroutine)
+    return closer
+
+
+async def _close_async_web3(w3):
+    # AsyncHTTPProvider keeps its aiohttp session in web3's session cache, keyed by thread and endpoint;
+    # running on the client's loop, this looks up the same session its calls used
+    session = await w3.provider.cache_async_session(None)
+    await session.close()
+
+
+def configured_endpoints(config) -> set:
+    """
+    Every upstream URL named in a configuration.
+    """
+    endpoints = set()
+    for key, value in config.items():
+        if isinstance(value, dict):
+            endpoints |= configured_endpoints(value)
+        elif key in ENDPOINT_KEYS and value:
+            values = value.split(',') if isinstance(value, str) else value if isinstance(value, list) else [value]
+            endpoints.update(str(endpoint).strip() for endpoint in values if str(endpoint).strip())
+    return endpoints
+
+def _drain_removed_endpoints(old, new, changed):
+    removed = configured_endpoints(old) - configured_endpoints(new)
+    registry = _registry
+    if removed and registry is not None:
+        registry.retire(removed, float(new["config_reload"]["drain_timeout"]))
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_client_registry() -> ClientRegistry:
+    """
+    Return the process-wide client registry, creating it from `global_config` on first use.
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            pool_config = global_config["client_pool"]
+            _registry = ClientRegistry(
+                pool_size=int(pool_config["pool_size"]),
+                idle_timeout=float(pool_config["idle_timeout"]),
+                request_timeout=float(pool_config["request_timeout"]),
+                max_concurrency_per_endpoint=int(pool_config["max_concurrency_per_endpoint"])
+            )
+            atexit.register(_registry.shutdown)
+        return _registry
+
+global_config.subscribe(_drain_removed_endpoints)
+
+
+def shutdown_clients():
+    """
+    Close all pooled clients held by the process-wide registry.
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is not None:
+            _registry.shutdown()
+            _registry = None
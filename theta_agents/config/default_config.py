@@ -1,25 +1,131 @@
+import contextvars
+import copy
+import json
+import logging
 import os
-import yaml
-from dotenv import load_dotenv
+import threading
+import time
+from collections.abc import Mapping
 
-# Load environment variables from .env file
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-# Load YAML configuration
-config_file_path = os.getenv('CONFIG_FILE', 'config.yaml')
-with open(config_file_path, 'r') as file:
-    yaml_config = yaml.safe_load(file)
+_yaml_config = None
+_yaml_config_lock = threading.Lock()
+# Variables set from .env rather than the real environment, so a reload may change or remove them
+_dotenv_keys = set()
+
+def _dotenv_path() -> str:
+    from dotenv import find_dotenv
+    return find_dotenv(usecwd=True) or find_dotenv()
+
+def _config_file_path() -> str:
+    return os.getenv('CONFIG_FILE', 'config.yaml')
+
+def _load_dotenv():
+    from dotenv import dotenv_values
+    path = _dotenv_path()
+    values = {key: value for key, value in (dotenv_values(path) if path else {}).items() if value is not None}
+    for key in _dotenv_keys - set(values):
+        os.environ.pop(key, None)
+    for key, value in values.items():
+        # Like load_dotenv(), variables from the real environment win
+        if key not in os.environ or key in _dotenv_keys:
+            os.environ[key] = value
+            _dotenv_keys.add(key)
+
+def _read_yaml() -> dict:
+    import yaml
+    with open(_config_file_path(), 'r') as file:
+        return yaml.safe_load(file) or {}
+
+def get_yaml_config():
+    """ Load .env and the YAML configuration on first use """
+    global _yaml_config
+    with _yaml_config_lock:
+        if _yaml_config is None:
+            # Load environment variables from .env file
+            _load_dotenv()
+            _yaml_config = _read_yaml()
+        return _yaml_config
+
+
+class ConfigError(ValueError):
+    """
+    The configuration has invalid values; `errors` lists every one of them.
+    """
+
+    def __init__(self, errors):
+        super().__init__("Invalid configuration: " + '; '.join(errors))
+        self.errors = list(errors)
+
+
+_TRUE = ('1', 'true', 'yes', 'on')
+_FALSE = ('0', 'false', 'no', 'off', '')
+# Problems found while building a configuration, reported together once it is built
+_build_errors = contextvars.ContextVar('theta_agents_config_errors', default=None)
+
+def config_bool(value) -> bool:
+    """
+    Read a boolean option. Built configurations already hold booleans; strings set on
+    `global_config` by hand (e.g. "false") are read the way the environment is.
+    """
+    if isinstance(value, str):
+        return value.strip().lower() in _TRUE
+    return bool(value)
+
+def _coerce(value, default):
+    """
+    Convert `value` (often a string from the environment) to the type of `default`.
+    """
+    if default is None or value is None or isinstance(default, str):
+        return value
+    if isinstance(default, bool):
+        if isinstance(value, bool):
+            return value
+        if str(value).strip().lower() in _TRUE + _FALSE:
+            return str(value).strip().lower() in _TRUE
+        raise ValueError(f"expected a boolean, got {value!r}")
+    if isinstance(default, (int, float)):
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return value
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"expected a number, got {value!r}")
+        return int(number) if number.is_integer() else number
+    if isinstance(value, type(default)):
+        return value
+    if isinstance(value, str):
+        try:
+            parsed = json.loads(value)
+        except ValueError:
+            parsed = None
+        if isinstance(parsed, type(default)):
+            return parsed
+        if isinstance(default, list):
+            return [item.strip() for item in value.split(',') if item.strip()]
+    raise ValueError(f"expected a {type(default).__name__}, got {value!r}")
 
 def get_config_value(env_var, yaml_path, default=None):
     """ Helper function to get configuration values """
     value = os.getenv(env_var)
+    source = env_var
     if value is None:
         keys = yaml_path.split('.')
-        config_value = yaml_config
+        config_value = get_yaml_config()
         for key in keys:
             config_value = config_value.get(key, {})
-        value = config_value if config_value else default
-    return value
+        # Explicit false/0 values in the YAML are kept; only missing or empty keys fall back
+        value = default if config_value in (None, {}, '') else config_value
+        source = yaml_path
+    try:
+        return _coerce(value, default)
+    except ValueError as e:
+        errors = _build_errors.get()
+        if errors is None:
+            raise ConfigError([f"{source}: {e}"])
+        errors.append(f"{source}: {e}")
+        return default
 
 def get_env_variable_from_yaml(yaml_config, yaml_path, default=None):
     """ Get environment variable value based on the variable name defined in YAML """
@@ -32,58 +138,536 @@ def get_env_variable_from_yaml(yaml_config, yaml_path, default=None):
         return os.getenv(env_var_name, default)
     return default
 
-# Global configuration combining YAML and environment variables
-global_config = {
-    "llm_endpoint": get_config_value('LLM_ENDPOINT', 'llm_endpoint', 'https://api.openai.com/v1'),
-    "llm_model_name": get_config_value('LLM_MODEL_NAME', 'llm_model_name', 'gpt-4o-mini'),
-    "llm_api_key": get_env_variable_from_yaml(yaml_config, 'llm_api_key_env'),
-    "capabilities": {
-        "image_tools": {
-            "create_image_from_prompt": {
-                "edgecloud_endpoint": get_config_value('IMAGE_ENDPOINT', 'capabilities.image_tools.create_image_from_prompt.edgecloud_endpoint'),
-                "edgecloud_endpoint_type": get_config_value('IMAGE_ENDPOINT_TYPE', 'capabilities.image_tools.create_image_from_prompt.edgecloud_endpoint_type'),
-                "model_name": get_config_value('IMAGE_MODEL_NAME', 'capabilities.image_tools.create_image_from_prompt.model_name'),
-                "api_key": get_env_variable_from_yaml(yaml_config, 'capabilities.image_tools.create_image_from_prompt.api_key_env')
-            }
+def build_global_config():
+    """ Build the configuration dict combining YAML and environment variables """
+    yaml_config = get_yaml_config()
+    return {
+        "llm_endpoint": get_config_value('LLM_ENDPOINT', 'llm_endpoint', 'https://api.openai.com/v1'),
+        "llm_model_name": get_config_value('LLM_MODEL_NAME', 'llm_model_name', 'gpt-4o-mini'),
+        "llm_api_key": get_env_variable_from_yaml(yaml_config, 'llm_api_key_env'),
+        "llm_timeout": get_config_value('LLM_TIMEOUT', 'llm_timeout', 120),
+        "llm_max_retries": get_config_value('LLM_MAX_RETRIES', 'llm_max_retries', 2),
+        "config_reload": {
+            "interval": get_config_value('CONFIG_RELOAD_INTERVAL', 'config_reload.interval', 0),
+            "drain_timeout": get_config_value('CONFIG_RELOAD_DRAIN_TIMEOUT', 'config_reload.drain_timeout', 120)
         },
-        "video_tools": {
-            "create_video_from_image": {
-                "edgecloud_endpoint": get_config_value('VIDEO_ENDPOINT', 'capabilities.video_tools.create_video_from_image.edgecloud_endpoint'),
-                "edgecloud_endpoint_type": get_config_value('VIDEO_ENDPOINT_TYPE', 'capabilities.video_tools.create_video_from_image.edgecloud_endpoint_type'),
-                "model_name": get_config_value('VIDEO_MODEL_NAME', 'capabilities.video_tools.create_video_from_image.model_name'),
-                "api_key": get_env_variable_from_yaml(yaml_config, 'capabilities.video_tools.create_video_from_image.api_key_env', None)
-            }
+        "client_pool": {
+            "pool_size": get_config_value('CLIENT_POOL_SIZE', 'client_pool.pool_size', 10),
+            "idle_timeout": get_config_value('CLIENT_POOL_IDLE_TIMEOUT', 'client_pool.idle_timeout', 300),
+            "request_timeout": get_config_value('CLIENT_POOL_REQUEST_TIMEOUT', 'client_pool.request_timeout', 60),
+            "max_concurrency_per_endpoint": get_config_value('CLIENT_POOL_MAX_CONCURRENCY', 'client_pool.max_concurrency_per_endpoint', 64)
         },
-        "smart_contract_tools": {
-            "generate_smart_contract": {
-                "edgecloud_endpoint": get_config_value('SMART_CONTRACT_ENDPOINT', 'capabilities.smart_contract_tools.generate_smart_contract.edgecloud_endpoint'),
-                "edgecloud_endpoint_type": get_config_value('SMART_CONTRACT_ENDPOINT_TYPE', 'capabilities.smart_contract_tools.generate_smart_contract.edgecloud_endpoint_type'),
-                "model_name": get_config_value('SMART_CONTRACT_MODEL_NAME', 'capabilities.smart_contract_tools.generate_smart_contract.model_name'),
-                "api_key": get_env_variable_from_yaml(yaml_config, 'capabilities.smart_contract_tools.generate_smart_contract.api_key_env')
-            },
-            "analyze_smart_contract": {
-                "edgecloud_endpoint": get_config_value('SMART_CONTRACT_ENDPOINT', 'capabilities.smart_contract_tools.analyze_smart_contract.edgecloud_endpoint'),
-                "edgecloud_endpoint_type": get_config_value('SMART_CONTRACT_ENDPOINT_TYPE', 'capabilities.smart_contract_tools.analyze_smart_contract.edgecloud_endpoint_type'),
-                "model_name": get_config_value('SMART_CONTRACT_MODEL_NAME', 'capabilities.smart_contract_tools.analyze_smart_contract.model_name'),
-                "api_key": get_env_variable_from_yaml(yaml_config, 'capabilities.smart_contract_tools.analyze_smart_contract.api_key_env')
-            },
-            "deploy_smart_contract": {
-                "theta_wallet_public_address": get_config_value('THETA_WALLET_PUBLIC_ADDRESS', 'capabilities.smart_contract_tools.deploy_smart_contract.theta_wallet_public_address'),     
-                "theta_wallet_private_key": get_env_variable_from_yaml(yaml_config, 'capabilities.smart_contract_tools.deploy_smart_contract.theta_wallet_private_key_env')
-            }
+        "result_cache": {
+            "enabled": get_config_value('RESULT_CACHE_ENABLED', 'result_cache.enabled', False),
+            "max_entries": get_config_value('RESULT_CACHE_MAX_ENTRIES', 'result_cache.max_entries', 1024),
+            "default_ttl": get_config_value('RESULT_CACHE_DEFAULT_TTL', 'result_cache.default_ttl', 3600),
+            "ttls": get_config_value('RESULT_CACHE_TTLS', 'result_cache.ttls', {}),
+            "sqlite_path": get_config_value('RESULT_CACHE_SQLITE_PATH', 'result_cache.sqlite_path'),
+            "sqlite_max_entries": get_config_value('RESULT_CACHE_SQLITE_MAX_ENTRIES', 'result_cache.sqlite_max_entries', 100000)
         },
-        "theta_edgestore_tools": {
-            "upload_to_edgestore": {
-                "w3_provider_endpoint": get_config_value('W3_PROVIDER_ENDPOINT', 'capabilities.theta_edgestore_tools.upload_to_edgestore.w3_provider_endpoint'),
-                "address": get_config_value('THETA_WALLET_PUBLIC_ADDRESS', 'capabilities.theta_edgestore_tools.upload_to_edgestore.address'),
-                "theta_wallet_private_key": get_env_variable_from_yaml(yaml_config, 'capabilities.theta_edgestore_tools.upload_to_edgestore.theta_wallet_private_key_env')
-            }
+        "uploads": {
+            "chunk_size_mb": get_config_value('UPLOAD_CHUNK_SIZE_MB', 'uploads.chunk_size_mb', 8),
+            "max_workers": get_config_value('UPLOAD_MAX_WORKERS', 'uploads.max_workers', 4),
+            "parallel_chunks": get_config_value('UPLOAD_PARALLEL_CHUNKS', 'uploads.parallel_chunks', False),
+            "max_retries": get_config_value('UPLOAD_MAX_RETRIES', 'uploads.max_retries', 5),
+            "backoff": get_config_value('UPLOAD_BACKOFF', 'uploads.backoff', 0.5),
+            "journal_dir": get_config_value('UPLOAD_JOURNAL_DIR', 'uploads.journal_dir', '~/.cache/theta_agents/uploads'),
+            "video_api_chunked": get_config_value('VIDEO_API_CHUNKED_UPLOAD', 'uploads.video_api_chunked', False),
+            "url_spool_mb": get_config_value('UPLOAD_URL_SPOOL_MB', 'uploads.url_spool_mb', 64)
+        },
+        "solidity_compiler": {
+            "cache_dir": get_config_value('SOLC_CACHE_DIR', 'solidity_compiler.cache_dir', '~/.cache/theta_agents/solc'),
+            "cache_max_mb": get_config_value('SOLC_CACHE_MAX_MB', 'solidity_compiler.cache_max_mb', 256)
+        },
+        "checkpointer": {
+            "backend": get_config_value('CHECKPOINTER_BACKEND', 'checkpointer.backend', 'sqlite'),
+            "sqlite_path": get_config_value('CHECKPOINTER_SQLITE_PATH', 'checkpointer.sqlite_path', '~/.cache/theta_agents/checkpoints.db'),
+            "memory_cap_mb": get_config_value('CHECKPOINTER_MEMORY_CAP_MB', 'checkpointer.memory_cap_mb', 64),
+            "max_history": get_config_value('CHECKPOINTER_MAX_HISTORY', 'checkpointer.max_history', 10),
+            "thread_ttl": get_config_value('CHECKPOINTER_THREAD_TTL', 'checkpointer.thread_ttl', 2592000),
+            "purge_interval": get_config_value('CHECKPOINTER_PURGE_INTERVAL', 'checkpointer.purge_interval', 300)
+        },
+        "context_window": {
+            "enabled": get_config_value('CONTEXT_WINDOW_ENABLED', 'context_window.enabled', False),
+            "strategy": get_config_value('CONTEXT_WINDOW_STRATEGY', 'context_window.strategy', 'trim'),
+            "default_budget": get_config_value('CONTEXT_DEFAULT_BUDGET', 'context_window.default_budget', 16000),
+            "model_budgets": get_config_value('CONTEXT_MODEL_BUDGETS', 'context_window.model_budgets', {}),
+            "reserve_tokens": get_config_value('CONTEXT_RESERVE_TOKENS', 'context_window.reserve_tokens', 1024),
+            "summary_max_tokens": get_config_value('CONTEXT_SUMMARY_MAX_TOKENS', 'context_window.summary_max_tokens', 512)
+        },
+        "metrics": {
+            "enabled": get_config_value('METRICS_ENABLED', 'metrics.enabled', False),
+            "trace_path": get_config_value('METRICS_TRACE_PATH', 'metrics.trace_path'),
+            "prometheus_port": get_config_value('METRICS_PROMETHEUS_PORT', 'metrics.prometheus_port', 0)
+        },
+        "routing": {
+            "ewma_alpha": get_config_value('ROUTING_EWMA_ALPHA', 'routing.ewma_alpha', 0.3),
+            "failure_threshold": get_config_value('ROUTING_FAILURE_THRESHOLD', 'routing.failure_threshold', 3),
+            "cooldown": get_config_value('ROUTING_COOLDOWN', 'routing.cooldown', 30),
+            "health_check_interval": get_config_value('ROUTING_HEALTH_CHECK_INTERVAL', 'routing.health_check_interval', 0),
+            "hedged_tools": get_config_value('ROUTING_HEDGED_TOOLS', 'routing.hedged_tools', []),
+            "hedge_delay": get_config_value('ROUTING_HEDGE_DELAY', 'routing.hedge_delay', 0)
+        },
+        "scheduler": {
+            "enabled": get_config_value('SCHEDULER_ENABLED', 'scheduler.enabled', False),
+            "requests_per_second": get_config_value('SCHEDULER_REQUESTS_PER_SECOND', 'scheduler.requests_per_second', 0),
+            "burst": get_config_value('SCHEDULER_BURST', 'scheduler.burst', 0),
+            "tokens_per_minute": get_config_value('SCHEDULER_TOKENS_PER_MINUTE', 'scheduler.tokens_per_minute', 0),
+            "endpoints": get_config_value('SCHEDULER_ENDPOINTS', 'scheduler.endpoints', {}),
+            "max_queue": get_config_value('SCHEDULER_MAX_QUEUE', 'scheduler.max_queue', 64),
+            "max_wait": get_config_value('SCHEDULER_MAX_WAIT', 'scheduler.max_wait', {"interactive": 30, "default": 120, "bulk": 600}),
+            "max_retries": get_config_value('SCHEDULER_MAX_RETRIES', 'scheduler.max_retries', 2),
+            "default_retry_after": get_config_value('SCHEDULER_DEFAULT_RETRY_AFTER', 'scheduler.default_retry_after', 1),
+            "max_retry_after": get_config_value('SCHEDULER_MAX_RETRY_AFTER', 'scheduler.max_retry_after', 60)
+        },
+        "semantic_cache": {
+            "enabled": get_config_value('SEMANTIC_CACHE_ENABLED', 'semantic_cache.enabled', False),
+            "threshold": get_config_value('SEMANTIC_CACHE_THRESHOLD', 'semantic_cache.threshold'),
+            "max_entries": get_config_value('SEMANTIC_CACHE_MAX_ENTRIES', 'semantic_cache.max_entries', 4096),
+            "ttl": get_config_value('SEMANTIC_CACHE_TTL', 'semantic_cache.ttl', 86400),
+            "first_turn_only": get_config_value('SEMANTIC_CACHE_FIRST_TURN_ONLY', 'semantic_cache.first_turn_only', True),
+            "path": get_config_value('SEMANTIC_CACHE_PATH', 'semantic_cache.path'),
+            "save_interval": get_config_value('SEMANTIC_CACHE_SAVE_INTERVAL', 'semantic_cache.save_interval', 60),
+            "embedding": get_config_value('SEMANTIC_CACHE_EMBEDDING', 'semantic_cache.embedding', 'hashing'),
+            "embedding_dim": get_config_value('SEMANTIC_CACHE_EMBEDDING_DIM', 'semantic_cache.embedding_dim', 512),
+            "embedding_endpoint": get_config_value('SEMANTIC_CACHE_EMBEDDING_ENDPOINT', 'semantic_cache.embedding_endpoint'),
+            "embedding_model": get_config_value('SEMANTIC_CACHE_EMBEDDING_MODEL', 'semantic_cache.embedding_model', 'text-embedding-3-small')
         },
-        "theta_video_tools": {
-            "upload_video_to_theta": {
-                "service_account_id": get_config_value('SERVICE_ACCOUNT_ID', 'capabilities.theta_video_tools.upload_video_to_theta.service_account_id'),
-                "service_account_secret": get_env_variable_from_yaml(yaml_config, 'capabilities.theta_video_tools.upload_video_to_theta.service_account_secret_env')
+        "batching": {
+            "enabled": get_config_value('BATCHING_ENABLED', 'batching.enabled', False),
+            "max_wait": get_config_value('BATCHING_MAX_WAIT', 'batching.max_wait', 0.02),
+            "max_batch": get_config_value('BATCHING_MAX_BATCH', 'batching.max_batch', 8),
+            "max_workers": get_config_value('BATCHING_MAX_WORKERS', 'batching.max_workers', 16)
+        },
+        "pipeline": {
+            "queue_size": get_config_value('PIPELINE_QUEUE_SIZE', 'pipeline.queue_size', 2),
+            "default_workers": get_config_value('PIPELINE_DEFAULT_WORKERS', 'pipeline.default_workers', 1),
+            "stage_workers": get_config_value('PIPELINE_STAGE_WORKERS', 'pipeline.stage_workers', {})
+        },
+        "runtime": {
+            "max_graphs": get_config_value('RUNTIME_MAX_GRAPHS', 'runtime.max_graphs', 32),
+            "max_concurrent_turns": get_config_value('RUNTIME_MAX_CONCURRENT_TURNS', 'runtime.max_concurrent_turns', 0),
+            "max_turns_per_tenant": get_config_value('RUNTIME_MAX_TURNS_PER_TENANT', 'runtime.max_turns_per_tenant', 4)
+        },
+        "tool_execution": {
+            "max_parallel": get_config_value('TOOL_EXECUTION_MAX_PARALLEL', 'tool_execution.max_parallel', 8),
+            "default_max_concurrency": get_config_value('TOOL_EXECUTION_DEFAULT_MAX_CONCURRENCY', 'tool_execution.default_max_concurrency', 0),
+            "max_concurrency": get_config_value('TOOL_EXECUTION_MAX_CONCURRENCY', 'tool_execution.max_concurrency', {}),
+            "timeout": get_config_value('TOOL_EXECUTION_TIMEOUT', 'tool_execution.timeout', 0),
+            "timeouts": get_config_value('TOOL_EXECUTION_TIMEOUTS', 'tool_execution.timeouts', {})
+        },
+        "capabilities": {
+            "image_tools": {
+                "create_image_from_prompt": {
+                    "edgecloud_endpoint": get_config_value('IMAGE_ENDPOINT', 'capabilities.image_tools.create_image_from_prompt.edgecloud_endpoint'),
+                    "edgecloud_endpoint_type": get_config_value('IMAGE_ENDPOINT_TYPE', 'capabilities.image_tools.create_image_from_prompt.edgecloud_endpoint_type'),
+                    "model_name": get_config_value('IMAGE_MODEL_NAME', 'capabilities.image_tools.create_image_from_prompt.model_name'),
+                    "batch_api_name": get_config_value('IMAGE_BATCH_API_NAME', 'capabilities.image_tools.create_image_from_prompt.batch_api_name'),
+                    "api_key": get_env_variable_from_yaml(yaml_config, 'capabilities.image_tools.create_image_from_prompt.api_key_env')
+                }
+            },
+            "video_tools": {
+                "create_video_from_image": {
+                    "edgecloud_endpoint": get_config_value('VIDEO_ENDPOINT', 'capabilities.video_tools.create_video_from_image.edgecloud_endpoint'),
+                    "edgecloud_endpoint_type": get_config_value('VIDEO_ENDPOINT_TYPE', 'capabilities.video_tools.create_video_from_image.edgecloud_endpoint_type'),
+                    "model_name": get_config_value('VIDEO_MODEL_NAME', 'capabilities.video_tools.create_video_from_image.model_name'),
+                    "api_key": get_env_variable_from_yaml(yaml_config, 'capabilities.video_tools.create_video_from_image.api_key_env', None)
+                }
+            },
+            "smart_contract_tools": {
+                "generate_smart_contract": {
+                    "edgecloud_endpoint": get_config_value('SMART_CONTRACT_ENDPOINT', 'capabilities.smart_contract_tools.generate_smart_contract.edgecloud_endpoint'),
+                    "edgecloud_endpoint_type": get_config_value('SMART_CONTRACT_ENDPOINT_TYPE', 'capabilities.smart_contract_tools.generate_smart_contract.edgecloud_endpoint_type'),
+                    "model_name": get_config_value('SMART_CONTRACT_MODEL_NAME', 'capabilities.smart_contract_tools.generate_smart_contract.model_name'),
+                    "api_key": get_env_variable_from_yaml(yaml_config, 'capabilities.smart_contract_tools.generate_smart_contract.api_key_env')
+                },
+                "analyze_smart_contract": {
+                    "edgecloud_endpoint": get_config_value('SMART_CONTRACT_ENDPOINT', 'capabilities.smart_contract_tools.analyze_smart_contract.edgecloud_endpoint'),
+                    "edgecloud_endpoint_type": get_config_value('SMART_CONTRACT_ENDPOINT_TYPE', 'capabilities.smart_contract_tools.analyze_smart_contract.edgecloud_endpoint_type'),
+                    "model_name": get_config_value('SMART_CONTRACT_MODEL_NAME', 'capabilities.smart_contract_tools.analyze_smart_contract.model_name'),
+                    "api_key": get_env_variable_from_yaml(yaml_config, 'capabilities.smart_contract_tools.analyze_smart_contract.api_key_env'),
+                    "max_concurrency": get_config_value('ANALYZE_CONTRACT_MAX_CONCURRENCY', 'capabilities.smart_contract_tools.analyze_smart_contract.max_concurrency', 4),
+                    "token_budget": get_config_value('ANALYZE_CONTRACT_TOKEN_BUDGET', 'capabilities.smart_contract_tools.analyze_smart_contract.token_budget', 32000),
+                    "cache_max_entries": get_config_value('ANALYZE_CONTRACT_CACHE_MAX_ENTRIES', 'capabilities.smart_contract_tools.analyze_smart_contract.cache_max_entries', 4096),
+                    "cache_ttl": get_config_value('ANALYZE_CONTRACT_CACHE_TTL', 'capabilities.smart_contract_tools.analyze_smart_contract.cache_ttl', 604800),
+                    "cache_sqlite_path": get_config_value('ANALYZE_CONTRACT_CACHE_SQLITE_PATH', 'capabilities.smart_contract_tools.analyze_smart_contract.cache_sqlite_path')
+                },
+                "deploy_smart_contract": {
+                    "theta_wallet_public_address": get_config_value('THETA_WALLET_PUBLIC_ADDRESS', 'capabilities.smart_contract_tools.deploy_smart_contract.theta_wallet_public_address'),     
+                    "theta_wallet_private_key": get_env_variable_from_yaml(yaml_config, 'capabilities.smart_contract_tools.deploy_smart_contract.theta_wallet_private_key_env'),
+                    "rpc_url": get_config_value('THETA_RPC_URL', 'capabilities.smart_contract_tools.deploy_smart_contract.rpc_url', 'https://eth-rpc-api-testnet.thetatoken.org/rpc'),
+                    "chain_id": get_config_value('THETA_CHAIN_ID', 'capabilities.smart_contract_tools.deploy_smart_contract.chain_id', 365),
+                    "gas_multiplier": get_config_value('DEPLOY_GAS_MULTIPLIER', 'capabilities.smart_contract_tools.deploy_smart_contract.gas_multiplier', 1.2),
+                    "min_gas_price": get_config_value('DEPLOY_MIN_GAS_PRICE', 'capabilities.smart_contract_tools.deploy_smart_contract.min_gas_price', 4000000000000),
+                    "receipt_poll_interval": get_config_value('DEPLOY_RECEIPT_POLL_INTERVAL', 'capabilities.smart_contract_tools.deploy_smart_contract.receipt_poll_interval', 1),
+                    "receipt_timeout": get_config_value('DEPLOY_RECEIPT_TIMEOUT', 'capabilities.smart_contract_tools.deploy_smart_contract.receipt_timeout', 300)
+                }
+            },
+            "theta_edgestore_tools": {
+                "upload_to_edgestore": {
+                    "api_url": get_config_value('EDGESTORE_API_URL', 'capabilities.theta_edgestore_tools.upload_to_edgestore.api_url', 'https://api.thetaedgestore.com/api/v2/data'),
+                    "w3_provider_endpoint": get_config_value('W3_PROVIDER_ENDPOINT', 'capabilities.theta_edgestore_tools.upload_to_edgestore.w3_provider_endpoint'),
+                    "address": get_config_value('THETA_WALLET_PUBLIC_ADDRESS', 'capabilities.theta_edgestore_tools.upload_to_edgestore.address'),
+                    "theta_wallet_private_key": get_env_variable_from_yaml(yaml_config, 'capabilities.theta_edgestore_tools.upload_to_edgestore.theta_wallet_private_key_env'),
+                    "auth_token_ttl": get_config_value('EDGESTORE_AUTH_TOKEN_TTL', 'capabilities.theta_edgestore_tools.upload_to_edgestore.auth_token_ttl', 600),
+                    "bulk_max_workers": get_config_value('EDGESTORE_BULK_MAX_WORKERS', 'capabilities.theta_edgestore_tools.upload_to_edgestore.bulk_max_workers', 4),
+                    "manifest_path": get_config_value('EDGESTORE_MANIFEST_PATH', 'capabilities.theta_edgestore_tools.upload_to_edgestore.manifest_path', '~/.cache/theta_agents/edgestore_manifest.json')
+                }
+            },
+            "theta_video_tools": {
+                "upload_video_to_theta": {
+                    "api_url": get_config_value('VIDEO_API_URL', 'capabilities.theta_video_tools.upload_video_to_theta.api_url', 'https://api.thetavideoapi.com'),
+                    "service_account_id": get_config_value('SERVICE_ACCOUNT_ID', 'capabilities.theta_video_tools.upload_video_to_theta.service_account_id'),
+                    "service_account_secret": get_env_variable_from_yaml(yaml_config, 'capabilities.theta_video_tools.upload_video_to_theta.service_account_secret_env'),
+                    "job_db_path": get_config_value('VIDEO_JOB_DB_PATH', 'capabilities.theta_video_tools.upload_video_to_theta.job_db_path', '~/.cache/theta_agents/transcode_jobs.db'),
+                    "poll_initial_interval": get_config_value('VIDEO_POLL_INITIAL_INTERVAL', 'capabilities.theta_video_tools.upload_video_to_theta.poll_initial_interval', 2),
+                    "poll_max_interval": get_config_value('VIDEO_POLL_MAX_INTERVAL', 'capabilities.theta_video_tools.upload_video_to_theta.poll_max_interval', 60),
+                    "transcode_wait_timeout": get_config_value('VIDEO_TRANSCODE_WAIT_TIMEOUT', 'capabilities.theta_video_tools.upload_video_to_theta.transcode_wait_timeout', 30)
+                }
             }
         }
     }
+
+
+# Allowed values of string options; `*` matches any key at that level
+_CHOICES = {
+    "checkpointer.backend": ('sqlite', 'memory'),
+    "context_window.strategy": ('trim', 'summarize'),
+    "semantic_cache.embedding": ('hashing', 'openai'),
+    "capabilities.*.*.edgecloud_endpoint_type": ('openai', 'gradio', None)
+}
+_POSITIVE = (lambda value: value > 0, "must be greater than 0")
+_NON_NEGATIVE = (lambda value: value >= 0, "must not be negative (0 disables it)")
+_FRACTION = (lambda value: 0 <= value <= 1, "must be between 0 and 1")
+_PORT = (lambda value: 0 <= value <= 65535, "must be a port number (0 disables it)")
+_ANALYZE = "capabilities.smart_contract_tools.analyze_smart_contract."
+_DEPLOY = "capabilities.smart_contract_tools.deploy_smart_contract."
+_VIDEO = "capabilities.theta_video_tools.upload_video_to_theta."
+# Range of numeric options; `*` matches any key at that level
+_RANGES = {
+    "llm_timeout": _POSITIVE,
+    "llm_max_retries": _NON_NEGATIVE,
+    "config_reload.interval": _NON_NEGATIVE,
+    "config_reload.drain_timeout": _NON_NEGATIVE,
+    "client_pool.pool_size": _POSITIVE,
+    "client_pool.idle_timeout": _NON_NEGATIVE,
+    "client_pool.request_timeout": _POSITIVE,
+    "client_pool.max_concurrency_per_endpoint": _POSITIVE,
+    "result_cache.max_entries": _POSITIVE,
+    "result_cache.default_ttl": _NON_NEGATIVE,
+    "result_cache.ttls.*": _NON_NEGATIVE,
+    "result_cache.sqlite_max_entries": _POSITIVE,
+    "uploads.chunk_size_mb": _POSITIVE,
+    "uploads.max_workers": _POSITIVE,
+    "uploads.max_retries": _NON_NEGATIVE,
+    "uploads.backoff": _NON_NEGATIVE,
+    "uploads.url_spool_mb": _NON_NEGATIVE,
+    "solidity_compiler.cache_max_mb": _POSITIVE,
+    "checkpointer.memory_cap_mb": _POSITIVE,
+    "checkpointer.max_history": _NON_NEGATIVE,
+    "checkpointer.thread_ttl": _NON_NEGATIVE,
+    "checkpointer.purge_interval": _POSITIVE,
+    "context_window.default_budget": _POSITIVE,
+    "context_window.model_budgets.*": _POSITIVE,
+    "context_window.reserve_tokens": _NON_NEGATIVE,
+    "context_window.summary_max_tokens": _POSITIVE,
+    "metrics.prometheus_port": _PORT,
+    "routing.ewma_alpha": _FRACTION,
+    "routing.failure_threshold": _POSITIVE,
+    "routing.cooldown": _NON_NEGATIVE,
+    "routing.health_check_interval": _NON_NEGATIVE,
+    "routing.hedge_delay": _NON_NEGATIVE,
+    "scheduler.requests_per_second": _NON_NEGATIVE,
+    "scheduler.burst": _NON_NEGATIVE,
+    "scheduler.tokens_per_minute": _NON_NEGATIVE,
+    "scheduler.endpoints.*.*": _NON_NEGATIVE,
+    "scheduler.max_queue": _POSITIVE,
+    "scheduler.max_wait.*": _NON_NEGATIVE,
+    "scheduler.max_retries": _NON_NEGATIVE,
+    "scheduler.default_retry_after": _NON_NEGATIVE,
+    "scheduler.max_retry_after": _NON_NEGATIVE,
+    "semantic_cache.threshold": _FRACTION,
+    "semantic_cache.max_entries": _POSITIVE,
+    "semantic_cache.ttl": _NON_NEGATIVE,
+    "semantic_cache.save_interval": _POSITIVE,
+    "semantic_cache.embedding_dim": _POSITIVE,
+    "batching.max_wait": _NON_NEGATIVE,
+    "batching.max_batch": _POSITIVE,
+    "batching.max_workers": _POSITIVE,
+    "pipeline.queue_size": _POSITIVE,
+    "pipeline.default_workers": _POSITIVE,
+    "pipeline.stage_workers.*": _POSITIVE,
+    "runtime.max_graphs": _POSITIVE,
+    "runtime.max_concurrent_turns": _NON_NEGATIVE,
+    "runtime.max_turns_per_tenant": _NON_NEGATIVE,
+    "tool_execution.max_parallel": _NON_NEGATIVE,
+    "tool_execution.default_max_concurrency": _NON_NEGATIVE,
+    "tool_execution.max_concurrency.*": _NON_NEGATIVE,
+    "tool_execution.timeout": _NON_NEGATIVE,
+    "tool_execution.timeouts.*": _NON_NEGATIVE,
+    _ANALYZE + "max_concurrency": _POSITIVE,
+    _ANALYZE + "token_budget": _NON_NEGATIVE,
+    _ANALYZE + "cache_max_entries": _POSITIVE,
+    _ANALYZE + "cache_ttl": _NON_NEGATIVE,
+    _DEPLOY + "chain_id": _POSITIVE,
+    _DEPLOY + "gas_multiplier": _POSITIVE,
+    _DEPLOY + "min_gas_price": _NON_NEGATIVE,
+    _DEPLOY + "receipt_poll_interval": _POSITIVE,
+    _DEPLOY + "receipt_timeout": _POSITIVE,
+    "capabilities.theta_edgestore_tools.upload_to_edgestore.auth_token_ttl": _NON_NEGATIVE,
+    "capabilities.theta_edgestore_tools.upload_to_edgestore.bulk_max_workers": _POSITIVE,
+    _VIDEO + "poll_initial_interval": _POSITIVE,
+    _VIDEO + "poll_max_interval": _POSITIVE,
+    _VIDEO + "transcode_wait_timeout": _NON_NEGATIVE
 }
+# Config keys whose values are upstream endpoints (a string, a comma-separated string or a list of equivalent ones)
+ENDPOINT_KEYS = ('llm_endpoint', 'edgecloud_endpoint', 'embedding_endpoint', 'api_url', 'rpc_url', 'w3_provider_endpoint')
+# Endpoints every configuration needs; tools' endpoints are required once their endpoint type is set
+_REQUIRED = ('llm_endpoint', 'llm_model_name', _DEPLOY + "rpc_url", _VIDEO + "api_url",
+             "capabilities.theta_edgestore_tools.upload_to_edgestore.api_url")
+# Sections read when process-wide objects are created; changes apply after a restart
+RESTART_SECTIONS = ('client_pool', 'checkpointer', 'metrics', 'result_cache', 'semantic_cache', 'scheduler',
+                    'solidity_compiler', 'uploads')
+
+def _matching(data, keys):
+    if not keys:
+        yield data
+        return
+    if not isinstance(data, dict):
+        return
+    for key in (data if keys[0] == '*' else [keys[0]]):
+        if key in data:
+            yield from _matching(data[key], keys[1:])
+
+def validate_config(data: dict) -> list:
+    """
+    Return the problems with a built configuration's values.
+    """
+    errors = []
+    for path, allowed in _CHOICES.items():
+        for value in _matching(data, path.split('.')):
+            if value not in allowed:
+                errors.append(f"{path}: {value!r} is not one of {', '.join(repr(choice) for choice in allowed if choice)}")
+    for path, (check, requirement) in _RANGES.items():
+        for value in _matching(data, path.split('.')):
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and not check(value):
+                errors.append(f"{path}: {value!r} {requirement}")
+    for path in _REQUIRED:
+        if not next(_matching(data, path.split('.')), None):
+            errors.append(f"{path}: is required")
+    for tool_path, tool in _tool_configs(data):
+        if tool.get("edgecloud_endpoint_type") and not tool.get("edgecloud_endpoint"):
+            errors.append(f"{tool_path}.edgecloud_endpoint: is required with edgecloud_endpoint_type {tool['edgecloud_endpoint_type']!r}")
+    return errors
+
+def _tool_configs(data):
+    for group, tools in (data.get("capabilities") or {}).items():
+        for name, tool in (tools or {}).items():
+            if isinstance(tool, dict):
+                yield f"capabilities.{group}.{name}", tool
+
+def _changed_paths(old, new, prefix: str = '') -> set:
+    if isinstance(old, dict) and isinstance(new, dict):
+        changed = set()
+        for key in old.keys() | new.keys():
+            changed |= _changed_paths(old.get(key), new.get(key), f"{prefix}{key}.")
+        return changed
+    return set() if old == new else {prefix.rstrip('.')}
+
+
+class ConfigSnapshot(Mapping):
+    """
+    One version of the configuration. Readers that need several values to agree take a
+    snapshot once instead of going through `global_config`. Sections are the plain dicts
+    the snapshot was built with and are shared with every reader, so they are not copied
+    on access; only tests and benchmarks patch them, and reloads are diffed against a
+    private copy of the values as built.
+    """
+
+    def __init__(self, data: dict, version: int):
+        self._data = data
+        # Kept pristine to diff reloads against, even if sections of `_data` are patched in place
+        self._built = copy.deepcopy(data)
+        self.version = version
+        self.loaded_at = time.time()
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def get_path(self, path: str, default=None):
+        value = self._data
+        for key in path.split('.'):
+            if not isinstance(value, dict) or key not in value:
+                return default
+            value = value[key]
+        return value
+
+    def __repr__(self):
+        return f"ConfigSnapshot(version={self.version})"
+
+
+class ConfigManager(Mapping):
+    """
+    The current configuration snapshot, built from YAML and environment variables the first
+    time it is accessed so importing the package never touches the filesystem.
+
+    `reload()` rebuilds it from the config file, `.env` and the environment, validates it
+    and swaps it in as a new version in one step; an invalid configuration is rejected and
+    the current one stays. Callables passed to `subscribe()` are then called with the old
+    snapshot, the new one and the set of dotted paths that changed. With
+    `config_reload.interval` set, a background thread reloads whenever the files or the
+    environment change. Reading `global_config[...]` always sees the current version, while
+    a call that already holds a section keeps using it.
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._subscribers = []
+        self._watcher = None
+        self._mtimes = None
+        self._last_error = None
+
+    def _build(self, version: int) -> ConfigSnapshot:
+        errors = []
+        token = _build_errors.set(errors)
+        try:
+            data = self._loader()
+        finally:
+            _build_errors.reset(token)
+        errors.extend(validate_config(data))
+        if errors:
+            raise ConfigError(errors)
+        return ConfigSnapshot(data, version)
+
+    def snapshot(self) -> ConfigSnapshot:
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._snapshot = self._build(1)
+                    self._mtimes = self._source_mtimes()
+                    self._start_watcher()
+                snapshot = self._snapshot
+        return snapshot
+
+    @property
+    def version(self) -> int:
+        return self.snapshot().version
+
+    def __getitem__(self, key):
+        return self.snapshot()[key]
+
+    def __iter__(self):
+        return iter(self.snapshot())
+
+    def __len__(self):
+        return len(self.snapshot())
+
+    def __repr__(self):
+        return f"ConfigManager(version={self._snapshot.version if self._snapshot else None})"
+
+    def subscribe(self, callback):
+        """
+        Call `callback(old, new, changed_paths)` after every reload that changed something.
+        """
+        with self._lock:
+            self._subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    @staticmethod
+    def _source_mtimes():
+        mtimes = []
+        for path in (_config_file_path(), _dotenv_path()):
+            try:
+                mtimes.append((path, os.stat(path).st_mtime_ns) if path else None)
+            except OSError:
+                mtimes.append((path, None))
+        return mtimes
+
+    def reload(self) -> bool:
+        """
+        Rebuild the configuration; returns whether a new version was swapped in.
+        Raises ConfigError (keeping the current version) if the new values are invalid.
+        """
+        global _yaml_config
+        from theta_agents.metrics import get_metrics
+        with self._reload_lock:
+            old = self.snapshot()
+            mtimes = self._source_mtimes()
+            previous_yaml = _yaml_config
+            files_changed = mtimes != self._mtimes
+            # A file that fails to load is not read again until it changes
+            self._mtimes = mtimes
+            try:
+                if files_changed:
+                    with _yaml_config_lock:
+                        _load_dotenv()
+                        _yaml_config = _read_yaml()
+                new = self._build(old.version + 1)
+            except Exception as e:
+                with _yaml_config_lock:
+                    _yaml_config = previous_yaml
+                get_metrics().inc('theta_config_reloads_total', result='invalid')
+                # The watcher retries every interval; the same problem is logged once
+                if str(e) != self._last_error:
+                    logger.error(f"Keeping configuration version {old.version}: {e}")
+                self._last_error = str(e)
+                if isinstance(e, ConfigError):
+                    raise
+                raise ConfigError([str(e)]) from e
+            self._last_error = None
+            changed = _changed_paths(old._built, new._built)
+            if not changed:
+                return False
+            with self._lock:
+                self._snapshot = new
+                subscribers = list(self._subscribers)
+                self._start_watcher()
+            get_metrics().inc('theta_config_reloads_total', result='applied')
+            get_metrics().set('theta_config_version', new.version)
+            logger.info(f"Loaded configuration version {new.version}; changed: {', '.join(sorted(changed))}")
+            restart = sorted({path.split('.')[0] for path in changed} & set(RESTART_SECTIONS))
+            if restart:
+                logger.warning(f"Changes to {', '.join(restart)} take effect after a restart")
+        for callback in subscribers:
+            try:
+                callback(old, new, changed)
+            except Exception as e:
+                logger.error(f"Configuration subscriber {callback!r} failed: {e}")
+        return True
+
+    def _start_watcher(self):
+        if self._watcher is None and float(self._snapshot["config_reload"]["interval"] or 0) > 0:
+            self._watcher = threading.Thread(target=self._watch, daemon=True, name='theta-config-watcher')
+            self._watcher.start()
+
+    def _watch(self):
+        while True:
+            interval = float(self._snapshot["config_reload"]["interval"] or 0)
+            if interval <= 0:
+                self._watcher = None
+                return
+            time.sleep(interval)
+            try:
+                self.reload()
+            except ConfigError:
+                pass
+            except Exception as e:
+                logger.error(f"Failed to reload configuration: {e}")
+
+# Global configuration combining YAML and environment variables
+global_config = ConfigManager(build_global_config)
@@ -0,0 +1,240 @@
+import contextlib
+import contextvars
+import functools
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from theta_agents.config.default_config import config_bool, global_config
+
+logger = logging.getLogger(__name__)
+
+# Per-message framing tokens added by the chat format
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_usage = contextvars.ContextVar('theta_agents_context_usage', default=None)
+
+@contextlib.contextmanager
+def context_usage():
+    """
+    Collect prompt-token accounting for every model call made inside this block.
+    Yields a dict with `calls`, `history_tokens` (what the full history would have cost),
+    `prompt_tokens` (what was sent) and `saved_tokens`.
+    """
+    usage = {"calls": 0, "history_tokens": 0, "prompt_tokens": 0, "saved_tokens": 0}
+    token = _usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _usage.reset(token)
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding(model: str):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding('cl100k_base')
+    except Exception as e:
+        # tiktoken downloads its BPE files on first use, which fails on offline hosts
+        logger.warning(f"Falling back to estimated token counts for {model or 'default model'}: {e}")
+        return None
+
+def count_text_tokens(text: str, model: str = '') -> int:
+    encoding = _encoding(model)
+    if encoding is None:
+        # Rough estimate when tiktoken is unavailable
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+def _message_text(message: BaseMessage) -> str:
+    content = message.content
+    if isinstance(content, list):
+        content = ' '.join(part.get('text', '') if isinstance(part, dict) else str(part) for part in content)
+    if isinstance(message, AIMessage) and message.tool_calls:
+        content += json.dumps([[call["name"], call["args"]] for call in message.tool_calls])
+    return content
+
+
+class ContextWindow:
+    """
+    Keeps the prompt sent to the model under a token budget.
+
+    The history is split into units that must stay together: an assistant message that
+    calls tools and the tool results answering it form one unit, every other message is
+    its own unit. Whole units are dropped from the oldest end until the system prompt,
+    the kept history and `reserve_tokens` for the reply fit in `max_tokens`. With the
+    `summarize` strategy the dropped units are replaced by a short extractive summary of
+    at most `summary_max_tokens`. The newest unit is always kept.
+    """
+
+    def __init__(self, max_tokens: int, model: str = '', reserve_tokens: int = 1024, strategy: str = 'trim',
+                 summary_max_tokens: int = 512, summary_chars_per_message: int = 200):
+        if strategy not in ('trim', 'summarize'):
+            raise ValueError(f"Unknown context window strategy: {strategy}")
+        self.max_tokens = max_tokens
+        self.model = model
+        self.reserve_tokens = reserve_tokens
+        self.strategy = strategy
+        self.summary_max_tokens = summary_max_tokens
+        self.summary_chars_per_message = summary_chars_per_message
+        self._counts = OrderedDict()
+        self._summaries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def count(self, message: BaseMessage) -> int:
+        """
+        Token count of one message, cached by message ID since history messages never change.
+        """
+        key = (message.id, type(message).__name__) if message.id else None
+        if key is not None:
+            with self._lock:
+                cached = self._counts.get(key)
+                if cached is not None:
+                    self._counts.move_to_end(key)
+                    return cached
+        tokens = count_text_tokens(_message_text(message), self.model) + MESSAGE_OVERHEAD_TOKENS
+        if key is not None:
+            with self._lock:
+                self._counts[key] = tokens
+                while len(self._counts) > 10000:
+                    self._counts.popitem(last=False)
+        return tokens
+
+    @staticmethod
+    def group(messages: List[BaseMessage]) -> List[List[BaseMessage]]:
+        """
+        Split the history into units that are kept or dropped as a whole.
+        """
+        units = []
+        open_calls = set()
+        for message in messages:
+            if isinstance(message, ToolMessage) and units and message.tool_call_id in open_calls:
+                units[-1].append(message)
+                open_calls.discard(message.tool_call_id)
+                continue
+            units.append([message])
+            open_calls = {call["id"] for call in message.tool_calls} if isinstance(message, AIMessage) else set()
+        return units
+
+    def _summary_line(self, unit: List[BaseMessage]) -> str:
+        limit = self.summary_chars_per_message
+        first = unit[0]
+        if isinstance(first, HumanMessage):
+            line = f"User: {_message_text(first)}"
+        elif isinstance(first, AIMessage) and first.tool_calls:
+            results = '; '.join(f"{message.name} -> {message.content}" for message in unit[1:] if isinstance(message.content, str))
+            line = f"Tools called: {results or ', '.join(call['name'] for call in first.tool_calls)}"
+        elif isinstance(first, AIMessage):
+            text = first.content if isinstance(first.content, str) else _message_text(first)
+            with contextlib.suppress(ValueError, AttributeError):
+                # Replies are JSON; only the user-facing part is worth keeping
+                text = json.loads(text).get('user_facing_text', text)
+            line = f"Assistant: {text}"
+        else:
+            line = _message_text(first)
+        line = ' '.join(line.split())
+        return line if len(line) <= limit else line[:limit - 3] + '...'
+
+    def _summarize(self, dropped: List[List[BaseMessage]], budget: int) -> Optional[SystemMessage]:
+        # Keyed on the dropped content itself: message IDs are not set outside the graph
+        digest = hashlib.sha256()
+        for unit in dropped:
+            for message in unit:
+                digest.update(json.dumps([message.type, _message_text(message)]).encode('utf-8'))
+        key = (digest.hexdigest(), budget)
+        with self._lock:
+            if key in self._summaries:
+                return self._summaries[key]
+        header = "Summary of the earlier conversation:"
+        lines = [self._summary_line(unit) for unit in dropped]
+        tokens = [count_text_tokens(line, self.model) + 1 for line in lines]
+        total = count_text_tokens(header, self.model) + MESSAGE_OVERHEAD_TOKENS + sum(tokens)
+        # Keep the most recent lines when the summary itself is over budget
+        while lines and total > budget:
+            total -= tokens.pop(0)
+            lines.pop(0)
+        summary = SystemMessage(content='\n'.join([header] + lines)) if lines else None
+        with self._lock:
+            self._summaries[key] = summary
+            while len(self._summaries) > 256:
+                self._summaries.popitem(last=False)
+        return summary
+
+    @staticmethod
+    def _fit(unit_tokens: List[int], budget: int):
+        kept, used = 0, 0
+        for tokens in reversed(unit_tokens):
+            if kept and used + tokens > budget:
+                break
+            used += tokens
+            kept += 1
+        return kept, used
+
+    def apply(self, system_prompt: str, messages: List[BaseMessage]) -> List[BaseMessage]:
+        """
+        Return the messages to send: the system prompt followed by the newest history that fits.
+        """
+        system_message = SystemMessage(content=system_prompt)
+        system_tokens = count_text_tokens(system_prompt, self.model) + MESSAGE_OVERHEAD_TOKENS
+        units = self.group(messages)
+        unit_tokens = [sum(self.count(message) for message in unit) for unit in units]
+        history_tokens = system_tokens + sum(unit_tokens)
+
+        budget = self.max_tokens - self.reserve_tokens - system_tokens
+        kept, used = self._fit(unit_tokens, budget)
+        if kept < len(units) and self.strategy == 'summarize':
+            # Leave room for the summary of whatever ends up dropped
+            kept, used = self._fit(unit_tokens, budget - self.summary_max_tokens)
+        dropped = units[:len(units) - kept]
+
+        window = [system_message]
+        if dropped and self.strategy == 'summarize':
+            summary = self._summarize(dropped, min(self.summary_max_tokens, max(budget - used, 0)))
+            if summary is not None:
+                window.append(summary)
+                used += self.count(summary)
+        for unit in units[len(units) - kept:]:
+            window.extend(unit)
+
+        prompt_tokens = system_tokens + used
+        usage = _usage.get()
+        if usage is not None:
+            usage["calls"] += 1
+            usage["history_tokens"] += history_tokens
+            usage["prompt_tokens"] += prompt_tokens
+            usage["saved_tokens"] += history_tokens - prompt_tokens
+        if dropped:
+            logger.debug(f"Context window dropped {len(dropped)} of {len(units)} history units "
+                         f"({history_tokens} -> {prompt_tokens} prompt tokens)")
+        return window
+
+
+def get_context_window(model_name: str) -> Optional[ContextWindow]:
+    """
+    Build a ContextWindow for `model_name` from the `context_window` section of `global_config`,
+    or return None when windowing is disabled.
+    """
+    config = global_config["context_window"]
+    if not config_bool(config["enabled"]):
+        return None
+    budgets = config["model_budgets"]
+    if isinstance(budgets, str):
+        # CONTEXT_MODEL_BUDGETS is given as JSON, e.g. '{"gpt-4o-mini": 32000}'
+        budgets = json.loads(budgets)
+    return ContextWindow(
+        max_tokens=int(budgets.get(model_name, config["default_budget"])),
+        model=model_name,
+        reserve_tokens=int(config["reserve_tokens"]),
+        strategy=config["strategy"],
+        summary_max_tokens=int(config["summary_max_tokens"])
+    )
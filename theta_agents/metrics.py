@@ -0,0 +1,510 @@
+import bisect
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+from theta_agents.config.default_config import config_bool, global_config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+_current_span = contextvars.ContextVar('theta_agents_current_span', default=None)
+
+
+def endpoint_label(url) -> str:
+    """
+    Reduce a URL to scheme://host so endpoint metrics don't get a label per path or query.
+    """
+    parts = urlsplit(str(url))
+    return f"{parts.scheme}://{parts.netloc}" if parts.netloc else str(url)
+
+
+class MetricsSink:
+    """
+    Receives finished spans. Subclass and register with `Metrics.add_sink()`.
+    """
+
+    def on_span(self, span: dict):
+        pass
+
+    def close(self):
+        pass
+
+
+class JsonLinesTraceWriter(MetricsSink):
+    """
+    Appends one JSON object per finished span to `path`.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', buffering=1)
+
+    def on_span(self, span: dict):
+        line = json.dumps(span, default=str)
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(line + '\n')
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _Span:
+    def __init__(self, metrics, name, attributes):
+        self.metrics = metrics
+        self.name = name
+        self.attributes = attributes
+        self.parent = _current_span.get()
+        self.trace_id = self.parent.trace_id if self.parent is not None else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        self._wall = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._start
+        _current_span.reset(self._token)
+        self.metrics.record_span(self.name, self._wall, duration, span_id=self.span_id, trace_id=self.trace_id,
+                                 parent_id=self.parent.span_id if self.parent is not None else None,
+                                 attributes=self.attributes, error=repr(exc) if exc is not None else None)
+        return False
+
+
+class Metrics:
+    """
+    In-process counters, gauges, histograms and spans.
+
+    Counters, gauges and histograms are keyed by name and labels and read by exporters
+    such as `PrometheusTextExporter`. Finished spans are observed into the
+    `theta_span_seconds` histogram and pushed to every registered sink.
+    """
+
+    enabled = True
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._sinks = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set(self, name: str, value: float, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name: str, value: float, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(self.buckets)
+            histogram.observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels):
+        """
+        Observe the duration of the block into histogram `name`; failures also count `theta_errors_total`.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc('theta_errors_total', source=name, **labels)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def span(self, name: str, **attributes) -> _Span:
+        """
+        Context manager that records a span, nested under the span active in the current context.
+        """
+        return _Span(self, name, attributes)
+
+    def record_span(self, name: str, start: float, duration: float, span_id: str = None, trace_id: str = None,
+                    parent_id: str = None, attributes: dict = None, error: str = None):
+        self.observe('theta_span_seconds', duration, span=name)
+        if error is not None:
+            self.inc('theta_errors_total', source=name)
+        if not self._sinks:
+            return
+        record = {
+            "trace_id": trace_id, "span_id": span_id, "parent_id": parent_id, "name": name,
+            "start": start, "duration": duration, "attributes": attributes or {}, "error": error
+        }
+        for sink in list(self._sinks):
+            try:
+                sink.on_span(record)
+            except Exception as e:
+                logger.error(f"Metrics sink {type(sink).__name__} failed: {e}")
+
+    def add_sink(self, sink: MetricsSink):
+        with self._lock:
+            self._sinks.append(sink)
+
+    def snapshot(self) -> dict:
+        """
+        Return {"counters": {(name, labels): value}, "gauges": {(name, labels): value},
+        "histograms": {(name, labels): (buckets, counts, sum, count)}}.
+        """
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "histograms": {key: (h.buckets, list(h.counts), h.sum, h.count) for key, h in self._histograms.items()}
+            }
+
+    def close(self):
+        with self._lock:
+            sinks, self._sinks = self._sinks, []
+        for sink in sinks:
+            sink.close()
+
+
+class _NoopSpan:
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class NoopMetrics:
+    """
+    Stand-in used when metrics are disabled; every call returns immediately.
+    """
+
+    enabled = False
+    _span = _NoopSpan()
+
+    def inc(self, name, amount=1, **labels):
+        pass
+
+    def set(self, name, value, **labels):
+        pass
+
+    def observe(self, name, value, **labels):
+        pass
+
+    def timer(self, name, **labels):
+        return self._span
+
+    def span(self, name, **attributes):
+        return self._span
+
+    def record_span(self, *args, **kwargs):
+        pass
+
+    def add_sink(self, sink):
+        pass
+
+    def snapshot(self) -> dict:
+        return {"counters": {}, "gauges": {}, "histograms": {}}
+
+    def close(self):
+        pass
+
+
+def _escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels, extra=()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape_label(value)}"' for key, value in pairs) + '}'
+
+
+class PrometheusTextExporter:
+    """
+    Renders a Metrics registry in the Prometheus text exposition format, and can serve it on `/metrics`.
+    """
+
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+        self._server = None
+
+    def render(self) -> str:
+        snapshot = self.metrics.snapshot()
+        lines = []
+        typed = set()
+        for (name, labels), value in sorted(snapshot["counters"].items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), value in sorted(snapshot["gauges"].items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} gauge")
+                typed.add(name)
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), (buckets, counts, total, count) in sorted(snapshot["histograms"].items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            cumulative = 0
+            for bound, bucket_count in zip(list(buckets) + ['+Inf'], counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port: int, host: str = '127.0.0.1'):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                body = exporter.render().encode('utf-8')
+                self.send_response(200 if self.path.startswith('/metrics') else 404)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name='theta-metrics', daemon=True).start()
+        logger.info(f"Serving Prometheus metrics on http://{host}:{self._server.server_port}/metrics")
+        return self._server.server_port
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+def _llm_usage(response) -> Dict[str, int]:
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, 'message', None), 'usage_metadata', None)
+            if usage:
+                return {"prompt": usage.get("input_tokens", 0), "completion": usage.get("output_tokens", 0)}
+    token_usage = (response.llm_output or {}).get('token_usage') or {}
+    return {"prompt": token_usage.get("prompt_tokens", 0), "completion": token_usage.get("completion_tokens", 0)}
+
+
+def metrics_callback_handler(metrics: Metrics, model: str = ''):
+    """
+    Build a LangChain callback handler that records LLM latency, time to first token and
+    token counts, tool latency and errors, and spans for the `agent` and `tools` graph nodes.
+    """
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class MetricsCallbackHandler(BaseCallbackHandler):
+        def __init__(self):
+            self.runs = {}
+            # run_id -> (trace_id, span ID of the nearest recorded ancestor or the run itself)
+            self.scopes = {}
+
+        def _scope(self, run_id, parent_run_id, recorded):
+            trace_id, parent_span = self.scopes.get(parent_run_id, (None, None))
+            trace_id = trace_id or uuid.uuid4().hex
+            self.scopes[run_id] = (trace_id, str(run_id) if recorded else parent_span)
+            return trace_id, parent_span
+
+        def _start(self, run_id, parent_run_id, name, **attributes):
+            trace_id, parent_span = self._scope(run_id, parent_run_id, True)
+            self.runs[run_id] = {"name": name, "wall": time.time(), "start": time.perf_counter(), "trace_id": trace_id,
+                                 "parent": parent_span, "attributes": attributes, "first_token": None}
+
+        def _finish(self, run_id, error=None):
+            self.scopes.pop(run_id, None)
+            run = self.runs.pop(run_id, None)
+            if run is None:
+                return None
+            duration = time.perf_counter() - run["start"]
+            metrics.record_span(run["name"], run["wall"], duration, span_id=str(run_id), trace_id=run["trace_id"],
+                                parent_id=run["parent"], attributes=run["attributes"],
+                                error=repr(error) if error is not None else None)
+            return run, duration
+
+        # Graph nodes: only the node runnable itself, not every runnable nested inside it
+        def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+            node = (metadata or {}).get('langgraph_node')
+            name = kwargs.get('name')
+            if node in ('agent', 'tools') and name == node:
+                self._start(run_id, parent_run_id, f"node.{node}", step=(metadata or {}).get('langgraph_step'))
+            elif parent_run_id is None:
+                self._start(run_id, None, "agent.turn")
+            else:
+                self._scope(run_id, parent_run_id, False)
+
+        def on_chain_end(self, outputs, *, run_id, **kwargs):
+            self._finish(run_id)
+
+        def on_chain_error(self, error, *, run_id, **kwargs):
+            self._finish(run_id, error)
+
+        def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+            self._start(run_id, parent_run_id, "llm", model=model)
+
+        def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+            self._start(run_id, parent_run_id, "llm", model=model)
+
+        def on_llm_new_token(self, token, *, run_id, **kwargs):
+            run = self.runs.get(run_id)
+            if run is not None and run["first_token"] is None:
+                run["first_token"] = time.perf_counter() - run["start"]
+                metrics.observe('theta_llm_time_to_first_token_seconds', run["first_token"], model=model)
+
+        def on_llm_end(self, response, *, run_id, **kwargs):
+            usage = _llm_usage(response)
+            run = self.runs.get(run_id)
+            if run is not None:
+                run["attributes"].update(prompt_tokens=usage["prompt"], completion_tokens=usage["completion"])
+            finished = self._finish(run_id)
+            if finished is not None:
+                metrics.observe('theta_llm_seconds', finished[1], model=model)
+            metrics.inc('theta_llm_prompt_tokens_total', usage["prompt"], model=model)
+            metrics.inc('theta_llm_completion_tokens_total', usage["completion"], model=model)
+
+        def on_llm_error(self, error, *, run_id, **kwargs):
+            self._finish(run_id, error)
+            metrics.inc('theta_llm_errors_total', model=model)
+
+        def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+            name = (serialized or {}).get('name') or kwargs.get('name') or 'tool'
+            self._start(run_id, parent_run_id, f"tool.{name}", tool=name)
+
+        def on_tool_end(self, output, *, run_id, **kwargs):
+            finished = self._finish(run_id)
+            if finished is not None:
+                run, duration = finished
+                tool = run["attributes"]["tool"]
+                metrics.observe('theta_tool_seconds', duration, tool=tool)
+                # Tools report failures as "Error: ..." strings instead of raising
+                content = getattr(output, 'content', output)
+                if isinstance(content, str) and content.startswith('Error'):
+                    metrics.inc('theta_tool_errors_total', tool=tool)
+
+        def on_tool_error(self, error, *, run_id, **kwargs):
+            finished = self._finish(run_id, error)
+            if finished is not None:
+                run, duration = finished
+                metrics.observe('theta_tool_seconds', duration, tool=run["attributes"]["tool"])
+                metrics.inc('theta_tool_errors_total', tool=run["attributes"]["tool"])
+
+    return MetricsCallbackHandler()
+
+
+def instrument_session(session, metrics: Metrics):
+    """
+    Record per-endpoint latency, status codes and server errors for a requests session.
+    """
+    def on_response(response, *args, **kwargs):
+        endpoint = endpoint_label(response.url)
+        metrics.observe('theta_endpoint_seconds', response.elapsed.total_seconds(), endpoint=endpoint)
+        if response.status_code >= 500 or response.status_code == 429:
+            metrics.inc('theta_endpoint_errors_total', endpoint=endpoint, status=response.status_code)
+    session.hooks['response'].append(on_response)
+    return session
+
+
+def httpx_event_hooks(metrics: Metrics, is_async: bool = False) -> dict:
+    """
+    Event hooks for httpx clients that record the same endpoint metrics as `instrument_session`.
+    Latency is measured up to the response headers, so it includes time to first byte for streams.
+    """
+    def on_request(request):
+        request.extensions['theta_started'] = time.perf_counter()
+
+    def on_response(response):
+        started = response.request.extensions.get('theta_started')
+        endpoint = endpoint_label(response.request.url)
+        if started is not None:
+            metrics.observe('theta_endpoint_seconds', time.perf_counter() - started, endpoint=endpoint)
+        if response.status_code >= 500 or response.status_code == 429:
+            metrics.inc('theta_endpoint_errors_total', endpoint=endpoint, status=response.status_code)
+
+    if not is_async:
+        return {'request': [on_request], 'response': [on_response]}
+
+    async def aon_request(request):
+        on_request(request)
+
+    async def aon_response(response):
+        on_response(response)
+    return {'request': [aon_request], 'response': [aon_response]}
+
+
+_metrics = None
+_exporter = None
+_metrics_lock = threading.Lock()
+
+def get_metrics():
+    """
+    Return the process-wide metrics registry built from the `metrics` config section,
+    or a no-op stand-in when metrics are disabled.
+    """
+    global _metrics, _exporter
+    if _metrics is not None:
+        return _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            config = global_config["metrics"]
+            if not config_bool(config["enabled"]):
+                _metrics = NoopMetrics()
+            else:
+                metrics = Metrics()
+                if config["trace_path"]:
+                    metrics.add_sink(JsonLinesTraceWriter(os.path.expanduser(config["trace_path"])))
+                if int(config["prometheus_port"]):
+                    _exporter = PrometheusTextExporter(metrics)
+                    _exporter.serve(int(config["prometheus_port"]))
+                _metrics = metrics
+        return _metrics
+
+def set_metrics(metrics: Optional[Metrics]):
+    """
+    Replace the process-wide registry, e.g. with a `Metrics()` in tests or benchmarks. None re-reads the config.
+    """
+    global _metrics
+    with _metrics_lock:
+        _metrics = metrics
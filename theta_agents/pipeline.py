@@ -0,0 +1,222 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, List
+from theta_agents.config.default_config import global_config
+from theta_agents.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+def _is_error(value) -> bool:
+    # Tools report failures as "Error: ..." strings rather than raising
+    return isinstance(value, str) and value.startswith('Error')
+
+
+class Stage:
+    """
+    One step of a MediaPipeline. `fn(artifact)` receives the previous stage's artifact
+    (the item itself for the first stage) and returns the artifact for the next one.
+    """
+
+    def __init__(self, name: str, fn: Callable, workers: int = None):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+
+
+class PipelineResult:
+    """
+    Outcome of one item: the artifact and duration in seconds of every stage that ran,
+    and the error and stage that stopped it, if any.
+    """
+
+    def __init__(self, index: int, item):
+        self.index = index
+        self.item = item
+        self.artifacts = {}
+        self.timings = {}
+        self.error = None
+        self.failed_stage = None
+        self.elapsed = None
+        self._started = time.monotonic()
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    @property
+    def output(self):
+        """
+        Artifact of the last stage, or None if the item failed.
+        """
+        if not self.ok or not self.artifacts:
+            return None
+        return list(self.artifacts.values())[-1]
+
+    def to_dict(self) -> Dict:
+        return {
+            "item": self.item,
+            "artifacts": dict(self.artifacts),
+            "timings": {stage: round(seconds, 3) for stage, seconds in self.timings.items()},
+            "elapsed": round(self.elapsed, 3) if self.elapsed is not None else None,
+            "error": self.error,
+            "failed_stage": self.failed_stage
+        }
+
+
+class MediaPipeline:
+    """
+    Runs items through a chain of stages without going back to the LLM in between.
+
+    Every stage has its own worker threads, connected to the next stage by a bounded queue,
+    so different items are in different stages at the same time (image N+1 is generated
+    while video N renders). Artifacts are handed from stage to stage in memory. An item
+    whose stage raises or returns an "Error: ..." string skips the remaining stages
+    without affecting the other items. Worker counts and queue sizes default to the
+    `pipeline` section of `global_config`.
+    """
+
+    def __init__(self, stages: Iterable[Stage], queue_size: int = None):
+        self.stages = list(stages)
+        if not self.stages:
+            raise ValueError("A pipeline needs at least one stage")
+        config = global_config["pipeline"]
+        self.queue_size = int(queue_size or config["queue_size"])
+        stage_workers = config.get("stage_workers") or {}
+        self.workers = [
+            max(1, int(stage.workers or stage_workers.get(stage.name) or config["default_workers"]))
+            for stage in self.stages
+        ]
+
+    def iter_results(self, items: Iterable) -> Iterator[PipelineResult]:
+        """
+        Yield the result of every item as soon as it leaves the pipeline, in completion order.
+        Closing the iterator early stops the workers once their current call returns.
+        """
+        items = list(items)
+        stop = threading.Event()
+        queues = [queue.Queue(self.queue_size) for _ in self.stages]
+        finished = queue.Queue()
+        remaining = list(self.workers)
+        lock = threading.Lock()
+        metrics = get_metrics()
+
+        def put(index, entry) -> bool:
+            while not stop.is_set():
+                try:
+                    queues[index].put(entry, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def get(index):
+            while not stop.is_set():
+                try:
+                    return queues[index].get(timeout=0.1)
+                except queue.Empty:
+                    continue
+            return _DONE
+
+        def finish(result):
+            result.elapsed = time.monotonic() - result._started
+            finished.put(result)
+
+        def feed():
+            for index, item in enumerate(items):
+                if not put(0, (PipelineResult(index, item), item)):
+                    return
+            for _ in range(self.workers[0]):
+                put(0, _DONE)
+
+        def work(index):
+            stage = self.stages[index]
+            last = index == len(self.stages) - 1
+            while True:
+                entry = get(index)
+                if entry is _DONE:
+                    break
+                result, artifact = entry
+                start = time.monotonic()
+                try:
+                    output = stage.fn(artifact)
+                    error = output if _is_error(output) else None
+                except Exception as e:
+                    logger.error(f"Pipeline stage {stage.name} failed for item {result.index}: {e}")
+                    output, error = None, f"Error: {e}"
+                elapsed = time.monotonic() - start
+                result.timings[stage.name] = elapsed
+                metrics.observe('theta_pipeline_stage_seconds', elapsed, stage=stage.name)
+                if error is not None:
+                    metrics.inc('theta_pipeline_errors_total', stage=stage.name)
+                    result.error, result.failed_stage = error, stage.name
+                    finish(result)
+                    continue
+                result.artifacts[stage.name] = output
+                if last:
+                    finish(result)
+                elif not put(index + 1, (result, output)):
+                    break
+            # The last worker of a stage to finish tells every worker of the next stage
+            with lock:
+                remaining[index] -= 1
+                done = remaining[index] == 0
+            if done and not last:
+                for _ in range(self.workers[index + 1]):
+                    put(index + 1, _DONE)
+
+        threads = [threading.Thread(target=contextvars.copy_context().run, args=(feed,), daemon=True,
+                                    name='theta-pipeline-feed')]
+        for index, stage in enumerate(self.stages):
+            threads.extend(
+                threading.Thread(target=contextvars.copy_context().run, args=(work, index), daemon=True,
+                                 name=f'theta-pipeline-{stage.name}')
+                for _ in range(self.workers[index])
+            )
+        for thread in threads:
+            thread.start()
+        try:
+            for _ in range(len(items)):
+                yield finished.get()
+        finally:
+            stop.set()
+
+    def run(self, items: Iterable) -> List[PipelineResult]:
+        """
+        Run every item through the pipeline and return the results in input order.
+        """
+        start = time.monotonic()
+        results = sorted(self.iter_results(items), key=lambda result: result.index)
+        logger.info(f"Pipeline {' -> '.join(stage.name for stage in self.stages)}: {len(results)} items in "
+                    f"{time.monotonic() - start:.2f}s, {sum(not result.ok for result in results)} failed")
+        return results
+
+    async def arun(self, items: Iterable) -> List[PipelineResult]:
+        """
+        Run the pipeline without blocking the event loop. Stages still run on worker threads.
+        """
+        run = functools.partial(contextvars.copy_context().run, self.run, list(items))
+        return await asyncio.get_running_loop().run_in_executor(None, run)
+
+
+def stage_summary(results: Iterable[PipelineResult]) -> Dict[str, Dict]:
+    """
+    Count, total, mean and max duration in seconds of each stage over `results`.
+    """
+    summary = {}
+    for result in results:
+        for stage, seconds in result.timings.items():
+            entry = summary.setdefault(stage, {"count": 0, "total": 0.0, "max": 0.0})
+            entry["count"] += 1
+            entry["total"] += seconds
+            entry["max"] = max(entry["max"], seconds)
+    for entry in summary.values():
+        entry["mean"] = entry["total"] / entry["count"]
+    return summary
@@ -0,0 +1,308 @@
+import asyncio
+import contextlib
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+from theta_agents.config.default_config import config_bool, global_config
+
+logger = logging.getLogger(__name__)
+
+_bypass = contextvars.ContextVar('theta_agents_result_cache_bypass', default=False)
+# Handed to callers sharing a cancelled computation, which then run it themselves
+_RETRY = object()
+
+@contextlib.contextmanager
+def bypass_result_cache():
+    """
+    Skip cache lookups (but still refresh the cache) for tool calls made inside this block.
+    """
+    token = _bypass.set(True)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Normalise unicode and whitespace so trivially different prompts share a cache entry.
+    """
+    return ' '.join(unicodedata.normalize('NFC', prompt).split())
+
+def _is_cacheable(value) -> bool:
+    return value is not None and not (isinstance(value, str) and value.startswith('Error'))
+
+
+class _SqliteTier:
+    def __init__(self, path: str, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, tool TEXT, value TEXT, expires_at REAL, last_access REAL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None, None
+            value, expires_at = row
+            if expires_at <= now:
+                self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                self._conn.commit()
+                return None, None
+            self._conn.execute("UPDATE results SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return json.loads(value), expires_at
+
+    def set(self, tool_name: str, key: str, value, expires_at: float):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, tool, value, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, tool_name, json.dumps(value), expires_at, now)
+            )
+            self._conn.execute("DELETE FROM results WHERE expires_at <= ?", (now,))
+            self._conn.execute(
+                "DELETE FROM results WHERE key IN ("
+                "SELECT key FROM results ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ResultCache:
+    """
+    Result cache for deterministic generation tools.
+
+    Entries live in an in-memory LRU and, when `sqlite_path` is set, in a SQLite tier
+    shared across processes. Each tool has its own TTL. Concurrent calls with the same
+    key share a single upstream call.
+    """
+
+    def __init__(self, max_entries: int = 1024, default_ttl: float = 3600, ttls: dict = None,
+                 sqlite_path: str = None, sqlite_max_entries: int = 100000):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.ttls = dict(ttls or {})
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._async_in_flight = {}
+        self._stats = {}
+        self._disk = _SqliteTier(sqlite_path, sqlite_max_entries) if sqlite_path else None
+
+    @staticmethod
+    def make_key(tool_name: str, model: str, endpoint: str, prompt: str) -> str:
+        payload = json.dumps([tool_name, model or '', endpoint or '', normalize_prompt(prompt)])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _count(self, tool_name: str, field: str):
+        tool_stats = self._stats.setdefault(tool_name, {"hits": 0, "misses": 0, "shared": 0, "bypassed": 0})
+        tool_stats[field] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {tool: dict(counts) for tool, counts in self._stats.items()}
+
+    def get(self, tool_name: str, key: str):
+        """
+        Return (hit, value) for `key`, checking memory first and then the disk tier.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._count(tool_name, "hits")
+                    return True, value
+                del self._memory[key]
+        if self._disk is not None:
+            value, expires_at = self._disk.get(key)
+            if expires_at is not None:
+                with self._lock:
+                    self._store_memory(key, value, expires_at)
+                    self._count(tool_name, "hits")
+                return True, value
+        with self._lock:
+            self._count(tool_name, "misses")
+        return False, None
+
+    def _store_memory(self, key, value, expires_at):
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def set(self, tool_name: str, key: str, value):
+        if not _is_cacheable(value):
+            return
+        expires_at = time.time() + float(self.ttls.get(tool_name, self.default_ttl))
+        with self._lock:
+            self._store_memory(key, value, expires_at)
+        if self._disk is not None:
+            self._disk.set(tool_name, key, value, expires_at)
+
+    def get_or_compute(self, tool_name: str, key: str, compute, bypass: bool = False):
+        """
+        Return the cached result for `key`, or call `compute()` once for all concurrent callers.
+        """
+        bypass = bypass or _bypass.get()
+        if bypass:
+            with self._lock:
+                self._count(tool_name, "bypassed")
+        else:
+            hit, value = self.get(tool_name, key)
+            if hit:
+                return value
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._in_flight[key] = future
+            else:
+                self._count(tool_name, "shared")
+        if not owner:
+            return future.result()
+
+        try:
+            value = compute()
+            self.set(tool_name, key, value)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    async def aget_or_compute(self, tool_name: str, key: str, compute, bypass: bool = False):
+        """
+        Async counterpart of `get_or_compute`; `compute` is a coroutine function.
+        """
+        bypass = bypass or _bypass.get()
+        if bypass:
+            with self._lock:
+                self._count(tool_name, "bypassed")
+        else:
+            hit, value = self.get(tool_name, key)
+            if hit:
+                return value
+
+        loop = asyncio.get_running_loop()
+        in_flight_key = (id(loop), key)
+        with self._lock:
+            future = self._async_in_flight.get(in_flight_key)
+            owner = future is None
+            if owner:
+                future = loop.create_future()
+                self._async_in_flight[in_flight_key] = future
+            else:
+                self._count(tool_name, "shared")
+        if not owner:
+            value = await asyncio.shield(future)
+            if value is _RETRY:
+                # The owner was cancelled (e.g. by a tool timeout); that is not this caller's failure
+                return await self.aget_or_compute(tool_name, key, compute, bypass)
+            return value
+
+        try:
+            value = await compute()
+            self.set(tool_name, key, value)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            with self._lock:
+                self._async_in_flight.pop(in_flight_key, None)
+            future.set_result(_RETRY)
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting on it
+            future.exception()
+            raise
+        finally:
+            with self._lock:
+                if self._async_in_flight.get(in_flight_key) is future:
+                    del self._async_in_flight[in_flight_key]
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._stats.clear()
+        if self._disk is not None:
+            self._disk.clear()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_result_cache():
+    """
+    Return the process-wide result cache, or None when `result_cache.enabled` is off.
+    """
+    global _cache
+    config = global_config["result_cache"]
+    if not config_bool(config["enabled"]):
+        return None
+    with _cache_lock:
+        if _cache is None:
+            ttls = config["ttls"]
+            if isinstance(ttls, str):
+                # RESULT_CACHE_TTLS is given as JSON, e.g. '{"create_image_from_prompt": 86400}'
+                ttls = json.loads(ttls)
+            sqlite_path = config["sqlite_path"]
+            _cache = ResultCache(
+                max_entries=int(config["max_entries"]),
+                default_ttl=float(config["default_ttl"]),
+                ttls=ttls,
+                sqlite_path=os.path.expanduser(sqlite_path) if sqlite_path else None,
+                sqlite_max_entries=int(config["sqlite_max_entries"])
+            )
+        return _cache
+
+def cached_call(tool_name: str, config: dict, prompt: str, compute):
+    """
+    Run `compute()` through the result cache keyed by tool, model, endpoint and prompt.
+    """
+    cache = get_result_cache()
+    if cache is None:
+        return compute()
+    key = cache.make_key(tool_name, config.get("model_name"), config.get("edgecloud_endpoint"), prompt)
+    return cache.get_or_compute(tool_name, key, compute)
+
+async def acached_call(tool_name: str, config: dict, prompt: str, compute):
+    """
+    Async counterpart of `cached_call`; `compute` is a coroutine function.
+    """
+    cache = get_result_cache()
+    if cache is None:
+        return await compute()
+    key = cache.make_key(tool_name, config.get("model_name"), config.get("edgecloud_endpoint"), prompt)
+    return await cache.aget_or_compute(tool_name, key, compute)
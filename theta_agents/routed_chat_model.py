@@ -0,0 +1,94 @@
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from pydantic import ConfigDict
+from theta_agents.routing import EndpointPool, is_endpoint_failure
+
+
+class RoutedChatModel(BaseChatModel):
+    """
+    Chat model that sends each call to one of several equivalent endpoints.
+
+    `models` maps each endpoint in `pool` to a chat model bound to it; the pool picks the
+    endpoint, fails over and optionally hedges. Streamed calls fail over only until the
+    first chunk has been yielded, since the caller may already have shown it.
+    """
+
+    models: Dict[str, BaseChatModel]
+    pool: Any
+    hedge: bool = False
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    @property
+    def _llm_type(self) -> str:
+        return "routed-chat-model"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"endpoints": list(self.models)}
+
+    def bind_tools(self, tools, **kwargs):
+        # Let the underlying model format the tools; the formatted kwargs reach it through _generate
+        formatted = next(iter(self.models.values())).bind_tools(tools, **kwargs)
+        return self.bind(**formatted.kwargs)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs) -> ChatResult:
+        return self.pool.call(lambda endpoint: self.models[endpoint]._generate(messages, stop=stop, **kwargs), hedge=self.hedge)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs) -> ChatResult:
+        return await self.pool.acall(lambda endpoint: self.models[endpoint]._agenerate(messages, stop=stop, **kwargs), hedge=self.hedge)
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        # The outer model reports tokens to the callbacks, so the inner one gets no run manager
+        pool: EndpointPool = self.pool
+        tried, last_error = set(), None
+        while True:
+            endpoint, trial = pool.acquire(exclude=tried)
+            if endpoint is None:
+                raise last_error or RuntimeError("No endpoint available for the LLM")
+            tried.add(endpoint)
+            start, started, error = time.monotonic(), False, None
+            try:
+                for chunk in self.models[endpoint]._stream(messages, stop=stop, **kwargs):
+                    started = True
+                    yield chunk
+            except Exception as e:
+                error = e
+            finally:
+                pool.release(endpoint, time.monotonic() - start, error, trial)
+            if error is None:
+                return
+            if started or not is_endpoint_failure(error):
+                raise error
+            last_error = error
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        pool: EndpointPool = self.pool
+        tried, last_error = set(), None
+        while True:
+            endpoint, trial = pool.acquire(exclude=tried)
+            if endpoint is None:
+                raise last_error or RuntimeError("No endpoint available for the LLM")
+            tried.add(endpoint)
+            start, started, error = time.monotonic(), False, None
+            try:
+                async for chunk in self.models[endpoint]._astream(messages, stop=stop, **kwargs):
+                    started = True
+                    yield chunk
+            except Exception as e:
+                error = e
+            finally:
+                pool.release(endpoint, time.monotonic() - start, error, trial)
+            if error is None:
+                return
+            if started or not is_endpoint_failure(error):
+                raise error
+            last_error = error
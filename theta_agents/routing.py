@@ -0,0 +1,431 @@
+import asyncio
+import contextvars
+import logging
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Tuple
+from theta_agents.clients import get_client_registry
+from theta_agents.config.default_config import global_config
+from theta_agents.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Paths probed by health checks, relative to the endpoint, per endpoint type
+HEALTH_CHECK_PATHS = {'openai': '/models', 'gradio': '/config'}
+
+
+def parse_endpoints(value) -> List[str]:
+    """
+    Endpoints from a config value: a single URL, a YAML list, or a comma-separated
+    string (as set through environment variables).
+    """
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    return [str(endpoint).strip() for endpoint in value if str(endpoint).strip()]
+
+
+def is_endpoint_failure(error: BaseException) -> bool:
+    """
+    Whether an exception says something about the endpoint rather than the request.
+    Client errors (4xx other than 408 and 429) are the caller's fault and are not failed over.
+    """
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return not (isinstance(status, int) and 400 <= status < 500 and status not in (408, 429))
+
+
+class _EndpointState:
+    def __init__(self, url: str):
+        self.url = url
+        self.state = CLOSED
+        self.outstanding = 0
+        self.ewma = None
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.hedges = 0
+        self.open_until = 0.0
+        self.trial_in_flight = False
+        self.last_error = None
+
+
+class EndpointPool:
+    """
+    Spreads calls for one capability over several equivalent endpoints.
+
+    Each call goes to the endpoint with the lowest (outstanding requests + 1) x EWMA
+    latency. After `failure_threshold` consecutive failures an endpoint's circuit opens
+    and it gets no traffic for `cooldown` seconds, then a single trial call decides
+    whether it closes again. Failed calls are retried on the next best endpoint. With
+    `hedge=True` a second endpoint is tried if the first has not answered after
+    `hedge_delay` seconds (by default twice its EWMA latency) and the first answer wins.
+    If `health_check_interval` is set, a background thread probes every endpoint with
+    `probe(url)` and opens or closes circuits from the result.
+    """
+
+    def __init__(self, name: str, endpoints: List[str], ewma_alpha: float = 0.3, failure_threshold: int = 3,
+                 cooldown: float = 30, hedge_delay: float = None, health_check_interval: float = 0,
+                 probe: Callable[[str], bool] = None):
+        if not endpoints:
+            raise ValueError(f"No endpoints configured for {name}")
+        self.name = name
+        self.endpoints = {url: _EndpointState(url) for url in endpoints}
+        self.ewma_alpha = ewma_alpha
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.hedge_delay = hedge_delay
+        self.health_check_interval = health_check_interval
+        self.probe = probe
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._health_thread = None
+        if probe is not None and health_check_interval and len(endpoints) > 1:
+            self._health_thread = threading.Thread(target=self._health_loop, name=f'theta-health-{name}', daemon=True)
+            self._health_thread.start()
+
+    def _default_latency(self) -> float:
+        known = [endpoint.ewma for endpoint in self.endpoints.values() if endpoint.ewma is not None]
+        return sum(known) / len(known) if known else 1.0
+
+    def acquire(self, exclude=()) -> Tuple[Optional[str], bool]:
+        """
+        Pick an endpoint and count a request against it; pair with `release()`.
+        Returns (url, trial), where `trial` says this call decides whether the endpoint's
+        circuit closes again and must be passed on to `release()`. The url is None when
+        every endpoint is excluded.
+        """
+        now = time.monotonic()
+        with self._lock:
+            default_latency = self._default_latency()
+            candidates, fallback = [], []
+            for endpoint in self.endpoints.values():
+                if endpoint.url in exclude:
+                    continue
+                if endpoint.state == OPEN and endpoint.open_until <= now:
+                    endpoint.state = HALF_OPEN
+                if endpoint.state == CLOSED or (endpoint.state == HALF_OPEN and not endpoint.trial_in_flight):
+                    candidates.append(endpoint)
+                else:
+                    fallback.append(endpoint)
+            if not candidates:
+                if not fallback:
+                    return None, False
+                # Every circuit is open: try the one that will recover first rather than fail outright
+                candidates = [min(fallback, key=lambda endpoint: endpoint.open_until)]
+            chosen = min(candidates, key=lambda endpoint: (
+                (endpoint.outstanding + 1) * (endpoint.ewma if endpoint.ewma is not None else default_latency),
+                random.random()
+            ))
+            # Only one call at a time probes an endpoint whose circuit is not closed
+            trial = chosen.state != CLOSED and not chosen.trial_in_flight
+            if trial:
+                chosen.trial_in_flight = True
+            chosen.outstanding += 1
+            chosen.requests += 1
+            return chosen.url, trial
+
+    def release(self, url: str, latency: float = None, error: BaseException = None, trial: bool = False):
+        """
+        Record the outcome of a call made with `acquire()`. A latency of None (an abandoned
+        call) only frees the slot. Only the trial call opens or closes a circuit that is not
+        closed; calls started before the circuit opened just update the counters.
+        """
+        failed = error is not None and is_endpoint_failure(error)
+        with self._lock:
+            endpoint = self.endpoints.get(url)
+            if endpoint is None:
+                return
+            endpoint.outstanding -= 1
+            if trial:
+                endpoint.trial_in_flight = False
+            if latency is None:
+                return
+            if failed:
+                endpoint.failures += 1
+                endpoint.consecutive_failures += 1
+                endpoint.last_error = str(error)[:200]
+                if trial or (endpoint.state == CLOSED and endpoint.consecutive_failures >= self.failure_threshold):
+                    self._open(endpoint)
+                return
+            endpoint.ewma = latency if endpoint.ewma is None else self.ewma_alpha * latency + (1 - self.ewma_alpha) * endpoint.ewma
+            if trial:
+                logger.info(f"Endpoint {url} of {self.name} recovered")
+                endpoint.state = CLOSED
+            if endpoint.state == CLOSED:
+                endpoint.consecutive_failures = 0
+
+    def _open(self, endpoint: _EndpointState):
+        if endpoint.state != OPEN:
+            logger.warning(f"Opening circuit for {endpoint.url} of {self.name} for {self.cooldown}s: {endpoint.last_error}")
+            get_metrics().inc('theta_circuit_opened_total', pool=self.name)
+        endpoint.state = OPEN
+        endpoint.open_until = time.monotonic() + self.cooldown
+
+    def _delay_for(self, url: str) -> float:
+        if self.hedge_delay:
+            return self.hedge_delay
+        with self._lock:
+            ewma = self.endpoints[url].ewma
+            if ewma is None:
+                ewma = self._default_latency()
+        return max(2 * ewma, 0.05)
+
+    def _attempt(self, url: str, trial: bool, fn):
+        start = time.monotonic()
+        try:
+            result = fn(url)
+        except BaseException as e:
+            self.release(url, time.monotonic() - start, e, trial)
+            raise
+        self.release(url, time.monotonic() - start, trial=trial)
+        return result
+
+    def call(self, fn: Callable[[str], object], hedge: bool = False, exclude=()):
+        """
+        Run `fn(endpoint)` on the best endpoint, failing over to the others on endpoint errors.
+        """
+        tried = set(exclude)
+        last_error = None
+        if hedge and len(self.endpoints) - len(tried) > 1:
+            try:
+                return self._call_hedged(fn, tried)
+            except Exception as e:
+                if not is_endpoint_failure(e):
+                    raise
+                last_error = e
+        while True:
+            url, trial = self.acquire(exclude=tried)
+            if url is None:
+                raise last_error or RuntimeError(f"No endpoint available for {self.name}")
+            tried.add(url)
+            try:
+                return self._attempt(url, trial, fn)
+            except Exception as e:
+                if not is_endpoint_failure(e):
+                    raise
+                last_error = e
+                if len(tried) < len(self.endpoints):
+                    logger.warning(f"{self.name} call to {url} failed, failing over: {e}")
+                    get_metrics().inc('theta_failovers_total', pool=self.name)
+
+    def _call_hedged(self, fn, tried: set):
+        primary, trial = self.acquire(exclude=tried)
+        tried.add(primary)
+        executor = _hedge_executor()
+        futures = {executor.submit(contextvars.copy_context().run, self._attempt, primary, trial, fn): primary}
+        done, _ = wait(futures, timeout=self._delay_for(primary))
+        if not done:
+            secondary, trial = self.acquire(exclude=tried)
+            if secondary is not None:
+                tried.add(secondary)
+                self._count_hedge(secondary)
+                futures[executor.submit(contextvars.copy_context().run, self._attempt, secondary, trial, fn)] = secondary
+        # The slower attempt keeps running in the background; its outcome still updates the stats
+        pending, error = set(futures), None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def _count_hedge(self, url: str):
+        with self._lock:
+            self.endpoints[url].hedges += 1
+        get_metrics().inc('theta_hedged_requests_total', pool=self.name)
+
+    async def _aattempt(self, url: str, trial: bool, fn):
+        start = time.monotonic()
+        try:
+            result = await fn(url)
+        except asyncio.CancelledError:
+            # Lost a hedge race; says nothing about the endpoint
+            self.release(url, trial=trial)
+            raise
+        except BaseException as e:
+            self.release(url, time.monotonic() - start, e, trial)
+            raise
+        self.release(url, time.monotonic() - start, trial=trial)
+        return result
+
+    async def acall(self, fn: Callable[[str], 'asyncio.Future'], hedge: bool = False, exclude=()):
+        """
+        Async `call()`: `fn(endpoint)` returns an awaitable. A hedged call cancels the slower attempt.
+        """
+        tried = set(exclude)
+        last_error = None
+        if hedge and len(self.endpoints) - len(tried) > 1:
+            try:
+                return await self._acall_hedged(fn, tried)
+            except Exception as e:
+                if not is_endpoint_failure(e):
+                    raise
+                last_error = e
+        while True:
+            url, trial = self.acquire(exclude=tried)
+            if url is None:
+                raise last_error or RuntimeError(f"No endpoint available for {self.name}")
+            tried.add(url)
+            try:
+                return await self._aattempt(url, trial, fn)
+            except Exception as e:
+                if not is_endpoint_failure(e):
+                    raise
+                last_error = e
+                if len(tried) < len(self.endpoints):
+                    logger.warning(f"{self.name} call to {url} failed, failing over: {e}")
+                    get_metrics().inc('theta_failovers_total', pool=self.name)
+
+    async def _acall_hedged(self, fn, tried: set):
+        primary, trial = self.acquire(exclude=tried)
+        tried.add(primary)
+        tasks = {asyncio.ensure_future(self._aattempt(primary, trial, fn))}
+        done, _ = await asyncio.wait(tasks, timeout=self._delay_for(primary))
+        if not done:
+            secondary, trial = self.acquire(exclude=tried)
+            if secondary is not None:
+                tried.add(secondary)
+                self._count_hedge(secondary)
+                tasks.add(asyncio.ensure_future(self._aattempt(secondary, trial, fn)))
+        pending, error = tasks, None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _health_loop(self):
+        while not self._stopped.wait(self.health_check_interval):
+            for url in list(self.endpoints):
+                try:
+                    healthy = self.probe(url)
+                except Exception as e:
+                    healthy, error = False, e
+                else:
+                    error = None if healthy else RuntimeError("health check failed")
+                with self._lock:
+                    endpoint = self.endpoints.get(url)
+                    if endpoint is None:
+                        continue
+                    if healthy and endpoint.state != CLOSED:
+                        logger.info(f"Health check passed for {url} of {self.name}, closing circuit")
+                        endpoint.state = CLOSED
+                        endpoint.consecutive_failures = 0
+                    elif not healthy:
+                        endpoint.last_error = str(error)[:200]
+                        self._open(endpoint)
+
+    def stats(self) -> List[Dict]:
+        """
+        Per-endpoint routing state and counters.
+        """
+        with self._lock:
+            return [{
+                "endpoint": endpoint.url,
+                "state": endpoint.state,
+                "outstanding": endpoint.outstanding,
+                "ewma_latency_ms": round(endpoint.ewma * 1000, 3) if endpoint.ewma is not None else None,
+                "requests": endpoint.requests,
+                "failures": endpoint.failures,
+                "hedged_requests": endpoint.hedges,
+                "last_error": endpoint.last_error
+            } for endpoint in self.endpoints.values()]
+
+    def close(self):
+        self._stopped.set()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _hedge_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix='theta-hedge')
+        return _executor
+
+
+def http_probe(endpoint_type: str, api_key: str = None) -> Callable[[str], bool]:
+    """
+    Health check for an endpoint type: a GET on its cheap metadata path must not fail with 5xx or 429.
+    """
+    path = HEALTH_CHECK_PATHS.get(endpoint_type, '')
+
+    def probe(url: str) -> bool:
+        headers = {'Authorization': f'Bearer {api_key}'} if api_key else {}
+        response = get_client_registry().get_session(url).get(url.rstrip('/') + path, headers=headers, timeout=5)
+        return response.status_code < 500 and response.status_code != 429
+    return probe
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_endpoint_pool(name: str, endpoints, endpoint_type: str = 'openai', api_key: str = None) -> EndpointPool:
+    """
+    Return the process-wide pool for `name`, rebuilt if its configured endpoints changed.
+    Options come from the `routing` section of `global_config`.
+    """
+    endpoints = parse_endpoints(endpoints)
+    with _pools_lock:
+        pool = _pools.get(name)
+        if pool is not None and list(pool.endpoints) == endpoints:
+            return pool
+        if pool is not None:
+            pool.close()
+        config = global_config["routing"]
+        _pools[name] = pool = EndpointPool(
+            name, endpoints,
+            ewma_alpha=float(config["ewma_alpha"]),
+            failure_threshold=int(config["failure_threshold"]),
+            cooldown=float(config["cooldown"]),
+            hedge_delay=float(config["hedge_delay"] or 0) or None,
+            health_check_interval=float(config["health_check_interval"] or 0),
+            probe=http_probe(endpoint_type, api_key)
+        )
+        return pool
+
+def hedging_enabled(name: str) -> bool:
+    """
+    Whether calls for `name` (a tool name, or "llm") are hedged, per `routing.hedged_tools`.
+    """
+    return name in parse_endpoints(global_config["routing"]["hedged_tools"])
+
+def route(name: str, config: dict, fn: Callable[[str], object], endpoint_key: str = 'edgecloud_endpoint'):
+    """
+    Call `fn(endpoint)` through the pool of endpoints configured for a capability.
+    """
+    pool = get_endpoint_pool(name, config[endpoint_key], config.get("edgecloud_endpoint_type") or 'openai', config.get("api_key"))
+    return pool.call(fn, hedge=hedging_enabled(name))
+
+async def aroute(name: str, config: dict, fn: Callable[[str], 'asyncio.Future'], endpoint_key: str = 'edgecloud_endpoint'):
+    """
+    Async `route()`: `fn(endpoint)` returns an awaitable.
+    """
+    pool = get_endpoint_pool(name, config[endpoint_key], config.get("edgecloud_endpoint_type") or 'openai', config.get("api_key"))
+    return await pool.acall(fn, hedge=hedging_enabled(name))
+
+def endpoint_stats() -> Dict[str, List[Dict]]:
+    """
+    Routing stats of every endpoint pool, by pool name.
+    """
+    with _pools_lock:
+        pools = dict(_pools)
+    return {name: pool.stats() for name, pool in pools.items()}
@@ -0,0 +1,517 @@
+import asyncio
+import contextlib
+import contextvars
+import functools
+import hashlib
+import json
+import logging
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional
+from langgraph.prebuilt import create_react_agent
+from langchain_openai import ChatOpenAI
+from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
+from langchain_core.tools import StructuredTool
+from .config.default_config import global_config
+from .streaming import IncrementalJSONParser
+from .checkpoint import get_checkpointer
+from .context import context_usage, get_context_window
+from .metrics import get_metrics, metrics_callback_handler
+from .routed_chat_model import RoutedChatModel
+from .routing import get_endpoint_pool, hedging_enabled, parse_endpoints
+from .scheduler import INTERACTIVE, get_scheduler, priority, scheduling_transport
+from .semantic_cache import first_turn_only, get_semantic_cache
+from .tool_node import ConcurrentToolNode
+
+logger = logging.getLogger(__name__)
+
+def _as_tool(capability):
+    """
+    Wrap a capability that has an async variant so the graph awaits it natively
+    instead of running the blocking version in a thread pool.
+    """
+    async_variant = getattr(capability, 'async_variant', None)
+    if async_variant is None:
+        return capability
+    return StructuredTool.from_function(func=capability, coroutine=async_variant)
+
+RESPONSE_FIELDS = ('planning_text', 'user_facing_text')
+
+class _TurnStream:
+    """
+    Translates langgraph `messages`/`updates` stream output into ThetaAgent stream events.
+    """
+
+    def __init__(self):
+        self.response = {}
+        self._parser = None
+        self._message_id = None
+        self.used_tools = False
+
+    def translate(self, mode, payload) -> List[Dict]:
+        events = []
+        if mode == 'messages':
+            message, metadata = payload
+            if isinstance(message, AIMessage) and metadata.get('langgraph_node') == 'agent':
+                # Every model call in the turn produces its own JSON object
+                if self._parser is None or message.id != self._message_id:
+                    self._parser = IncrementalJSONParser(RESPONSE_FIELDS)
+                    self._message_id = message.id
+                if isinstance(message.content, str):
+                    for field, delta in self._parser.feed(message.content):
+                        events.append({"type": field, "delta": delta})
+        elif mode == 'updates':
+            for update in payload.values():
+                for message in (update or {}).get('messages', []):
+                    if isinstance(message, AIMessage):
+                        self.used_tools = self.used_tools or bool(message.tool_calls)
+                        for tool_call in message.tool_calls:
+                            events.append({"type": "tool_start", "tool": tool_call["name"], "args": tool_call["args"], "id": tool_call["id"]})
+                        update_response(self.response, {"messages": [message]})
+                    elif isinstance(message, ToolMessage):
+                        events.append({"type": "tool_end", "tool": message.name, "output": message.content, "id": message.tool_call_id})
+        return events
+
+
+def update_response(response_data: Dict, event: Dict):
+    """
+    Copy the JSON fields of the last AI message in `event` into `response_data`.
+    """
+    last_message = event["messages"][-1]
+    if isinstance(last_message, AIMessage):
+        last_message_content = last_message.content
+        if last_message_content:
+            try:
+                parsed_response = json.loads(last_message_content)
+                response_data['planning_text'] = parsed_response.get('planning_text', '')
+                response_data['user_facing_text'] = parsed_response.get('user_facing_text', '')
+            except json.JSONDecodeError as e:
+                response_data['error'] = e.msg
+                logger.error(f"JSONDecodeError: {e.msg}")
+
+
+def _used_tools(messages: List) -> bool:
+    for message in reversed(messages):
+        if isinstance(message, HumanMessage):
+            return False
+        if isinstance(message, ToolMessage) or getattr(message, 'tool_calls', None):
+            return True
+    return False
+
+
+class _TurnCache:
+    """
+    The semantic cache side of one turn: the lookup before the graph runs and, for a
+    cacheable turn, the store afterwards. A hit is written to the thread's history as if the
+    model had answered, so the conversation continues from it.
+    """
+
+    def __init__(self, runtime: 'AgentRuntime', user_input: str, config: Dict):
+        self.cache = get_semantic_cache()
+        self.runtime = runtime
+        self.user_input = user_input
+        self.config = config
+        self.eligible = False
+
+    def _check(self, messages) -> bool:
+        # A later turn's answer depends on the history unless configured otherwise
+        self.eligible = not messages or not first_turn_only()
+        return self.eligible
+
+    def _history(self, response: Dict) -> Dict:
+        return {"messages": [HumanMessage(content=self.user_input), AIMessage(content=json.dumps(response))]}
+
+    def _cacheable(self, response: Dict, used_tools: bool) -> bool:
+        return self.eligible and not used_tools and 'error' not in response and bool(response.get('user_facing_text'))
+
+    def lookup(self) -> Optional[Dict]:
+        if self.cache is None or not self._check(self.runtime.graph.get_state(self.config).values.get("messages")):
+            return None
+        response = self.cache.lookup(self.runtime.cache_scope, self.user_input)
+        if response is not None:
+            self.runtime.graph.update_state(self.config, self._history(response), as_node="agent")
+        return response
+
+    def store(self, response: Dict, used_tools: bool):
+        if self._cacheable(response, used_tools):
+            self.cache.store(self.runtime.cache_scope, self.user_input, response)
+
+    @staticmethod
+    async def _run_blocking(function, *args):
+        # Embeddings may come from the network
+        return await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(contextvars.copy_context().run, function, *args))
+
+    async def alookup(self) -> Optional[Dict]:
+        if self.cache is None or not self._check((await self.runtime.graph.aget_state(self.config)).values.get("messages")):
+            return None
+        response = await self._run_blocking(self.cache.lookup, self.runtime.cache_scope, self.user_input)
+        if response is not None:
+            await self.runtime.graph.aupdate_state(self.config, self._history(response), as_node="agent")
+        return response
+
+    async def astore(self, response: Dict, used_tools: bool):
+        if self._cacheable(response, used_tools):
+            await self._run_blocking(self.cache.store, self.runtime.cache_scope, self.user_input, response)
+
+
+def _cached_events(response: Dict) -> List[Dict]:
+    return [{"type": field, "delta": response[field]} for field in RESPONSE_FIELDS if response.get(field)]
+
+
+class _Unlimited:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class _KeyedLocks:
+    """
+    Locks or semaphores created on demand per key and dropped once nobody holds or waits
+    for them, so idle threads and tenants cost nothing.
+    """
+
+    def __init__(self, factory: Callable):
+        self._factory = factory
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = [self._factory(), 0]
+            entry[1] += 1
+        try:
+            yield entry[0]
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._entries[key]
+
+
+def _limit(name: str, semaphore_class):
+    limit = int(global_config["runtime"][name])
+    return semaphore_class(limit) if limit > 0 else _Unlimited()
+
+# Process-wide, so runtimes sharing a checkpointer still never run one thread twice at once
+_thread_locks = _KeyedLocks(threading.Lock)
+_tenant_slots = _KeyedLocks(lambda: _limit("max_turns_per_tenant", threading.BoundedSemaphore))
+_global_slots = _KeyedLocks(lambda: _limit("max_concurrent_turns", threading.BoundedSemaphore))
+_async_thread_locks = _KeyedLocks(asyncio.Lock)
+_async_tenant_slots = _KeyedLocks(lambda: _limit("max_turns_per_tenant", asyncio.Semaphore))
+_async_global_slots = _KeyedLocks(lambda: _limit("max_concurrent_turns", asyncio.Semaphore))
+
+@contextlib.contextmanager
+def _turn_slot(thread_id: str, tenant: str):
+    """
+    Wait until a turn may run on `thread_id`: the thread is idle, then `tenant` has a free
+    slot, then the process does. A tenant's extra turns wait without holding a global slot.
+    """
+    start = time.monotonic()
+    with _thread_locks.get(thread_id) as thread_lock, thread_lock, \
+            _tenant_slots.get(tenant) as tenant_slot, tenant_slot, \
+            _global_slots.get(None) as global_slot, global_slot:
+        get_metrics().observe('theta_turn_wait_seconds', time.monotonic() - start)
+        yield
+
+@contextlib.asynccontextmanager
+async def _aturn_slot(thread_id: str, tenant: str):
+    start = time.monotonic()
+    # asyncio primitives belong to one event loop
+    loop = id(asyncio.get_running_loop())
+    with _async_thread_locks.get((loop, thread_id)) as thread_lock, \
+            _async_tenant_slots.get((loop, tenant)) as tenant_slot, \
+            _async_global_slots.get((loop, None)) as global_slot:
+        async with thread_lock, tenant_slot, global_slot:
+            get_metrics().observe('theta_turn_wait_seconds', time.monotonic() - start)
+            yield
+
+
+class AgentRuntime:
+    """
+    One compiled agent graph serving any number of conversations.
+
+    The model, tools, system prompt and context window are fixed by the capabilities and
+    persona, while the conversation is picked per call by `thread_id`. Turns on the same
+    thread run one at a time. Each tenant (by default the thread itself) runs at most
+    `runtime.max_turns_per_tenant` turns at once and the process at most
+    `runtime.max_concurrent_turns`, so a busy tenant queues on its own slots instead of
+    starving the others. Upstream calls made during a turn are scheduled as `interactive`
+    unless the caller set another priority class. With the `semantic_cache` section enabled,
+    turns whose input means the same as an earlier one that needed no tools are answered
+    from the cache. Use `get_runtime` to share runtimes with the same configuration.
+    """
+
+    def __init__(self, capabilities: List, persona: str = '', checkpointer=None, context_window=None):
+        # Compared with `runtime_generation()` to tell whether a config reload made this runtime stale
+        self.generation = runtime_generation()
+        self.edgecloud_endpoint = global_config["llm_endpoint"]
+        self.model_name = global_config["llm_model_name"]
+        self.api_key = global_config.get("llm_api_key", None)
+        self.capabilities = capabilities
+        self.tools = [_as_tool(capability) for capability in capabilities]
+        self.persona = persona
+
+        # Any langgraph checkpointer works; by default the one from the `checkpointer` config section
+        self.memory = checkpointer if checkpointer is not None else get_checkpointer()
+        endpoints = parse_endpoints(self.edgecloud_endpoint)
+        if len(endpoints) > 1:
+            # Several equivalent LLM endpoints: each call goes through the shared "llm" pool
+            self.llm = RoutedChatModel(
+                # Retrying is left to the pool, which fails over to another endpoint instead
+                models={endpoint: self._chat_model(endpoint, max_retries=0) for endpoint in endpoints},
+                pool=get_endpoint_pool('llm', endpoints, 'openai', self.api_key),
+                hedge=hedging_enabled('llm')
+            )
+        else:
+            self.llm = self._chat_model(self.edgecloud_endpoint)
+
+        self.llm = self.llm.bind(response_format={"type": "json_object"})
+        system_prompt = """
+            \nYou must always return JSON in the following format:
+            {
+                "planning_text": <when asked to do a task, you first must break it down like 'the user wants me to do X so here are steps I'll take to do that: ..[steps]> => this is only when you're asked to do something, not if they just say 'hello' and its only for the FINAL MESSAGE ones.,
+                "user_facing_text": <the final message you want to send to the human>
+                
+            }
+
+            The internal planning message isn't always necessary to be populated if the user's input isn't really a task. For example if they say 'hello' you'd just respond with
+            {
+                "planning_text": "",
+                "user_facing_text": "Hi! Nice to meet you.", # this is just an example, just respond however you would to something like this
+            }
+
+            But if it is a task like "I nmeed a campaign about monkeys and it needs to include a image and a video that makes sense for me" your response might be:
+            {
+                "planning_text": "the user wants me to do X so here are steps I'll take to do that: ..[steps]",
+                "user_facing_text": "Great! Here's my plan of approach. Shall we go ahead?"
+            }
+
+            Of course if it's a tool call request there's no content you need to provide. REMEMBER TO RESPOND WITH VALID JSON AND ONLY VALID JSON
+
+        """
+        if self.persona:
+            system_prompt += f"\nYou are a helpful assistant with the persona detailed below: \n{self.persona}"
+
+        self.system_prompt = system_prompt
+
+        # None builds the window from the `context_window` config section, False sends the full history
+        if context_window is None:
+            context_window = get_context_window(self.model_name)
+        self.context_window = context_window or None
+
+        self.graph = create_react_agent(
+            model=self.llm.bind_tools(self.tools),
+            # Tool calls from the same AI message run concurrently, within the `tool_execution` limits
+            tools=ConcurrentToolNode(self.tools),
+            checkpointer=self.memory,
+            state_modifier=self._window_messages if self.context_window is not None else self.system_prompt
+        )
+        # Cached answers are only shared between runtimes that would give the same one
+        self.cache_scope = hashlib.sha1(json.dumps(
+            [self.persona, sorted(getattr(tool, 'name', None) or tool.__name__ for tool in self.tools), self.model_name]).encode()).hexdigest()
+        metrics = get_metrics()
+        # Token counts, time to first token, tool latency and agent/tools node spans
+        self._callbacks = [metrics_callback_handler(metrics, self.model_name)] if metrics.enabled else None
+
+    def _chat_model(self, base_url: str, max_retries: int = None) -> ChatOpenAI:
+        options = {}
+        scheduler = get_scheduler()
+        if scheduler is not None:
+            # LLM calls queue for admission with the tools' calls to the same host
+            import openai
+            options = {
+                "http_client": openai.DefaultHttpxClient(transport=scheduling_transport(scheduler)),
+                "http_async_client": openai.DefaultAsyncHttpxClient(transport=scheduling_transport(scheduler, is_async=True))
+            }
+            # Closed with the runtime, as the SDK does with the clients it creates itself
+            weakref.finalize(self, options["http_client"].close)
+        return ChatOpenAI(
+            base_url=base_url,
+            model=self.model_name,
+            api_key=self.api_key,
+            temperature=0,
+            max_tokens=None,
+            timeout=float(global_config["llm_timeout"] or 0) or None,
+            max_retries=int(global_config["llm_max_retries"]) if max_retries is None else max_retries,
+            # Usage on streamed responses feeds the token counters when metrics are on
+            stream_usage=get_metrics().enabled,
+            verbose=True,
+            **options
+        )
+
+    def _window_messages(self, state) -> List:
+        return self.context_window.apply(self.system_prompt, state["messages"])
+
+    def thread_config(self, thread_id: str, thread_ttl: float = None) -> Dict:
+        """
+        The langgraph run config for a turn on `thread_id`.
+        """
+        config = {"configurable": {"thread_id": thread_id}}
+        if thread_ttl is not None:
+            config["configurable"]["thread_ttl"] = thread_ttl
+        if self._callbacks:
+            config["callbacks"] = self._callbacks
+        return config
+
+    @staticmethod
+    def _finish_turn(usage: Dict, on_usage: Optional[Callable[[Dict], None]]):
+        if usage["saved_tokens"]:
+            logger.info(f"Context window sent {usage['prompt_tokens']} of {usage['history_tokens']} prompt tokens "
+                        f"over {usage['calls']} model calls (saved {usage['saved_tokens']})")
+        if on_usage is not None:
+            on_usage(usage)
+
+    def invoke(self, user_input: str, thread_id: str, tenant: str = None, thread_ttl: float = None,
+               on_usage: Callable[[Dict], None] = None) -> Dict:
+        """
+        Run one turn on `thread_id` and return its `planning_text`/`user_facing_text` (or `error`).
+        `on_usage` receives the turn's context-window token accounting.
+        """
+        response_data = {}
+        config = self.thread_config(thread_id, thread_ttl)
+        cache = _TurnCache(self, user_input, config)
+        with _turn_slot(thread_id, tenant or thread_id), priority(INTERACTIVE, override=False), context_usage() as usage:
+            cached = cache.lookup()
+            if cached is not None:
+                response_data = cached
+            else:
+                messages = []
+                for event in self.graph.stream({"messages": [HumanMessage(content=user_input)]}, config=config, stream_mode="values"):
+                    update_response(response_data, event)
+                    messages = event["messages"]
+                cache.store(response_data, _used_tools(messages))
+        self._finish_turn(usage, on_usage)
+        return response_data
+
+    async def ainvoke(self, user_input: str, thread_id: str, tenant: str = None, thread_ttl: float = None,
+                      on_usage: Callable[[Dict], None] = None) -> Dict:
+        """
+        Async counterpart of `invoke`. Tools with async variants are awaited on the running
+        event loop, so one loop can serve many conversations concurrently.
+        """
+        response_data = {}
+        config = self.thread_config(thread_id, thread_ttl)
+        cache = _TurnCache(self, user_input, config)
+        async with _aturn_slot(thread_id, tenant or thread_id):
+            with priority(INTERACTIVE, override=False), context_usage() as usage:
+                cached = await cache.alookup()
+                if cached is not None:
+                    response_data = cached
+                else:
+                    messages = []
+                    async for event in self.graph.astream({"messages": [HumanMessage(content=user_input)]}, config=config, stream_mode="values"):
+                        update_response(response_data, event)
+                        messages = event["messages"]
+                    await cache.astore(response_data, _used_tools(messages))
+        self._finish_turn(usage, on_usage)
+        return response_data
+
+    def stream(self, user_input: str, thread_id: str, tenant: str = None, thread_ttl: float = None,
+               on_usage: Callable[[Dict], None] = None) -> Iterator[Dict]:
+        """
+        Run a turn and yield events as they happen:
+        `planning_text`/`user_facing_text` deltas as tokens arrive, `tool_start` and
+        `tool_end` around each tool call, and a closing `final` event with the same
+        dict `invoke` returns plus the turn's `context_usage`. A turn answered from the
+        semantic cache yields each field as a single delta and has `cached` set on `final`.
+        """
+        turn = _TurnStream()
+        config = self.thread_config(thread_id, thread_ttl)
+        cache = _TurnCache(self, user_input, config)
+        with _turn_slot(thread_id, tenant or thread_id), priority(INTERACTIVE, override=False), context_usage() as usage:
+            cached = cache.lookup()
+            if cached is not None:
+                turn.response = cached
+                yield from _cached_events(cached)
+            else:
+                for mode, payload in self.graph.stream({"messages": [HumanMessage(content=user_input)]}, config=config, stream_mode=["messages", "updates"]):
+                    yield from turn.translate(mode, payload)
+                cache.store(turn.response, turn.used_tools)
+        self._finish_turn(usage, on_usage)
+        yield {"type": "final", "response": turn.response, "context_usage": usage, "cached": cached is not None}
+
+    async def astream(self, user_input: str, thread_id: str, tenant: str = None, thread_ttl: float = None,
+                      on_usage: Callable[[Dict], None] = None) -> AsyncIterator[Dict]:
+        """
+        Async counterpart of `stream`.
+        """
+        turn = _TurnStream()
+        config = self.thread_config(thread_id, thread_ttl)
+        cache = _TurnCache(self, user_input, config)
+        async with _aturn_slot(thread_id, tenant or thread_id):
+            with priority(INTERACTIVE, override=False), context_usage() as usage:
+                cached = await cache.alookup()
+                if cached is not None:
+                    turn.response = cached
+                    for event in _cached_events(cached):
+                        yield event
+                else:
+                    async for mode, payload in self.graph.astream({"messages": [HumanMessage(content=user_input)]}, config=config, stream_mode=["messages", "updates"]):
+                        for event in turn.translate(mode, payload):
+                            yield event
+                    await cache.astore(turn.response, turn.used_tools)
+        self._finish_turn(usage, on_usage)
+        yield {"type": "final", "response": turn.response, "context_usage": usage, "cached": cached is not None}
+
+
+_runtimes = OrderedDict()
+_runtimes_lock = threading.Lock()
+_generation = 0
+# Settings a runtime is built from; reloading a change to any of them builds new runtimes
+RUNTIME_CONFIG = ('llm_endpoint', 'llm_model_name', 'llm_api_key', 'llm_timeout', 'llm_max_retries', 'context_window', 'routing')
+
+def runtime_generation() -> int:
+    return _generation
+
+def _retire_runtimes(old, new, changed):
+    global _generation
+    if any(path.split('.')[0] in RUNTIME_CONFIG for path in changed):
+        with _runtimes_lock:
+            _generation += 1
+            # Turns already running keep their runtime; the next turn of every agent builds a new one
+            _runtimes.clear()
+
+global_config.subscribe(_retire_runtimes)
+
+def _identity(value):
+    # Checkpointers and context windows are shared by identity; a cached runtime keeps
+    # them alive, so their id cannot be reused while it is cached
+    return value if value is None or isinstance(value, bool) else ('id', id(value))
+
+def get_runtime(capabilities: List, persona: str = '', checkpointer=None, context_window=None) -> AgentRuntime:
+    """
+    Return the runtime for this configuration, compiling its graph only the first time.
+    The `runtime.max_graphs` most recently used runtimes are kept.
+    """
+    key = (
+        tuple(capabilities), persona, _identity(checkpointer), _identity(context_window),
+        tuple(parse_endpoints(global_config["llm_endpoint"])), global_config["llm_model_name"],
+        global_config.get("llm_api_key", None), _generation
+    )
+    with _runtimes_lock:
+        runtime = _runtimes.get(key)
+        if runtime is not None:
+            _runtimes.move_to_end(key)
+            return runtime
+    # Compiled outside the lock; if two callers race, the first one stored wins
+    runtime = AgentRuntime(capabilities, persona, checkpointer, context_window)
+    with _runtimes_lock:
+        runtime = _runtimes.setdefault(key, runtime)
+        _runtimes.move_to_end(key)
+        while len(_runtimes) > max(1, int(global_config["runtime"]["max_graphs"])):
+            _runtimes.popitem(last=False)
+    return runtime
@@ -0,0 +1,592 @@
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import json
+import logging
+import math
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Optional
+from theta_agents.config.default_config import config_bool, global_config
+from theta_agents.metrics import endpoint_label, get_metrics
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 'interactive'
+DEFAULT = 'default'
+BULK = 'bulk'
+
+# Lower ranks are admitted first
+PRIORITIES = {INTERACTIVE: 0, DEFAULT: 1, BULK: 2}
+
+# Responses whose Retry-After pauses the whole endpoint
+THROTTLE_STATUSES = (429, 503)
+
+_priority = contextvars.ContextVar('theta_agents_priority', default=None)
+_deadline = contextvars.ContextVar('theta_agents_deadline', default=None)
+
+
+@contextlib.contextmanager
+def priority(name: str, override: bool = True):
+    """
+    Run the block's upstream calls in priority class `name` (`interactive`, `default` or
+    `bulk`). With `override=False` an enclosing class is kept.
+    """
+    if name not in PRIORITIES:
+        raise ValueError(f"Unknown priority class {name!r}, expected one of {', '.join(PRIORITIES)}")
+    if not override and _priority.get() is not None:
+        yield
+        return
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+def current_priority() -> str:
+    return _priority.get() or DEFAULT
+
+@contextlib.contextmanager
+def deadline(seconds: float):
+    """
+    Give up on upstream calls in the block that cannot be admitted within `seconds`.
+    Nested deadlines can only shorten an enclosing one.
+    """
+    at = time.monotonic() + seconds
+    enclosing = _deadline.get()
+    token = _deadline.set(at if enclosing is None else min(at, enclosing))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+class RequestShed(Exception):
+    """
+    Raised instead of sending a request the endpoint would not be able to take in time:
+    its queue is full, or the wait for a slot exceeds the caller's deadline.
+    """
+
+    # Treated like the upstream's own throttling, e.g. by endpoint failover
+    status_code = 429
+
+    def __init__(self, endpoint: str, reason: str, retry_after: float = None):
+        self.endpoint = endpoint
+        self.reason = reason
+        self.retry_after = retry_after
+        hint = f"; retry in {retry_after:.1f}s" if retry_after else ''
+        super().__init__(f"{endpoint} is over its rate limit ({reason}){hint}")
+
+
+class TokenBucket:
+    """
+    Refills at `rate` units per second up to `capacity`. Not locked; its owner serializes access.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, amount: float, now: float) -> float:
+        """
+        Seconds until `amount` units are available. Requests larger than the bucket only
+        wait for a full bucket and then leave it in debt.
+        """
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, amount: float, now: float):
+        self._refill(now)
+        self.level -= amount
+
+
+class _Waiter:
+    __slots__ = ('key', 'priority', 'cost', 'deadline', 'wake', 'shed')
+
+    def __init__(self, key, priority, cost, deadline, wake):
+        self.key = key
+        self.priority = priority
+        self.cost = cost
+        self.deadline = deadline
+        self.wake = wake
+        self.shed = None
+
+    def __lt__(self, other):
+        return self.key < other.key
+
+
+class EndpointLimiter:
+    """
+    Admission control for one upstream endpoint.
+
+    A request is admitted once the requests-per-second bucket has a token, the
+    tokens-per-minute bucket has its estimated token cost, and any Retry-After the
+    endpoint sent has passed. Waiting requests form one queue ordered by priority class,
+    then arrival; only its head can take tokens, so a bulk job never jumps ahead of an
+    interactive turn. The queue holds `max_queue` requests; when it is full a new request
+    displaces the newest one of a lower class, or is shed itself. A request whose
+    deadline would pass before it can be admitted is shed straight away rather than
+    sent late.
+    """
+
+    def __init__(self, endpoint: str, requests_per_second: float = 0, burst: float = None,
+                 tokens_per_minute: float = 0, max_queue: int = 64):
+        self.endpoint = endpoint
+        self.requests = TokenBucket(requests_per_second, burst or max(1.0, requests_per_second)) if requests_per_second > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute) if tokens_per_minute > 0 else None
+        self.max_queue = max_queue
+        self.blocked_until = 0.0
+        self.admitted = 0
+        self.shed = 0
+        self.throttled = 0
+        self._waiters: List[_Waiter] = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def _delay(self, cost: float, now: float) -> float:
+        delay = self.blocked_until - now
+        if self.requests is not None:
+            delay = max(delay, self.requests.delay(1, now))
+        if self.tokens is not None and cost:
+            delay = max(delay, self.tokens.delay(cost, now))
+        return delay
+
+    def _take(self, cost: float, now: float):
+        if self.requests is not None:
+            self.requests.take(1, now)
+        if self.tokens is not None and cost:
+            self.tokens.take(cost, now)
+        self.admitted += 1
+
+    def _estimate(self, key, cost: float, now: float) -> float:
+        # Rough: the head's wait plus one request interval for everyone queued ahead
+        ahead = sum(1 for waiter in self._waiters if waiter.key < key)
+        estimate = max(0.0, self._delay(cost, now))
+        if self.requests is not None:
+            estimate += ahead / self.requests.rate
+        return estimate
+
+    def _shed(self, waiter: _Waiter, reason: str, now: float):
+        self.shed += 1
+        get_metrics().inc('theta_scheduler_shed_total', endpoint=self.endpoint, priority=waiter.priority, reason=reason)
+        raise RequestShed(self.endpoint, reason, retry_after=max(0.0, self.blocked_until - now) or None)
+
+    def _remove(self, waiter: _Waiter):
+        if waiter in self._waiters:
+            self._waiters.remove(waiter)
+            heapq.heapify(self._waiters)
+            # The head may have changed; let it look at the buckets
+            if self._waiters:
+                self._waiters[0].wake()
+            self._report_depth()
+
+    def _report_depth(self):
+        get_metrics().set('theta_scheduler_queue_depth', len(self._waiters), endpoint=self.endpoint)
+
+    def _enqueue(self, cost: float, priority_name: str, deadline_at: Optional[float], wake, now: float) -> Optional[_Waiter]:
+        """
+        Admit right away (returns None) or queue a waiter; raises RequestShed if neither is possible.
+        """
+        key = (PRIORITIES[priority_name], next(self._sequence))
+        waiter = _Waiter(key, priority_name, cost, deadline_at, wake)
+        if not self._waiters and self._delay(cost, now) <= 0:
+            self._take(cost, now)
+            return None
+        if deadline_at is not None and now + self._estimate(key, cost, now) > deadline_at:
+            self._shed(waiter, 'deadline', now)
+        if len(self._waiters) >= self.max_queue:
+            newest_lowest = max(self._waiters, key=lambda queued: (queued.key[0], queued.key[1]))
+            if newest_lowest.key[0] <= key[0]:
+                self._shed(waiter, 'queue_full', now)
+            newest_lowest.shed = 'displaced'
+            self._waiters.remove(newest_lowest)
+            heapq.heapify(self._waiters)
+            newest_lowest.wake()
+        heapq.heappush(self._waiters, waiter)
+        self._report_depth()
+        return waiter
+
+    def _poll(self, waiter: _Waiter, now: float) -> Optional[float]:
+        """
+        Admit `waiter` if it is at the head and the buckets allow (returns None), otherwise
+        return how long to sleep before looking again (infinite: until woken).
+        """
+        if waiter.shed is not None:
+            self._shed(waiter, waiter.shed, now)
+        wait = math.inf
+        if self._waiters and self._waiters[0] is waiter:
+            wait = self._delay(waiter.cost, now)
+            if wait <= 0:
+                self._take(waiter.cost, now)
+                heapq.heappop(self._waiters)
+                if self._waiters:
+                    self._waiters[0].wake()
+                self._report_depth()
+                return None
+        if waiter.deadline is not None:
+            remaining = waiter.deadline - now
+            if remaining <= 0 or (wait != math.inf and wait > remaining):
+                self._remove(waiter)
+                self._shed(waiter, 'deadline', now)
+            wait = min(wait, remaining)
+        return wait
+
+    def _observe_wait(self, priority_name: str, waited: float):
+        get_metrics().observe('theta_scheduler_wait_seconds', waited, endpoint=self.endpoint, priority=priority_name)
+
+    def acquire(self, cost: float = 0, priority_name: str = DEFAULT, deadline_at: float = None) -> float:
+        """
+        Block until a request costing `cost` tokens may be sent; returns the seconds waited.
+        """
+        start = time.monotonic()
+        event = threading.Event()
+        with self._lock:
+            waiter = self._enqueue(cost, priority_name, deadline_at, event.set, start)
+        if waiter is None:
+            self._observe_wait(priority_name, 0.0)
+            return 0.0
+        try:
+            while True:
+                event.clear()
+                with self._lock:
+                    wait = self._poll(waiter, time.monotonic())
+                if wait is None:
+                    break
+                event.wait(None if wait == math.inf else wait)
+        except BaseException:
+            with self._lock:
+                self._remove(waiter)
+            raise
+        waited = time.monotonic() - start
+        self._observe_wait(priority_name, waited)
+        return waited
+
+    async def aacquire(self, cost: float = 0, priority_name: str = DEFAULT, deadline_at: float = None) -> float:
+        """
+        Async `acquire()`: waits on the running event loop instead of blocking a thread.
+        """
+        start = time.monotonic()
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        # Waiters are woken from whichever thread frees the head of the queue
+        wake = lambda: loop.call_soon_threadsafe(event.set)
+        with self._lock:
+            waiter = self._enqueue(cost, priority_name, deadline_at, wake, start)
+        if waiter is None:
+            self._observe_wait(priority_name, 0.0)
+            return 0.0
+        try:
+            while True:
+                event.clear()
+                with self._lock:
+                    wait = self._poll(waiter, time.monotonic())
+                if wait is None:
+                    break
+                try:
+                    await asyncio.wait_for(event.wait(), None if wait == math.inf else wait)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            with self._lock:
+                self._remove(waiter)
+            raise
+        waited = time.monotonic() - start
+        self._observe_wait(priority_name, waited)
+        return waited
+
+    def throttle(self, retry_after: float):
+        """
+        Hold every request to this endpoint for `retry_after` seconds, as the endpoint asked.
+        """
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+            self.throttled += 1
+            if self._waiters:
+                self._waiters[0].wake()
+        get_metrics().inc('theta_scheduler_throttled_total', endpoint=self.endpoint)
+        logger.warning(f"{self.endpoint} asked to retry after {retry_after:g}s, holding its queue")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            now = time.monotonic()
+            return {
+                "endpoint": self.endpoint,
+                "queued": len(self._waiters),
+                "queued_by_priority": {name: sum(1 for waiter in self._waiters if waiter.priority == name) for name in PRIORITIES},
+                "blocked_for": round(max(0.0, self.blocked_until - now), 3),
+                "admitted": self.admitted,
+                "shed": self.shed,
+                "throttled": self.throttled
+            }
+
+
+def parse_retry_after(value) -> Optional[float]:
+    """
+    Seconds to wait from a Retry-After header: delta-seconds or an HTTP date.
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError):
+        return None
+
+def estimate_request_tokens(body) -> int:
+    """
+    Rough token cost of a JSON LLM request: about four bytes per prompt token, plus the
+    completion tokens it asks for.
+    """
+    if not body:
+        return 0
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    tokens = (len(body) + 3) // 4
+    try:
+        payload = json.loads(body)
+    except (ValueError, UnicodeDecodeError):
+        return tokens
+    if isinstance(payload, dict):
+        tokens += int(payload.get('max_completion_tokens') or payload.get('max_tokens') or 0)
+    return tokens
+
+
+class Scheduler:
+    """
+    Admission control in front of every outbound call, with one `EndpointLimiter` per
+    upstream host. Limits come from `endpoints` (keyed by URL or host) or `default_limits`.
+    Each request waits at most `max_wait[priority]` seconds, or until an enclosing
+    `deadline()`, whichever is sooner.
+    """
+
+    def __init__(self, default_limits: Dict = None, endpoints: Dict[str, Dict] = None, max_queue: int = 64,
+                 max_wait: Dict[str, float] = None, max_retries: int = 2, default_retry_after: float = 1,
+                 max_retry_after: float = 60):
+        self.default_limits = dict(default_limits or {})
+        self.endpoint_limits = {endpoint_label(url): dict(limits or {}) for url, limits in (endpoints or {}).items()}
+        self.max_queue = max_queue
+        self.max_wait = {name: float(seconds) for name, seconds in (max_wait or {}).items()}
+        self.max_retries = max_retries
+        self.default_retry_after = default_retry_after
+        self.max_retry_after = max_retry_after
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def limiter(self, url) -> EndpointLimiter:
+        endpoint = endpoint_label(url)
+        limiter = self._limiters.get(endpoint)
+        if limiter is not None:
+            return limiter
+        with self._lock:
+            limiter = self._limiters.get(endpoint)
+            if limiter is None:
+                limits = {**self.default_limits, **self.endpoint_limits.get(endpoint, {})}
+                limiter = self._limiters[endpoint] = EndpointLimiter(
+                    endpoint,
+                    requests_per_second=float(limits.get("requests_per_second") or 0),
+                    burst=float(limits.get("burst") or 0) or None,
+                    tokens_per_minute=float(limits.get("tokens_per_minute") or 0),
+                    max_queue=int(limits.get("max_queue") or self.max_queue)
+                )
+            return limiter
+
+    def _admission(self):
+        priority_name = current_priority()
+        deadline_at = _deadline.get()
+        max_wait = self.max_wait.get(priority_name)
+        if max_wait:
+            budget = time.monotonic() + max_wait
+            deadline_at = budget if deadline_at is None else min(deadline_at, budget)
+        return priority_name, deadline_at
+
+    def admit(self, url, cost: float = 0) -> float:
+        """
+        Block until a request to `url` costing `cost` tokens may be sent, or raise RequestShed.
+        """
+        return self.limiter(url).acquire(cost, *self._admission())
+
+    async def aadmit(self, url, cost: float = 0) -> float:
+        return await self.limiter(url).aacquire(cost, *self._admission())
+
+    def record_response(self, url, status_code: int, headers) -> Optional[float]:
+        """
+        Pause the endpoint if the response is throttling; returns the Retry-After honoured, if any.
+        """
+        if status_code not in THROTTLE_STATUSES:
+            return None
+        retry_after = parse_retry_after(headers.get('Retry-After'))
+        if retry_after is None:
+            if status_code != 429:
+                return None
+            retry_after = self.default_retry_after
+        retry_after = min(retry_after, self.max_retry_after)
+        self.limiter(url).throttle(retry_after)
+        return retry_after
+
+    def stats(self) -> List[Dict]:
+        with self._lock:
+            limiters = list(self._limiters.values())
+        return [limiter.stats() for limiter in limiters]
+
+
+def _replayable(body) -> bool:
+    return body is None or isinstance(body, (bytes, str))
+
+def scheduling_adapter_class():
+    """
+    A requests HTTPAdapter that admits every request through the scheduler and retries
+    throttled responses (up to `max_retries`) once their Retry-After has passed.
+    """
+    from requests.adapters import HTTPAdapter
+
+    class SchedulingAdapter(HTTPAdapter):
+        def __init__(self, scheduler: Scheduler, *args, **kwargs):
+            self.scheduler = scheduler
+            super().__init__(*args, **kwargs)
+
+        def send(self, request, **kwargs):
+            self.scheduler.admit(request.url)
+            attempt = 0
+            while True:
+                response = super().send(request, **kwargs)
+                retry_after = self.scheduler.record_response(request.url, response.status_code, response.headers)
+                if retry_after is None or attempt >= self.scheduler.max_retries or not _replayable(request.body):
+                    return response
+                try:
+                    self.scheduler.admit(request.url)
+                except RequestShed:
+                    # Could not wait that long; the caller gets the endpoint's own answer
+                    return response
+                response.close()
+                attempt += 1
+
+    return SchedulingAdapter
+
+def _request_cost(scheduler: Scheduler, request) -> int:
+    if scheduler.limiter(request.url).tokens is None:
+        return 0
+    try:
+        return estimate_request_tokens(request.content)
+    except Exception:
+        # Streaming bodies cannot be sized up front
+        return 0
+
+def scheduling_transport(scheduler: Scheduler, is_async: bool = False, **transport_kwargs):
+    """
+    An httpx transport that admits every request through the scheduler. Throttled responses
+    pause the endpoint for every caller but are returned as they are: the OpenAI SDK, the
+    main httpx user, already retries them after their Retry-After. `transport_kwargs`
+    (e.g. `limits`) configure the wrapped connection pool.
+    """
+    import httpx
+
+    class SchedulingTransport(httpx.BaseTransport):
+        def __init__(self):
+            self._transport = httpx.HTTPTransport(**transport_kwargs)
+
+        def handle_request(self, request):
+            scheduler.admit(request.url, _request_cost(scheduler, request))
+            response = self._transport.handle_request(request)
+            scheduler.record_response(request.url, response.status_code, response.headers)
+            return response
+
+        def close(self):
+            self._transport.close()
+
+    class AsyncSchedulingTransport(httpx.AsyncBaseTransport):
+        def __init__(self):
+            self._transport = httpx.AsyncHTTPTransport(**transport_kwargs)
+
+        async def handle_async_request(self, request):
+            await scheduler.aadmit(request.url, _request_cost(scheduler, request))
+            response = await self._transport.handle_async_request(request)
+            scheduler.record_response(request.url, response.status_code, response.headers)
+            return response
+
+        async def aclose(self):
+            await self._transport.aclose()
+
+    return AsyncSchedulingTransport() if is_async else SchedulingTransport()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def scheduler_enabled() -> bool:
+    return config_bool(global_config["scheduler"]["enabled"])
+
+def get_scheduler() -> Optional[Scheduler]:
+    """
+    Return the process-wide scheduler built from the `scheduler` config section, or None
+    when it is disabled.
+    """
+    global _scheduler
+    if not scheduler_enabled():
+        return None
+    with _scheduler_lock:
+        if _scheduler is None:
+            config = global_config["scheduler"]
+            _scheduler = Scheduler(
+                default_limits={
+                    "requests_per_second": config["requests_per_second"],
+                    "burst": config["burst"],
+                    "tokens_per_minute": config["tokens_per_minute"]
+                },
+                endpoints=config["endpoints"],
+                max_queue=int(config["max_queue"]),
+                max_wait=config["max_wait"],
+                max_retries=int(config["max_retries"]),
+                default_retry_after=float(config["default_retry_after"]),
+                max_retry_after=float(config["max_retry_after"])
+            )
+        return _scheduler
+
+def set_scheduler(scheduler: Optional[Scheduler]):
+    """
+    Replace the process-wide scheduler, e.g. with custom limits in tests or benchmarks. None
+    re-reads the config. Pooled clients keep the scheduler they were built with.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = scheduler
+
+@contextlib.contextmanager
+def admitted(url):
+    """
+    Wait for admission to `url` before running the block, for clients whose HTTP stack
+    cannot be hooked (gradio_client). A no-op when the scheduler is disabled.
+    """
+    scheduler = get_scheduler()
+    if scheduler is not None:
+        scheduler.admit(url)
+    yield
+
+@contextlib.asynccontextmanager
+async def aadmitted(url):
+    scheduler = get_scheduler()
+    if scheduler is not None:
+        await scheduler.aadmit(url)
+    yield
+
+def scheduler_stats() -> List[Dict]:
+    """
+    Queue depth, Retry-After hold and counters of every endpoint the scheduler has seen.
+    """
+    with _scheduler_lock:
+        scheduler = _scheduler
+    return scheduler.stats() if scheduler is not None else []
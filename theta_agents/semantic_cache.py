@@ -0,0 +1,440 @@
+import atexit
+import itertools
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+from theta_agents.config.default_config import config_bool, global_config
+from theta_agents.metrics import get_metrics
+
+# NumPy is imported on first use so importing the package stays cheap
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Bumped when the layout of the saved index changes; older files are ignored
+_FORMAT_VERSION = 2
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+_SENTENCE_END = re.compile(r"[.!?:;\n]")
+
+# Words that do not change what is being asked, ignored when the hashing embedder compares key terms
+_FILLER_WORDS = frozenset((
+    'a', 'an', 'the', 'and', 'or', 'but', 'of', 'to', 'in', 'on', 'at', 'by', 'for', 'with', 'about',
+    'from', 'into', 'as', 'is', 'are', 'was', 'were', 'be', 'been', 'am', 'do', 'does', 'did', 'can',
+    'could', 'would', 'will', 'shall', 'should', 'may', 'might', 'i', 'me', 'my', 'we', 'us', 'our',
+    'you', 'your', 'it', 'its', 'this', 'that', 'these', 'those', 'there', 'here', 'some', 'any',
+    'please', 'kindly', 'just', 'so', 'also', 'then', 'hey', 'ok', 'okay', 'thanks', 'thank'
+))
+
+
+def normalize_text(text: str) -> str:
+    """
+    Lowercase words only, so inputs differing in case, punctuation or spacing match exactly.
+    """
+    return ' '.join(_WORD.findall(text.lower()))
+
+
+def key_terms(text: str) -> frozenset:
+    """
+    Numbers and names in `text`: words containing a digit, and capitalised words of two or
+    more letters that do not open a sentence. Inputs only match if these are the same, since
+    embeddings barely move when one of them changes ("deploy 5 tokens" vs "deploy 500 tokens").
+    """
+    terms = set()
+    opens_sentence = True
+    position = 0
+    for match in _WORD.finditer(text):
+        if _SENTENCE_END.search(text, position, match.start()):
+            opens_sentence = True
+        word = match.group()
+        if any(char.isdigit() for char in word) or (len(word) > 1 and word[0].isupper() and not opens_sentence):
+            terms.add(word.lower())
+        opens_sentence = False
+        position = match.end()
+    return frozenset(terms)
+
+
+class HashingEmbedder:
+    """
+    Offline embedding: words, word pairs and character trigrams hashed into `dim` signed
+    buckets and L2-normalised. It matches rewordings that share most of their words
+    (greetings, standard briefs); an embeddings endpoint also matches real paraphrases.
+
+    Similarity of hashed words says little about meaning: two long briefs differing in one
+    word still score high. Its key terms are therefore every word except fillers, so inputs
+    only match if they use the same words, in any order and with or without filler, and
+    the similarity threshold can be lower than for real embeddings.
+    """
+
+    default_threshold = 0.8
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def key_terms(self, text: str) -> frozenset:
+        return key_terms(text) | frozenset(word for word in _WORD.findall(text.lower()) if word not in _FILLER_WORDS)
+
+    def _features(self, text: str):
+        words = text.split()
+        for word in words:
+            yield word, 1.0
+            padded = f" {word} "
+            for start in range(len(padded) - 2):
+                yield '#' + padded[start:start + 3], 0.5
+        for first, second in zip(words, words[1:]):
+            yield f"{first} {second}", 1.0
+
+    def embed(self, text: str) -> 'np.ndarray':
+        import numpy as np
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, weight in self._features(text):
+            # crc32 rather than hash() so vectors stay the same across processes
+            digest = zlib.crc32(feature.encode('utf-8'))
+            vector[digest % self.dim] += weight if digest & 0x80000000 else -weight
+        return _unit(vector)
+
+
+class OpenAIEmbedder:
+    """
+    Embeddings from an OpenAI-compatible `/embeddings` endpoint.
+    """
+
+    default_threshold = 0.93
+
+    def __init__(self, endpoint: str, model: str, api_key: str = None):
+        self.endpoint = endpoint
+        self.model = model
+        self.api_key = api_key
+        self.name = f"openai-{model}"
+
+    def key_terms(self, text: str) -> frozenset:
+        return key_terms(text)
+
+    def embed(self, text: str) -> 'np.ndarray':
+        import numpy as np
+        from theta_agents.clients import get_client_registry
+        registry = get_client_registry()
+        with registry.lease(registry.get_openai_client(self.endpoint, self.api_key)) as client:
+            response = client.embeddings.create(model=self.model, input=[text])
+        return _unit(np.asarray(response.data[0].embedding, dtype=np.float32))
+
+
+def _unit(vector: 'np.ndarray') -> 'np.ndarray':
+    import numpy as np
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
+
+
+class _Entry:
+    __slots__ = ('scope', 'text', 'terms', 'response', 'created', 'row')
+
+    def __init__(self, scope, text, terms, response, created, row=None):
+        self.scope = scope
+        self.text = text
+        self.terms = terms
+        self.response = response
+        self.created = created
+        self.row = row
+
+
+class _ScopeIndex:
+    """
+    The vectors of one scope as rows of a matrix, searched with a single matrix-vector product.
+    """
+
+    def __init__(self, dim: int):
+        import numpy as np
+        self.vectors = np.zeros((16, dim), dtype=np.float32)
+        self.ids: List[int] = []
+
+    def add(self, entry_id: int, vector: 'np.ndarray') -> int:
+        import numpy as np
+        row = len(self.ids)
+        if row == len(self.vectors):
+            self.vectors = np.concatenate([self.vectors, np.zeros_like(self.vectors)])
+        self.vectors[row] = vector
+        self.ids.append(entry_id)
+        return row
+
+    def remove(self, row: int) -> Optional[int]:
+        """
+        Drop `row` by moving the last row into its place; returns the ID of the moved entry.
+        """
+        last = len(self.ids) - 1
+        moved = None
+        if row != last:
+            self.vectors[row] = self.vectors[last]
+            moved = self.ids[row] = self.ids[last]
+        self.ids.pop()
+        return moved
+
+    def search(self, vector: 'np.ndarray', threshold: float) -> List[int]:
+        """
+        IDs of the entries scoring at least `threshold`, best first.
+        """
+        import numpy as np
+        if not self.ids:
+            return []
+        scores = self.vectors[:len(self.ids)] @ vector
+        rows = np.flatnonzero(scores >= threshold)
+        return [self.ids[row] for row in rows[np.argsort(-scores[rows], kind='stable')]]
+
+
+class SemanticCache:
+    """
+    Responses of earlier agent turns, looked up by the meaning of the user input.
+
+    Inputs are embedded with `embedder` and compared by cosine similarity against the
+    entries of the same scope (persona, capabilities and model); the best match at or
+    above `threshold` (by default the embedder's `default_threshold`) whose key terms
+    (`embedder.key_terms`, by default numbers and names) are the same as the input's is
+    a hit. Identical inputs after `normalize_text` hit without being embedded. At most
+    `max_entries` are kept, least recently used first out, and entries older than `ttl`
+    seconds (0 for no limit) are dropped. With `path` set the index is written to
+    `<path>.npz` (vectors) and `<path>.json` (responses) at most every `save_interval`
+    seconds and at exit, and loaded again on start if it was built with
+    the same embedder.
+    """
+
+    def __init__(self, embedder, threshold: float = None, max_entries: int = 4096, ttl: float = 0,
+                 path: str = None, save_interval: float = 60):
+        self.embedder = embedder
+        self.threshold = threshold if threshold is not None else getattr(embedder, 'default_threshold', 0.9)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.save_interval = save_interval
+        self._entries: 'OrderedDict[int, _Entry]' = OrderedDict()
+        self._exact: Dict[Tuple[str, str], int] = {}
+        self._scopes: Dict[str, _ScopeIndex] = {}
+        self._ids = itertools.count()
+        self._lock = threading.RLock()
+        self._stats = {"hits": 0, "exact_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        if path:
+            self.load()
+
+    def _expired(self, entry: _Entry, now: float) -> bool:
+        return bool(self.ttl) and now - entry.created > self.ttl
+
+    def _drop(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        self._exact.pop((entry.scope, entry.text), None)
+        index = self._scopes[entry.scope]
+        moved = index.remove(entry.row)
+        if moved is not None:
+            self._entries[moved].row = entry.row
+        if not index.ids:
+            del self._scopes[entry.scope]
+        self._dirty = True
+
+    def _hit(self, entry_id: int, field: str) -> Dict:
+        self._entries.move_to_end(entry_id)
+        self._stats[field] += 1
+        get_metrics().inc('theta_semantic_cache_total', result='hit')
+        return dict(self._entries[entry_id].response)
+
+    def _miss(self):
+        self._stats["misses"] += 1
+        get_metrics().inc('theta_semantic_cache_total', result='miss')
+
+    def lookup(self, scope: str, text: str) -> Optional[Dict]:
+        """
+        Return a copy of the cached response for the closest earlier input in `scope`, or None.
+        """
+        key = normalize_text(text)
+        now = time.time()
+        with self._lock:
+            entry_id = self._exact.get((scope, key))
+            if entry_id is not None:
+                if not self._expired(self._entries[entry_id], now):
+                    return self._hit(entry_id, "exact_hits")
+                self._drop(entry_id)
+            if scope not in self._scopes:
+                self._miss()
+                return None
+        # Embedding may be a network call; the index can change meanwhile, so the search rechecks
+        vector = self.embedder.embed(key)
+        terms = self._key_terms(text)
+        with self._lock:
+            index = self._scopes.get(scope)
+            for entry_id in index.search(vector, self.threshold) if index is not None else []:
+                entry = self._entries[entry_id]
+                if self._expired(entry, now):
+                    self._drop(entry_id)
+                elif entry.terms == terms:
+                    return self._hit(entry_id, "hits")
+            self._miss()
+            return None
+
+    def _key_terms(self, text: str) -> frozenset:
+        return getattr(self.embedder, 'key_terms', key_terms)(text)
+
+    def store(self, scope: str, text: str, response: Dict):
+        """
+        Remember `response` as the answer to `text` in `scope`.
+        """
+        key = normalize_text(text)
+        if not key:
+            return
+        vector = self.embedder.embed(key)
+        terms = self._key_terms(text)
+        with self._lock:
+            self._add(scope, key, terms, dict(response), time.time(), vector)
+            self._stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+            due = self.path and time.monotonic() - self._saved_at >= self.save_interval
+        if due:
+            self.save()
+
+    def _add(self, scope: str, key: str, terms: frozenset, response: Dict, created: float, vector):
+        previous = self._exact.get((scope, key))
+        if previous is not None:
+            self._drop(previous)
+        entry_id = next(self._ids)
+        index = self._scopes.get(scope)
+        if index is None:
+            index = self._scopes[scope] = _ScopeIndex(len(vector))
+        self._entries[entry_id] = _Entry(scope, key, terms, response, created, index.add(entry_id, vector))
+        self._exact[(scope, key)] = entry_id
+        self._dirty = True
+
+    def _files(self) -> Tuple[str, str]:
+        return f"{self.path}.npz", f"{self.path}.json"
+
+    def save(self):
+        """
+        Write the index to disk if it changed since the last save.
+        """
+        import numpy as np
+        with self._lock:
+            self._saved_at = time.monotonic()
+            if not self.path or not self._dirty:
+                return
+            entries = list(self._entries.values())
+            vectors = np.stack([self._scopes[entry.scope].vectors[entry.row] for entry in entries]) if entries else np.zeros((0, 0), dtype=np.float32)
+            metadata = {
+                "version": _FORMAT_VERSION,
+                "embedder": self.embedder.name,
+                "entries": [[entry.scope, entry.text, sorted(entry.terms), entry.response, entry.created] for entry in entries]
+            }
+            self._dirty = False
+        vectors_path, metadata_path = self._files()
+        directory = os.path.dirname(vectors_path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        # Both files are replaced atomically; the JSON (written last) says which vectors belong to it
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.npz')
+        with os.fdopen(fd, 'wb') as file:
+            np.savez(file, vectors=vectors)
+        os.replace(tmp_path, vectors_path)
+        metadata["count"] = len(metadata["entries"])
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.json')
+        with os.fdopen(fd, 'w') as file:
+            json.dump(metadata, file)
+        os.replace(tmp_path, metadata_path)
+
+    def load(self):
+        """
+        Load a saved index, unless it is missing, unreadable or built with another embedder.
+        """
+        import numpy as np
+        vectors_path, metadata_path = self._files()
+        try:
+            with open(metadata_path) as file:
+                metadata = json.load(file)
+            with np.load(vectors_path) as data:
+                vectors = data["vectors"]
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable semantic cache at {self.path}: {e}")
+            return
+        if metadata.get("version") != _FORMAT_VERSION:
+            logger.info(f"Ignoring semantic cache at {self.path}, written by another version")
+            return
+        if metadata.get("embedder") != self.embedder.name or len(vectors) != metadata.get("count"):
+            logger.info(f"Ignoring semantic cache at {self.path}, built with {metadata.get('embedder')}")
+            return
+        now = time.time()
+        with self._lock:
+            for (scope, key, terms, response, created), vector in zip(metadata["entries"], vectors):
+                if not (self.ttl and now - created > self.ttl):
+                    self._add(scope, key, frozenset(terms), response, created, vector)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+            self._dirty = False
+        logger.info(f"Loaded {len(self._entries)} semantic cache entries from {self.path}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {**self._stats, "entries": len(self._entries), "scopes": len(self._scopes)}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._exact.clear()
+            self._scopes.clear()
+            self._dirty = True
+
+
+def semantic_cache_enabled() -> bool:
+    return config_bool(global_config["semantic_cache"]["enabled"])
+
+def first_turn_only() -> bool:
+    return config_bool(global_config["semantic_cache"]["first_turn_only"])
+
+def _build_embedder(config):
+    if config["embedding"] == 'openai':
+        from theta_agents.routing import parse_endpoints
+        endpoint = config["embedding_endpoint"] or parse_endpoints(global_config["llm_endpoint"])[0]
+        return OpenAIEmbedder(endpoint, config["embedding_model"], global_config.get("llm_api_key", None))
+    if config["embedding"] != 'hashing':
+        raise ValueError(f"Unknown semantic_cache.embedding {config['embedding']!r}, expected 'hashing' or 'openai'")
+    return HashingEmbedder(int(config["embedding_dim"]))
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_semantic_cache() -> Optional[SemanticCache]:
+    """
+    Return the process-wide semantic cache, or None when `semantic_cache.enabled` is off.
+    """
+    global _cache
+    if not semantic_cache_enabled():
+        return None
+    with _cache_lock:
+        if _cache is None:
+            config = global_config["semantic_cache"]
+            path = config["path"]
+            _cache = SemanticCache(
+                _build_embedder(config),
+                threshold=float(config["threshold"]) if config["threshold"] is not None else None,
+                max_entries=int(config["max_entries"]),
+                ttl=float(config["ttl"]),
+                path=os.path.expanduser(path) if path else None,
+                save_interval=float(config["save_interval"])
+            )
+            if _cache.path:
+                atexit.register(_cache.save)
+        return _cache
+
+def set_semantic_cache(cache: Optional[SemanticCache]):
+    """
+    Replace the process-wide cache, e.g. with an in-memory one in tests or benchmarks. None re-reads the config.
+    """
+    global _cache
+    with _cache_lock:
+        _cache = cache
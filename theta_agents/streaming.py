@@ -0,0 +1,135 @@
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+class IncrementalJSONParser:
+    """
+    Incremental parser for a single JSON object that reports the top-level string
+    values as they arrive, so `{"user_facing_text": "Hel` already yields "Hel".
+
+    `feed(text)` returns a list of `(key, delta)` pairs for the string fields listed
+    in `fields` (all top-level string fields when `fields` is None). Nested values are
+    skipped. Text after the closing brace is ignored.
+    """
+
+    def __init__(self, fields=None):
+        self.fields = set(fields) if fields is not None else None
+        self.values = {}
+        self.done = False
+        self._state = 'start'
+        self._key = []
+        self._current_key = None
+        self._escape = None
+        self._high_surrogate = None
+        self._depth = 0
+        self._nested_in_string = False
+        self._nested_escape = False
+
+    def _wanted(self, key):
+        return self.fields is None or key in self.fields
+
+    def feed(self, text: str) -> list:
+        deltas = []
+        chunk = []
+
+        def flush():
+            if chunk and self._wanted(self._current_key):
+                delta = ''.join(chunk)
+                self.values[self._current_key] = self.values.get(self._current_key, '') + delta
+                deltas.append((self._current_key, delta))
+            chunk.clear()
+
+        for char in text:
+            state = self._state
+            if state == 'done':
+                break
+            if state == 'start':
+                if char == '{':
+                    self._state = 'expect_key'
+            elif state == 'expect_key':
+                if char == '"':
+                    self._key = []
+                    self._state = 'key'
+                elif char == '}':
+                    self._state = 'done'
+                    self.done = True
+            elif state == 'key':
+                if self._escape is not None:
+                    self._key.append(_ESCAPES.get(char, char))
+                    self._escape = None
+                elif char == '\\':
+                    self._escape = ''
+                elif char == '"':
+                    self._current_key = ''.join(self._key)
+                    self._state = 'colon'
+                else:
+                    self._key.append(char)
+            elif state == 'colon':
+                if char == ':':
+                    self._state = 'value'
+            elif state == 'value':
+                if char == '"':
+                    if self._wanted(self._current_key):
+                        self.values.setdefault(self._current_key, '')
+                    self._state = 'string'
+                elif char in '{[':
+                    self._depth = 1
+                    self._state = 'nested'
+                elif not char.isspace():
+                    self._state = 'scalar'
+            elif state == 'string':
+                if self._escape is not None:
+                    if self._escape == '' and char != 'u':
+                        chunk.append(_ESCAPES.get(char, char))
+                        self._escape = None
+                    else:
+                        self._escape += char
+                        # \uXXXX may arrive split across chunks; wait for all four hex digits
+                        if len(self._escape) == 5:
+                            code = int(self._escape[1:], 16)
+                            self._escape = None
+                            if 0xD800 <= code <= 0xDBFF:
+                                self._high_surrogate = code
+                            elif 0xDC00 <= code <= 0xDFFF and self._high_surrogate is not None:
+                                chunk.append(chr(0x10000 + ((self._high_surrogate - 0xD800) << 10) + (code - 0xDC00)))
+                                self._high_surrogate = None
+                            else:
+                                chunk.append(chr(code))
+                elif char == '\\':
+                    self._escape = ''
+                elif char == '"':
+                    flush()
+                    self._state = 'after_value'
+                else:
+                    chunk.append(char)
+            elif state == 'nested':
+                if self._nested_in_string:
+                    if self._nested_escape:
+                        self._nested_escape = False
+                    elif char == '\\':
+                        self._nested_escape = True
+                    elif char == '"':
+                        self._nested_in_string = False
+                elif char == '"':
+                    self._nested_in_string = True
+                elif char in '{[':
+                    self._depth += 1
+                elif char in '}]':
+                    self._depth -= 1
+                    if self._depth == 0:
+                        self._state = 'after_value'
+            elif state == 'scalar':
+                if char == ',':
+                    self._state = 'expect_key'
+                elif char == '}':
+                    self._state = 'done'
+                    self.done = True
+            elif state == 'after_value':
+                if char == ',':
+                    self._state = 'expect_key'
+                elif char == '}':
+                    self._state = 'done'
+                    self.done = True
+        if self._state == 'string':
+            flush()
+        return deltas
+
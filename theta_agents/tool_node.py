@@ -0,0 +1,204 @@
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, List, Optional
+from langchain_core.messages import ToolMessage
+from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables.config import get_config_list
+from langgraph.prebuilt import ToolNode
+from langgraph.prebuilt.tool_node import TOOL_CALL_ERROR_TEMPLATE
+from theta_agents.config.default_config import global_config
+from theta_agents.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+
+def _positive(value) -> Optional[float]:
+    value = float(value or 0)
+    return value if value > 0 else None
+
+def tool_timeout(name: str) -> Optional[float]:
+    """
+    Seconds a call to tool `name` may run, per `tool_execution`; None for no limit.
+    """
+    config = global_config["tool_execution"]
+    return _positive((config.get("timeouts") or {}).get(name, config["timeout"]))
+
+def tool_concurrency(name: str) -> Optional[int]:
+    """
+    Cap on concurrent calls to tool `name`, per `tool_execution`; None for no cap. Sync calls
+    share one cap across the process, async calls one cap per event loop.
+    """
+    config = global_config["tool_execution"]
+    limit = (config.get("max_concurrency") or {}).get(name, config["default_max_concurrency"])
+    return int(limit) if _positive(limit) else None
+
+
+_semaphores = {}
+_semaphores_lock = threading.Lock()
+
+def _tool_semaphore(name: str, limit: int) -> threading.BoundedSemaphore:
+    # Keyed by the limit as well so a changed cap takes effect for new calls
+    with _semaphores_lock:
+        semaphore = _semaphores.get((name, limit))
+        if semaphore is None:
+            semaphore = _semaphores[(name, limit)] = threading.BoundedSemaphore(limit)
+        return semaphore
+
+# Per event loop, dropped with the loop. An asyncio semaphore can only be awaited on its own
+# loop, and waiting on the process-wide one would block the loop, so async caps are per loop
+_async_semaphores = weakref.WeakKeyDictionary()
+
+def _async_tool_semaphore(name: str, limit: int) -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    with _semaphores_lock:
+        # A contended semaphore references its loop, which would keep the weak key alive
+        for closed in [other for other in _async_semaphores if other.is_closed()]:
+            del _async_semaphores[closed]
+        semaphores = _async_semaphores.setdefault(loop, {})
+        semaphore = semaphores.get((name, limit))
+        if semaphore is None:
+            semaphore = semaphores[(name, limit)] = asyncio.Semaphore(limit)
+        return semaphore
+
+def _start_thread(fn) -> Future:
+    """
+    Run `fn` on its own daemon thread, so a call that outlives its timeout can be abandoned
+    without holding a worker or blocking interpreter exit.
+    """
+    future = Future()
+
+    def target():
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=contextvars.copy_context().run, args=(target,), daemon=True,
+                     name='theta-tool-call').start()
+    return future
+
+
+class ConcurrentToolNode(ToolNode):
+    """
+    Tools node that runs the tool calls of one AI message concurrently.
+
+    At most `tool_execution.max_parallel` calls of a message run at once, and each tool can
+    be capped and given a timeout. The cap holds process-wide for sync calls and per event
+    loop for async calls, so a service running every turn on one loop is capped process-wide. Results are returned in the order of the
+    tool calls, and a call that fails or times out becomes an error message without
+    affecting the others.
+    """
+
+    def _timeout_message(self, call, timeout: float) -> ToolMessage:
+        get_metrics().inc('theta_tool_timeouts_total', tool=call["name"])
+        logger.warning(f"Tool call {call['name']} ({call['id']}) timed out after {timeout:g}s")
+        return ToolMessage(f"Error: {call['name']} timed out after {timeout:g}s",
+                           name=call["name"], tool_call_id=call["id"], status="error")
+
+    def _error_message(self, call, error: BaseException) -> ToolMessage:
+        return ToolMessage(TOOL_CALL_ERROR_TEMPLATE.format(error=repr(error)),
+                           name=call["name"], tool_call_id=call["id"], status="error")
+
+    def _run_limited(self, call, config: RunnableConfig) -> ToolMessage:
+        name = call["name"]
+        if name not in self.tools_by_name:
+            return self._run_one(call, config)
+        limit, timeout = tool_concurrency(name), tool_timeout(name)
+        semaphore = _tool_semaphore(name, limit) if limit else None
+        if timeout is None:
+            if semaphore is not None:
+                semaphore.acquire()
+            try:
+                return self._run_one(call, config)
+            finally:
+                if semaphore is not None:
+                    semaphore.release()
+
+        # Waiting for a slot counts against the timeout, so hung calls holding every slot can't block the turn
+        deadline = time.monotonic() + timeout
+        if semaphore is not None and not semaphore.acquire(timeout=timeout):
+            return self._timeout_message(call, timeout)
+        future = _start_thread(lambda: self._run_one(call, config))
+        if semaphore is not None:
+            # An abandoned call keeps its slot until it really finishes, so the cap still holds upstream
+            future.add_done_callback(lambda _: semaphore.release())
+        try:
+            return future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            return self._timeout_message(call, timeout)
+
+    def _collect(self, tool_calls, results: List) -> List[ToolMessage]:
+        outputs = []
+        for call, result in zip(tool_calls, results):
+            if isinstance(result, BaseException):
+                if not self.handle_tool_errors:
+                    raise result
+                result = self._error_message(call, result)
+            outputs.append(result)
+        return outputs
+
+    def _func(self, input, config: RunnableConfig, *, store) -> Any:
+        tool_calls, output_type = self._parse_input(input, store)
+        config_list = get_config_list(config, len(tool_calls))
+        workers = min(len(tool_calls), int(global_config["tool_execution"]["max_parallel"]) or len(tool_calls))
+        results: List = [None] * len(tool_calls)
+        if workers <= 1:
+            for index, (call, call_config) in enumerate(zip(tool_calls, config_list)):
+                try:
+                    results[index] = self._run_limited(call, call_config)
+                except Exception as e:
+                    results[index] = e
+        else:
+            executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='theta-tools')
+            try:
+                futures = [executor.submit(contextvars.copy_context().run, self._run_limited, call, call_config)
+                           for call, call_config in zip(tool_calls, config_list)]
+                # Every call is awaited, so one failure never cuts the others short
+                for index, future in enumerate(futures):
+                    try:
+                        results[index] = future.result()
+                    except Exception as e:
+                        results[index] = e
+            finally:
+                executor.shutdown(wait=False)
+        outputs = self._collect(tool_calls, results)
+        return outputs if output_type == "list" else {"messages": outputs}
+
+    async def _arun_limited(self, call, config: RunnableConfig, parallel: asyncio.Semaphore) -> ToolMessage:
+        name = call["name"]
+        async with parallel:
+            if name not in self.tools_by_name:
+                return await self._arun_one(call, config)
+            limit, timeout = tool_concurrency(name), tool_timeout(name)
+            semaphore = _async_tool_semaphore(name, limit) if limit else None
+
+            async def run():
+                if semaphore is None:
+                    return await self._arun_one(call, config)
+                async with semaphore:
+                    return await self._arun_one(call, config)
+
+            if timeout is None:
+                return await run()
+            try:
+                # Waiting for a slot counts against the timeout as well
+                return await asyncio.wait_for(run(), timeout)
+            except asyncio.TimeoutError:
+                return self._timeout_message(call, timeout)
+
+    async def _afunc(self, input, config: RunnableConfig, *, store) -> Any:
+        tool_calls, output_type = self._parse_input(input, store)
+        config_list = get_config_list(config, len(tool_calls))
+        max_parallel = int(global_config["tool_execution"]["max_parallel"]) or len(tool_calls) or 1
+        parallel = asyncio.Semaphore(max_parallel)
+        results = await asyncio.gather(
+            *(self._arun_limited(call, call_config, parallel) for call, call_config in zip(tool_calls, config_list)),
+            return_exceptions=True
+        )
+        outputs = self._collect(tool_calls, results)
+        return outputs if output_type == "list" else {"messages": outputs}
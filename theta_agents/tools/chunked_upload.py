@@ -0,0 +1,424 @@
+import contextlib
+import contextvars
+import hashlib
+import itertools
+import json
+import logging
+import mmap
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from theta_agents.clients import get_client_registry
+from theta_agents.config.default_config import config_bool, global_config
+from theta_agents.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+_progress_callback = contextvars.ContextVar('theta_agents_upload_progress', default=None)
+
+@contextlib.contextmanager
+def upload_progress(callback):
+    """
+    Report progress of uploads started inside this block to
+    `callback(bytes_sent, total_bytes, bytes_per_second)`.
+    """
+    token = _progress_callback.set(callback)
+    try:
+        yield
+    finally:
+        _progress_callback.reset(token)
+
+
+class UploadError(Exception):
+    def __init__(self, message: str, status_code: int = None):
+        super().__init__(message)
+        # HTTP status of the response that failed the upload, if there was one
+        self.status_code = status_code
+
+
+class SourceRefusedError(UploadError):
+    """
+    The URL an upload streams from answered with a client error; retrying will not help.
+    """
+
+
+class _Progress:
+    def __init__(self, total, initial=0, callback=None):
+        self.total = total
+        self.sent = initial
+        self.callback = callback
+        self._initial = initial
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def advance(self, nbytes):
+        with self._lock:
+            self.sent += nbytes
+            sent = self.sent
+        if self.callback is not None:
+            elapsed = max(time.monotonic() - self._started, 1e-6)
+            self.callback(sent, self.total, (sent - self._initial) / elapsed)
+
+
+class UploadJournal:
+    """
+    Local record of the chunks of one upload that the server has acknowledged.
+
+    The journal is keyed by the file's path, size and mtime plus a caller-chosen scope,
+    so a restarted upload of the same unchanged file picks up where it stopped.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.state = {"completed": [], "metadata": {}}
+        with contextlib.suppress(FileNotFoundError, ValueError):
+            with open(path, 'r') as file:
+                self.state = json.load(file)
+
+    @classmethod
+    def for_file(cls, journal_dir: str, filepath: str, scope: str) -> 'UploadJournal':
+        stat = os.stat(filepath)
+        identity = f"{scope}|{os.path.abspath(filepath)}|{stat.st_size}|{stat.st_mtime_ns}"
+        os.makedirs(journal_dir, exist_ok=True)
+        return cls(os.path.join(journal_dir, hashlib.sha256(identity.encode('utf-8')).hexdigest() + '.json'))
+
+    @property
+    def metadata(self) -> dict:
+        return self.state["metadata"]
+
+    @property
+    def completed(self) -> set:
+        return set(self.state["completed"])
+
+    def update_metadata(self, **values):
+        with self._lock:
+            self.state["metadata"].update(values)
+            self._write()
+
+    def reset(self):
+        with self._lock:
+            self.state["completed"] = []
+            self._write()
+
+    def mark_done(self, index: int):
+        with self._lock:
+            if index not in self.state["completed"]:
+                self.state["completed"].append(index)
+                self._write()
+
+    def _write(self):
+        directory = os.path.dirname(self.path)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as file:
+            json.dump(self.state, file)
+        os.replace(tmp_path, self.path)
+
+    def delete(self):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.path)
+
+
+class _MmapReader:
+    """
+    File-like view over (buffer, start, end) ranges of a memory map so requests can
+    stream it with a known Content-Length while only holding one read block in memory.
+    """
+
+    def __init__(self, parts, progress=None):
+        self._parts = parts
+        self._index = 0
+        self._offset = parts[0][1] if parts else 0
+        self._length = sum(end - start for _, start, end in parts)
+        self._progress = progress
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self._length
+        out = []
+        while size > 0 and self._index < len(self._parts):
+            buffer, _, end = self._parts[self._index]
+            data = buffer[self._offset:min(self._offset + size, end)]
+            self._offset += len(data)
+            size -= len(data)
+            out.append(data)
+            if self._offset >= end:
+                self._index += 1
+                if self._index < len(self._parts):
+                    self._offset = self._parts[self._index][1]
+        data = b''.join(out)
+        if self._progress is not None and data:
+            self._progress.advance(len(data))
+        return data
+
+
+class _StreamReader:
+    """
+    File-like view over an iterable of byte chunks of known total length, so a body
+    received from one server can be sent to another without being held in memory.
+    """
+
+    def __init__(self, chunks, length, progress=None):
+        self._chunks = iter(chunks)
+        self._chunk = b''
+        self._offset = 0
+        self._length = length
+        self._progress = progress
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self._length
+        out = []
+        while size > 0:
+            if self._offset >= len(self._chunk):
+                chunk = next(self._chunks, None)
+                if chunk is None:
+                    break
+                self._chunk, self._offset = chunk, 0
+                continue
+            data = self._chunk[self._offset:self._offset + size]
+            self._offset += len(data)
+            size -= len(data)
+            out.append(data)
+        data = b''.join(out)
+        if self._progress is not None and data:
+            self._progress.advance(len(data))
+        return data
+
+
+def is_url(source) -> bool:
+    return isinstance(source, str) and urlsplit(source).scheme in ('http', 'https')
+
+def url_filename(url: str, default: str = 'upload') -> str:
+    return os.path.basename(urlsplit(url).path).replace('"', '') or default
+
+
+class ChunkedUploader:
+    """
+    Upload engine that reads files through a memory map in fixed-size chunks.
+
+    Chunks are sent as `Content-Range` PUTs, sequentially by default or concurrently when
+    `parallel` is set for backends that accept out-of-order ranges. Each chunk is retried
+    with exponential backoff and recorded in an `UploadJournal` once acknowledged, so at
+    most `max_workers` chunks are held in memory regardless of file size.
+    """
+
+    def __init__(self, session=None, chunk_size: int = 8 * 1024 * 1024, max_workers: int = 4,
+                 max_retries: int = 5, backoff: float = 0.5, parallel: bool = False,
+                 spool_max_bytes: int = 64 * 1024 * 1024, read_block: int = 1024 * 1024):
+        self.session = session or get_client_registry().get_session('uploads')
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers if parallel else 1
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.parallel = parallel
+        self.spool_max_bytes = spool_max_bytes
+        self.read_block = read_block
+
+    def _with_retries(self, description, send):
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = send()
+                if response.status_code < 500 and response.status_code != 429:
+                    return response
+                error = UploadError(f"{description}: HTTP {response.status_code}", response.status_code)
+            except SourceRefusedError:
+                raise
+            except Exception as e:
+                error = e
+            if attempt == self.max_retries:
+                get_metrics().inc('theta_errors_total', source='upload')
+                raise error
+            get_metrics().inc('theta_retries_total', operation='upload')
+            delay = self.backoff * (2 ** attempt)
+            logger.info(f"Retrying {description} in {delay:.1f}s after: {error}")
+            time.sleep(delay)
+
+    def upload(self, filepath: str, url: str, headers: dict = None, journal: UploadJournal = None) -> bool:
+        """
+        Upload `filepath` to `url` in chunks. Returns True once every chunk is acknowledged.
+        """
+        headers = dict(headers or {})
+        total = os.path.getsize(filepath)
+        if total == 0:
+            response = self._with_retries("empty upload", lambda: self.session.put(url, headers=headers, data=b''))
+            return response.status_code in (200, 201)
+
+        chunk_count = (total + self.chunk_size - 1) // self.chunk_size
+        if journal is not None:
+            # Chunks acknowledged for another URL or chunk size cannot be reused
+            if journal.metadata.get("chunk_url") != url or journal.metadata.get("chunk_size") != self.chunk_size:
+                journal.reset()
+                journal.update_metadata(chunk_url=url, chunk_size=self.chunk_size)
+        completed = journal.completed if journal is not None else set()
+        pending = [index for index in range(chunk_count) if index not in completed]
+        initial = sum(min(self.chunk_size, total - index * self.chunk_size) for index in completed)
+        progress = _Progress(total, initial, _progress_callback.get())
+
+        with open(filepath, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            def send_chunk(index):
+                start = index * self.chunk_size
+                end = min(start + self.chunk_size, total) - 1
+                chunk_headers = dict(headers, **{'Content-Range': f"bytes {start}-{end}/{total}"})
+
+                def send():
+                    body = _MmapReader([(mm, start, end + 1)])
+                    return self.session.put(url, headers=chunk_headers, data=body)
+
+                response = self._with_retries(f"chunk {index + 1}/{chunk_count}", send)
+                # 308 is the resumable-upload "chunk received, send the next one" reply
+                if response.status_code not in (200, 201, 204, 308):
+                    raise UploadError(f"Chunk {index + 1}/{chunk_count} rejected: HTTP {response.status_code}", response.status_code)
+                if not self.parallel and response.status_code != 308 and index != chunk_count - 1:
+                    raise UploadError("Backend completed the upload before the last chunk; it does not support ranged uploads")
+                if journal is not None:
+                    journal.mark_done(index)
+                progress.advance(end - start + 1)
+
+            if self.max_workers > 1:
+                with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                    # Chunks are scheduled with the caller's priority class and deadline
+                    for future in [executor.submit(contextvars.copy_context().run, send_chunk, index) for index in pending]:
+                        future.result()
+            else:
+                for index in pending:
+                    send_chunk(index)
+
+        if journal is not None:
+            journal.delete()
+        return True
+
+    def upload_stream(self, filepath: str, url: str, method: str = 'PUT', headers: dict = None) -> 'requests.Response':
+        """
+        Send the whole file in one request, streamed from a memory map.
+        For backends that do not accept ranged chunks; the request is retried as a whole.
+        """
+        callback = _progress_callback.get()
+        with open(filepath, 'rb') as file:
+            total = os.fstat(file.fileno()).st_size
+            if total == 0:
+                return self._with_retries("upload", lambda: self.session.request(method, url, headers=headers, data=b''))
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                def send():
+                    body = _MmapReader([(mm, 0, total)], _Progress(total, 0, callback))
+                    return self.session.request(method, url, headers=headers, data=body)
+                return self._with_retries("upload", send)
+
+    def upload_multipart(self, filepath: str, url: str, field: str = 'file', headers: dict = None) -> 'requests.Response':
+        """
+        POST the file as multipart/form-data without loading it into memory.
+        """
+        callback = _progress_callback.get()
+        boundary = uuid.uuid4().hex
+        filename = os.path.basename(filepath).replace('"', '')
+        preamble = (
+            f"--{boundary}\r\n"
+            f"Content-Disposition: form-data; name=\"{field}\"; filename=\"{filename}\"\r\n"
+            "Content-Type: application/octet-stream\r\n\r\n"
+        ).encode('utf-8')
+        epilogue = f"\r\n--{boundary}--\r\n".encode('utf-8')
+        headers = dict(headers or {}, **{'Content-Type': f"multipart/form-data; boundary={boundary}"})
+
+        with open(filepath, 'rb') as file:
+            total = os.fstat(file.fileno()).st_size
+            mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if total else None
+            try:
+                parts = [(preamble, 0, len(preamble)), (mm if mm is not None else b'', 0, total), (epilogue, 0, len(epilogue))]
+
+                def send():
+                    body = _MmapReader(parts, _Progress(len(preamble) + total + len(epilogue), 0, callback))
+                    return self.session.post(url, headers=headers, data=body)
+                return self._with_retries("multipart upload", send)
+            finally:
+                if mm is not None:
+                    mm.close()
+
+
+    @contextlib.contextmanager
+    def _open_source(self, source_url: str):
+        """
+        Open `source_url` for streaming and yield (chunks, length). Bodies without a usable
+        Content-Length are spooled, in memory up to `spool_max_bytes`, so their length is known.
+        """
+        origin = '{0.scheme}://{0.netloc}'.format(urlsplit(source_url))
+        response = get_client_registry().get_session(origin).get(source_url, stream=True)
+        try:
+            if 400 <= response.status_code < 500 and response.status_code not in (408, 429):
+                raise SourceRefusedError(f"{source_url}: HTTP {response.status_code}")
+            response.raise_for_status()
+            length = response.headers.get('Content-Length')
+            if length is not None and response.headers.get('Content-Encoding', 'identity') == 'identity':
+                yield response.iter_content(self.read_block), int(length)
+                return
+            with tempfile.SpooledTemporaryFile(max_size=self.spool_max_bytes) as spool:
+                for block in response.iter_content(self.read_block):
+                    spool.write(block)
+                length = spool.tell()
+                spool.seek(0)
+                yield iter(lambda: spool.read(self.read_block), b''), length
+        finally:
+            response.close()
+
+    def upload_stream_from_url(self, source_url: str, url: str, method: str = 'PUT', headers: dict = None) -> 'requests.Response':
+        """
+        Send the body of `source_url` to `url` in one request as it is downloaded.
+        The download is restarted whenever the upload is retried.
+        """
+        callback = _progress_callback.get()
+
+        def send():
+            with self._open_source(source_url) as (chunks, length):
+                body = _StreamReader(chunks, length, _Progress(length, 0, callback))
+                return self.session.request(method, url, headers=headers, data=body)
+        return self._with_retries("upload", send)
+
+    def upload_multipart_from_url(self, source_url: str, url: str, field: str = 'file', headers: dict = None) -> 'requests.Response':
+        """
+        POST the body of `source_url` as multipart/form-data as it is downloaded.
+        """
+        callback = _progress_callback.get()
+        boundary = uuid.uuid4().hex
+        preamble = (
+            f"--{boundary}\r\n"
+            f"Content-Disposition: form-data; name=\"{field}\"; filename=\"{url_filename(source_url)}\"\r\n"
+            "Content-Type: application/octet-stream\r\n\r\n"
+        ).encode('utf-8')
+        epilogue = f"\r\n--{boundary}--\r\n".encode('utf-8')
+        headers = dict(headers or {}, **{'Content-Type': f"multipart/form-data; boundary={boundary}"})
+
+        def send():
+            with self._open_source(source_url) as (chunks, length):
+                total = len(preamble) + length + len(epilogue)
+                body = _StreamReader(itertools.chain([preamble], chunks, [epilogue]), total, _Progress(total, 0, callback))
+                return self.session.post(url, headers=headers, data=body)
+        return self._with_retries("multipart upload", send)
+
+
+def get_uploader(**overrides) -> ChunkedUploader:
+    """
+    Build an uploader from the `uploads` section of `global_config`.
+    """
+    config = global_config["uploads"]
+    options = {
+        "chunk_size": int(float(config["chunk_size_mb"]) * 1024 * 1024),
+        "max_workers": int(config["max_workers"]),
+        "max_retries": int(config["max_retries"]),
+        "backoff": float(config["backoff"]),
+        "parallel": config_bool(config["parallel_chunks"]),
+        "spool_max_bytes": int(float(config["url_spool_mb"]) * 1024 * 1024)
+    }
+    options.update(overrides)
+    return ChunkedUploader(**options)
+
+def get_journal(filepath: str, scope: str) -> UploadJournal:
+    return UploadJournal.for_file(os.path.expanduser(global_config["uploads"]["journal_dir"]), filepath, scope)
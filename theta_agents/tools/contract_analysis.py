@@ -0,0 +1,304 @@
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+from theta_agents.config.default_config import global_config
+from theta_agents.context import count_text_tokens
+from theta_agents.metrics import get_metrics
+from theta_agents.result_cache import ResultCache, normalize_prompt
+from theta_agents.tools.solidity_compiler import SOLC_VERSION, _ensure_solc, get_compilation_cache
+
+logger = logging.getLogger(__name__)
+
+TOOL_NAME = 'analyze_smart_contract'
+
+UNIT_SYSTEM_PROMPT = """
+    Analyze the given part of a smart contract for any security vulnerabilities, refactoring, or other issues. The contract outline is only there for reference; report issues in the given part only. Return nothing but the analysis in the text form"""
+
+_FENCE = re.compile(r"```[\w-]*\n(.*?)```", re.S)
+_SOURCE_START = re.compile(r"^[ \t]*(//\s*SPDX|pragma\s+solidity|import\s|(abstract\s+)?contract\s+\w|library\s+\w|interface\s+\w)", re.M)
+# String literals are matched first so comment markers inside them are left alone
+_COMMENT = re.compile(r"(\"(?:\\.|[^\"\\\n])*\"|'(?:\\.|[^'\\\n])*')|//[^\n]*|/\*.*?\*/", re.S)
+_VERSION_PRAGMA = re.compile(r"pragma\s+solidity[^;]*;")
+_BODY_MEMBERS = ('FunctionDefinition', 'ModifierDefinition')
+
+
+def normalize_solidity(source: str) -> str:
+    """
+    Drop comments and collapse whitespace, so edits to either do not invalidate cached findings.
+    """
+    return ' '.join(_COMMENT.sub(lambda match: match.group(1) or ' ', source).split())
+
+
+def extract_source(prompt: str):
+    """
+    Split a tool prompt into the request text around the code and the Solidity source itself.
+    """
+    blocks = _FENCE.findall(prompt)
+    if blocks:
+        return _FENCE.sub('', prompt).strip(), '\n'.join(blocks)
+    match = _SOURCE_START.search(prompt)
+    if match is None:
+        return '', prompt
+    return prompt[:match.start()].strip(), prompt[match.start():]
+
+
+class AnalysisUnit:
+    """
+    One contract-level declaration block, function or modifier, analyzed on its own.
+    `context` outlines the enclosing contract (declarations and signatures) for reference.
+    """
+
+    def __init__(self, name: Optional[str], source: str, context: str = ''):
+        self.name = name
+        self.source = source
+        self.context = context
+        self.key = None
+
+    def prompt(self, request: str) -> str:
+        parts = [request] if request else []
+        if self.context:
+            parts.append(f"Outline of the contract:\n```solidity\n{self.context}\n```")
+        parts.append(f"Analyze this part of the contract:\n```solidity\n{self.source}\n```")
+        return '\n\n'.join(parts)
+
+
+def _slice(data: bytes, src: str, end_src: str = None) -> str:
+    start, length = (int(value) for value in src.split(':')[:2])
+    end = int(end_src.split(':')[0]) if end_src else start + length
+    return data[start:end].decode('utf-8', errors='replace').strip()
+
+
+def _statement(text: str) -> str:
+    # Declaration nodes such as state variables do not include their semicolon
+    return text if text.endswith((';', '}')) else text + ';'
+
+
+def _contract_units(node, data: bytes) -> List[dict]:
+    name = node["name"]
+    with_body = [member for member in node["nodes"] if member["nodeType"] in _BODY_MEMBERS and member.get("body")]
+    if node.get("contractKind") == 'interface' or not with_body:
+        return [{"name": f"{node.get('contractKind', 'contract')} {name}", "source": _slice(data, node["src"]), "context": ''}]
+
+    start = int(node["src"].split(':')[0])
+    header = data[start:data.index(b'{', start) + 1].decode('utf-8', errors='replace').strip()
+    declarations = [_statement(_slice(data, member["src"])) for member in node["nodes"] if member not in with_body]
+    signatures = [_statement(_slice(data, member["src"], member["body"]["src"])) for member in with_body]
+    outline = '\n'.join([header] + ['    ' + line for line in declarations + signatures] + ['}'])
+
+    units = []
+    if declarations:
+        units.append({"name": f"{name} state and declarations",
+                      "source": '\n'.join([header] + ['    ' + line for line in declarations] + ['}']), "context": ''})
+    for member in with_body:
+        label = member.get("name") or member.get("kind", 'function')
+        units.append({"name": f"{name}.{label}", "source": _slice(data, member["src"]), "context": outline})
+    return units
+
+
+def _split(source: str, solc_version: str) -> dict:
+    from solcx import compile_standard
+    # Only the syntax tree is needed, so imports are not resolved and the version pragma is blanked
+    # out (keeping byte offsets) rather than installing the compiler each file asks for
+    parseable = _VERSION_PRAGMA.sub(lambda match: ' ' * len(match.group(0)), source)
+    output = compile_standard({
+        "language": "Solidity",
+        "sources": {"contract.sol": {"content": parseable}},
+        "settings": {"stopAfter": "parsing", "outputSelection": {"*": {"": ["ast"]}}}
+    }, solc_version=solc_version)
+    ast = output["sources"]["contract.sol"]["ast"]
+    data = source.encode('utf-8')
+
+    units, file_scope = [], []
+    for node in ast["nodes"]:
+        if node["nodeType"] == 'ContractDefinition':
+            units.extend(_contract_units(node, data))
+        elif node["nodeType"] not in ('PragmaDirective', 'ImportDirective'):
+            file_scope.append(_statement(_slice(data, node["src"])))
+    if file_scope:
+        units.insert(0, {"name": "file scope", "source": '\n'.join(file_scope), "context": ''})
+    return {"units": units}
+
+
+_parser_error = None
+
+def split_contract(source: str) -> Optional[List[AnalysisUnit]]:
+    """
+    Split Solidity source into analysis units using the solc syntax tree, or return None
+    when it cannot be parsed. Splits are kept in the compilation cache.
+    """
+    global _parser_error
+    if _parser_error is not None:
+        return None
+    cache = get_compilation_cache()
+    key = cache.make_key(source, SOLC_VERSION, {"output": "analysis_units"})
+    try:
+        solc_version = _ensure_solc()
+    except Exception as e:
+        # e.g. offline without an installed compiler; not retried on every call
+        _parser_error = e
+        logger.warning(f"Analyzing contracts as a whole, solc is not available: {e}")
+        return None
+    try:
+        units = cache.get_or_compile(key, lambda: _split(source, solc_version))["units"]
+    except Exception as e:
+        logger.warning(f"Analyzing the contract as a whole, it could not be parsed: {e}")
+        return None
+    return [AnalysisUnit(unit["name"], unit["source"], unit["context"]) for unit in units] or None
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_analysis_cache() -> ResultCache:
+    """
+    Return the process-wide cache of findings per analysis unit.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            config = global_config["capabilities"]["smart_contract_tools"]["analyze_smart_contract"]
+            sqlite_path = config["cache_sqlite_path"]
+            _cache = ResultCache(
+                max_entries=int(config["cache_max_entries"]),
+                default_ttl=float(config["cache_ttl"]),
+                sqlite_path=os.path.expanduser(sqlite_path) if sqlite_path else None
+            )
+        return _cache
+
+
+class ContractAnalysis:
+    """
+    Incremental analysis of one `analyze_smart_contract` prompt.
+
+    The source is split into units with `split_contract` and the findings for each unit
+    are cached under a hash of its normalized source, its contract outline, the request
+    and the model. Only units without cached findings are sent, one request each, at most
+    `max_concurrency` at a time. Once the prompts sent in one call would exceed
+    `token_budget` tokens (0 for no limit) the remaining units are left for the next call.
+    Source that cannot be parsed is analyzed as a whole, as a single unit.
+    """
+
+    def __init__(self, config: dict, prompt: str):
+        self.config = config
+        self.max_concurrency = max(1, int(config["max_concurrency"]))
+        self.cache = get_analysis_cache()
+        request, source = extract_source(prompt)
+        units = split_contract(source)
+        if units is None:
+            # The original prompt, with the original system prompt
+            self.request, self.units, self.whole = '', [AnalysisUnit(None, prompt)], True
+        else:
+            self.request, self.units, self.whole = request, units, False
+        self.findings = {}
+        self.errors = {}
+        self.pending, self.skipped = [], []
+        self.cached = 0
+        self._plan(int(config["token_budget"] or 0))
+
+    def _key(self, unit: AnalysisUnit) -> str:
+        payload = json.dumps([normalize_prompt(self.request), normalize_solidity(unit.context),
+                              normalize_solidity(unit.source), self.whole])
+        return self.cache.make_key(TOOL_NAME, self.config.get("model_name"), self.config.get("edgecloud_endpoint"), payload)
+
+    def _prompt(self, unit: AnalysisUnit):
+        if self.whole:
+            return unit.source, None
+        return unit.prompt(self.request), UNIT_SYSTEM_PROMPT
+
+    def _plan(self, budget: int):
+        spent = 0
+        for index, unit in enumerate(self.units):
+            unit.key = self._key(unit)
+            hit, findings = self.cache.get(TOOL_NAME, unit.key)
+            if hit:
+                self.findings[index] = findings
+                self.cached += 1
+                continue
+            tokens = count_text_tokens(self._prompt(unit)[0], self.config.get("model_name") or '')
+            # The first changed unit is always sent, so every call makes progress
+            if budget and self.pending and spent + tokens > budget:
+                self.skipped.append(index)
+                continue
+            spent += tokens
+            self.pending.append(index)
+        metrics = get_metrics()
+        metrics.inc('theta_contract_analysis_units_total', self.cached, result='cached')
+        metrics.inc('theta_contract_analysis_units_total', len(self.skipped), result='deferred')
+
+    def _record(self, index: int, findings=None, error: Exception = None):
+        if error is None and isinstance(findings, str) and not findings.startswith('Error'):
+            self.findings[index] = findings
+            self.cache.set(TOOL_NAME, self.units[index].key, findings)
+            get_metrics().inc('theta_contract_analysis_units_total', result='analyzed')
+            return
+        self.errors[index] = error or RuntimeError(findings or 'empty analysis')
+        logger.error(f"Failed to analyze {self.units[index].name or 'the contract'}: {self.errors[index]}")
+        get_metrics().inc('theta_contract_analysis_units_total', result='failed')
+
+    def run(self, complete: Callable[[str, Optional[str]], str]):
+        """
+        Analyze the pending units with `complete(prompt, system_prompt)`; a None system prompt
+        means the tool's default one.
+        """
+        def analyze(index):
+            try:
+                self._record(index, complete(*self._prompt(self.units[index])))
+            except Exception as e:
+                self._record(index, error=e)
+
+        if len(self.pending) <= 1:
+            for index in self.pending:
+                analyze(index)
+            return
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(self.pending))) as executor:
+            list(executor.map(lambda index: contextvars.copy_context().run(analyze, index), self.pending))
+
+    async def arun(self, complete):
+        """
+        Async counterpart of `run`; `complete` is a coroutine function.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def analyze(index):
+            async with semaphore:
+                try:
+                    self._record(index, await complete(*self._prompt(self.units[index])))
+                except Exception as e:
+                    self._record(index, error=e)
+
+        await asyncio.gather(*(analyze(index) for index in self.pending))
+
+    def report(self) -> str:
+        """
+        Merge the findings of every unit into one report. Raises the first error when nothing could be analyzed.
+        """
+        if not self.findings:
+            raise next(iter(self.errors.values()), RuntimeError('nothing to analyze'))
+        if len(self.units) == 1:
+            return self.findings[0]
+        sections = []
+        for index, unit in enumerate(self.units):
+            if index in self.findings:
+                sections.append(f"## {unit.name}\n{self.findings[index].strip()}")
+            elif index in self.errors:
+                sections.append(f"## {unit.name}\nNot analyzed: the request failed.")
+        summary = f"Analyzed {len(self.findings)} of {len(self.units)} parts ({self.cached} unchanged since an earlier analysis)."
+        if self.skipped:
+            names = ', '.join(self.units[index].name for index in self.skipped)
+            summary += f" Not analyzed yet to stay within the token budget: {names}. Analyze the contract again to continue."
+        if self.errors:
+            summary += " Some parts failed and can be analyzed again."
+        return '\n\n'.join(sections + [summary])
+
+    @classmethod
+    async def acreate(cls, config: dict, prompt: str) -> 'ContractAnalysis':
+        # Parsing and cache lookups block; keep them off the event loop
+        return await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(contextvars.copy_context().run, cls, config, prompt))
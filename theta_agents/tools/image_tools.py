@@ -1,44 +1,157 @@
 import logging
-from gradio_client import Client as client_gradio
-from openai import OpenAI
+from theta_agents.batching import batching_enabled, get_batcher
+from theta_agents.clients import get_client_registry
 from theta_agents.config.default_config import global_config
+from theta_agents.result_cache import acached_call, cached_call
+from theta_agents.routing import aroute, parse_endpoints, route
+from theta_agents.scheduler import RequestShed
 
 logger = logging.getLogger(__name__)
 
-def create_image_from_prompt(prompt: str) -> str:
-    """
-    Create an image based on a prompt and return the image URL.
-    """
-    try:
-        config = global_config["capabilities"]["image_tools"]["create_image_from_prompt"]
-        edgecloud_endpoint = config["edgecloud_endpoint"]
-        edgecloud_endpoint_type = config["edgecloud_endpoint_type"]
-        model_name = config["model_name"]
-        api_key = config.get("api_key")
-
-        if edgecloud_endpoint_type == "gradio":
-            client = client_gradio(edgecloud_endpoint)
-            result = client.predict(
-                prompt,
-                api_name="/predict"
-            )
-            return result.get('url', '')
+def _generate_image(config, edgecloud_endpoint, prompt):
+    edgecloud_endpoint_type = config["edgecloud_endpoint_type"]
+    model_name = config["model_name"]
+    api_key = config.get("api_key")
+
+    if edgecloud_endpoint_type == "gradio":
+        result = get_client_registry().predict_gradio(edgecloud_endpoint, api_key, prompt, api_name="/predict")
+        return result.get('url', '')
 
-        elif edgecloud_endpoint_type == 'openai':
-            client = OpenAI(api_key=api_key, base_url=edgecloud_endpoint)
+    elif edgecloud_endpoint_type == 'openai':
+        registry = get_client_registry()
+        with registry.lease(registry.get_openai_client(edgecloud_endpoint, api_key)) as client:
             response = client.images.generate(
                 model=model_name,
                 prompt=prompt,
                 size="256x256",
                 n=1
             )
-            image_url = response.data[0].url
-            return image_url
+        image_url = response.data[0].url
+        return image_url
+
+    else:
+        logger.error("Invalid edgecloud endpoint type.")
+        return "Error: Invalid endpoint type."
+
+def _generate_images(config, edgecloud_endpoint, prompts):
+    """
+    Generate one image per prompt in a single request. OpenAI-compatible endpoints take
+    one prompt per request, so batches for them only ever hold copies of the same prompt.
+    """
+    edgecloud_endpoint_type = config["edgecloud_endpoint_type"]
+    api_key = config.get("api_key")
+
+    if edgecloud_endpoint_type == "gradio":
+        results = get_client_registry().predict_gradio(edgecloud_endpoint, api_key, prompts, api_name=config["batch_api_name"])
+        return [result.get('url', '') if isinstance(result, dict) else result for result in results]
+
+    elif edgecloud_endpoint_type == 'openai':
+        registry = get_client_registry()
+        with registry.lease(registry.get_openai_client(edgecloud_endpoint, api_key)) as client:
+            response = client.images.generate(
+                model=config["model_name"],
+                prompt=prompts[0],
+                size="256x256",
+                n=len(prompts)
+            )
+        return [image.url for image in response.data]
+
+    else:
+        raise ValueError(f"Invalid edgecloud endpoint type {edgecloud_endpoint_type!r}.")
+
+def _batch_key(config, prompt):
+    """
+    Requests that may share a batch have the same key; None when the endpoint cannot batch.
+    Calls only share a batch with calls made under the same configuration version.
+    """
+    endpoints = tuple(parse_endpoints(config["edgecloud_endpoint"]))
+    if config["edgecloud_endpoint_type"] == "gradio":
+        return (id(config), endpoints, config["model_name"]) if config.get("batch_api_name") else None
+    if config["edgecloud_endpoint_type"] == "openai":
+        return (id(config), endpoints, config["model_name"], prompt)
+    return None
+
+def _eager(config):
+    # Keys of OpenAI-compatible endpoints include the prompt and only coalesce when it repeats
+    return config["edgecloud_endpoint_type"] == "openai"
+
+def _generate_batch(key, requests):
+    # Every request in the batch carries the same configuration, see _batch_key
+    config = requests[0][0]
+    prompts = [prompt for _, prompt in requests]
+    return route('create_image_from_prompt', config, lambda endpoint: _generate_images(config, endpoint, prompts))
+
+def _image_batcher():
+    return get_batcher('create_image_from_prompt', _generate_batch)
 
-        else:
-            logger.error("Invalid edgecloud endpoint type.")
-            return "Error: Invalid endpoint type."
+def _create_image(config, prompt):
+    key = _batch_key(config, prompt) if batching_enabled() else None
+    if key is not None:
+        return _image_batcher().call(key, (config, prompt), eager=_eager(config))
+    return route('create_image_from_prompt', config, lambda endpoint: _generate_image(config, endpoint, prompt))
 
+def create_image_from_prompt(prompt: str) -> str:
+    """
+    Create an image based on a prompt and return the image URL.
+    """
+    try:
+        config = global_config["capabilities"]["image_tools"]["create_image_from_prompt"]
+        return cached_call('create_image_from_prompt', config, prompt, lambda: _create_image(config, prompt))
+
+    except RequestShed as e:
+        # Tell the LLM when to try again instead of a generic failure
+        logger.warning(f"Failed to create image: {e}")
+        return f"Error: {e}"
     except Exception as e:
         logger.error(f"Failed to create image: {e}")
         return "Error: Failed to create image."
+
+async def _agenerate_image(config, edgecloud_endpoint, prompt):
+    edgecloud_endpoint_type = config["edgecloud_endpoint_type"]
+    model_name = config["model_name"]
+    api_key = config.get("api_key")
+    registry = get_client_registry()
+
+    if edgecloud_endpoint_type == "gradio":
+        result = await registry.apredict_gradio(edgecloud_endpoint, api_key, prompt, api_name="/predict")
+        return result.get('url', '')
+
+    elif edgecloud_endpoint_type == 'openai':
+        client = registry.get_async_openai_client(edgecloud_endpoint, api_key)
+        async with registry.endpoint_semaphore(edgecloud_endpoint):
+            with registry.lease(client):
+                response = await client.images.generate(
+                    model=model_name,
+                    prompt=prompt,
+                    size="256x256",
+                    n=1
+                )
+        return response.data[0].url
+
+    else:
+        logger.error("Invalid edgecloud endpoint type.")
+        return "Error: Invalid endpoint type."
+
+async def _acreate_image(config, prompt):
+    key = _batch_key(config, prompt) if batching_enabled() else None
+    if key is not None:
+        # Batches are sent from the batcher's threads; the caller only waits for its result
+        return await _image_batcher().acall(key, (config, prompt), eager=_eager(config))
+    return await aroute('create_image_from_prompt', config, lambda endpoint: _agenerate_image(config, endpoint, prompt))
+
+async def acreate_image_from_prompt(prompt: str) -> str:
+    """
+    Create an image based on a prompt and return the image URL.
+    """
+    try:
+        config = global_config["capabilities"]["image_tools"]["create_image_from_prompt"]
+        return await acached_call('create_image_from_prompt', config, prompt, lambda: _acreate_image(config, prompt))
+
+    except RequestShed as e:
+        logger.warning(f"Failed to create image: {e}")
+        return f"Error: {e}"
+    except Exception as e:
+        logger.error(f"Failed to create image: {e}")
+        return "Error: Failed to create image."
+
+create_image_from_prompt.async_variant = acreate_image_from_prompt
@@ -0,0 +1,60 @@
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+from typing import List
+from theta_agents.pipeline import MediaPipeline, Stage, stage_summary
+from theta_agents.tools.image_tools import create_image_from_prompt
+from theta_agents.tools.theta_edgestore_tools import upload_to_edgestore
+from theta_agents.tools.theta_video_tools import upload_video_to_theta
+from theta_agents.tools.video_tools import create_video_from_image
+
+logger = logging.getLogger(__name__)
+
+# Where video_pipeline can upload finished videos
+UPLOAD_DESTINATIONS = {
+    "theta_video": upload_video_to_theta,
+    "edgestore": upload_to_edgestore
+}
+
+def video_pipeline(destination: str = "theta_video") -> MediaPipeline:
+    """
+    Build the prompt -> image -> video -> upload pipeline. `destination` is a key of
+    UPLOAD_DESTINATIONS, or "none" to stop after the video.
+    """
+    stages = [Stage("image", create_image_from_prompt), Stage("video", create_video_from_image)]
+    if destination and destination != "none":
+        if destination not in UPLOAD_DESTINATIONS:
+            raise ValueError(f"Unknown destination {destination!r}, expected one of {sorted(UPLOAD_DESTINATIONS)} or 'none'")
+        stages.append(Stage("upload", UPLOAD_DESTINATIONS[destination]))
+    return MediaPipeline(stages)
+
+def create_videos_from_prompts(prompts: List[str], destination: str = "theta_video") -> str:
+    """
+    Create an image and then a video for each prompt and upload the videos to destination
+    ("theta_video", "edgestore" or "none"), all in one step. Returns JSON with each prompt's
+    image, video and upload results and the time spent in each stage.
+    """
+    try:
+        if isinstance(prompts, str):
+            prompts = [prompts]
+        results = video_pipeline(destination).run(prompts)
+        return json.dumps({
+            "results": [result.to_dict() for result in results],
+            "stages": stage_summary(results)
+        })
+    except Exception as e:
+        logger.error(f"Failed to run the video pipeline: {e}")
+        return "Error: " + str(e)
+
+async def acreate_videos_from_prompts(prompts: List[str], destination: str = "theta_video") -> str:
+    """
+    Create an image and then a video for each prompt and upload the videos to destination
+    ("theta_video", "edgestore" or "none"), all in one step. Returns JSON with each prompt's
+    image, video and upload results and the time spent in each stage.
+    """
+    run = functools.partial(contextvars.copy_context().run, create_videos_from_prompts, prompts, destination)
+    return await asyncio.get_running_loop().run_in_executor(None, run)
+
+create_videos_from_prompts.async_variant = acreate_videos_from_prompts
@@ -1,39 +1,35 @@
+import asyncio
 import logging
-from gradio_client import Client as client_gradio
-from web3 import Web3
-from openai import OpenAI
-from solcx import compile_source, install_solc
+from theta_agents.clients import get_client_registry
 from theta_agents.config.default_config import global_config
-
-install_solc('0.8.0')
+from theta_agents.result_cache import acached_call, cached_call
+from theta_agents.routing import aroute, route
+from theta_agents.scheduler import RequestShed
+from theta_agents.tools.contract_analysis import ContractAnalysis
+from theta_agents.tools.solidity_compiler import compile_contract
+from theta_agents.tools.tx_pipeline import get_deploy_pipeline
 
 logger = logging.getLogger(__name__)
 logging.getLogger('httpx').setLevel(logging.ERROR)
 
-def generate_smart_contract(prompt: str) -> str:
-    """
-    Generate smart contract code based on a user's prompt.
-    """
-
-    system_prompt = """
+GENERATE_SYSTEM_PROMPT = """
     Generate a smart contract for a decentralized voting application. The smart contract should include all relevant best practices and be as secure as possible. Return nothing but the smart contract code.
     """
-    try:
-        config = global_config["capabilities"]["smart_contract_tools"]["generate_smart_contract"]
-        edgecloud_endpoint = config["edgecloud_endpoint"]
-        edgecloud_endpoint_type = config["edgecloud_endpoint_type"]
-        model_name = config["model_name"]
-        api_key = config.get("api_key")
-
-        if edgecloud_endpoint_type == "gradio":
-            client = client_gradio(edgecloud_endpoint)
-            result = client.predict(
-                prompt,
-                api_name="/predict"
-            )
-            return result.get('output', '')
-        elif edgecloud_endpoint_type == 'openai':
-            client = OpenAI(api_key=api_key, base_url=edgecloud_endpoint)
+
+ANALYZE_SYSTEM_PROMPT = """
+    Analyze the smart contract for any security vulnerabilities, refactoring, or other issues. Return nothing but the analysis in the text form"""
+
+def _complete(config, edgecloud_endpoint, system_prompt, prompt):
+    edgecloud_endpoint_type = config["edgecloud_endpoint_type"]
+    model_name = config["model_name"]
+    api_key = config.get("api_key")
+
+    if edgecloud_endpoint_type == "gradio":
+        result = get_client_registry().predict_gradio(edgecloud_endpoint, api_key, prompt, api_name="/predict")
+        return result.get('output', '')
+    elif edgecloud_endpoint_type == 'openai':
+        registry = get_client_registry()
+        with registry.lease(registry.get_openai_client(edgecloud_endpoint, api_key)) as client:
             response = client.chat.completions.create(
                 model=model_name,
                 messages=[
@@ -41,94 +37,145 @@ def generate_smart_contract(prompt: str) -> str:
                     {"role": "user", "content": prompt}
                 ]
             )
-            content = response.choices[0].message.content
-            return content
-        else:
-            logger.error("Invalid edgecloud endpoint type.")
-            return "Error: Invalid endpoint type."
+        content = response.choices[0].message.content
+        return content
+    else:
+        logger.error("Invalid edgecloud endpoint type.")
+        return "Error: Invalid endpoint type."
+
+async def _acomplete(config, edgecloud_endpoint, system_prompt, prompt):
+    edgecloud_endpoint_type = config["edgecloud_endpoint_type"]
+    model_name = config["model_name"]
+    api_key = config.get("api_key")
+    registry = get_client_registry()
+
+    if edgecloud_endpoint_type == "gradio":
+        result = await registry.apredict_gradio(edgecloud_endpoint, api_key, prompt, api_name="/predict")
+        return result.get('output', '')
+    elif edgecloud_endpoint_type == 'openai':
+        client = registry.get_async_openai_client(edgecloud_endpoint, api_key)
+        async with registry.endpoint_semaphore(edgecloud_endpoint):
+            with registry.lease(client):
+                response = await client.chat.completions.create(
+                    model=model_name,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": prompt}
+                    ]
+                )
+        return response.choices[0].message.content
+    else:
+        logger.error("Invalid edgecloud endpoint type.")
+        return "Error: Invalid endpoint type."
+
+def generate_smart_contract(prompt: str) -> str:
+    """
+    Generate smart contract code based on a user's prompt.
+    """
+    try:
+        config = global_config["capabilities"]["smart_contract_tools"]["generate_smart_contract"]
+        return cached_call('generate_smart_contract', config, prompt,
+                           lambda: route('generate_smart_contract', config, lambda endpoint: _complete(config, endpoint, GENERATE_SYSTEM_PROMPT, prompt)))
+    except RequestShed as e:
+        logger.warning(f"Failed to generate smart contract: {e}")
+        return f"Error: {e}"
+    except Exception as e:
+        logger.error(f"Failed to generate smart contract: {e}")
+        return "Error: Failed to generate smart contract."
+
+async def agenerate_smart_contract(prompt: str) -> str:
+    """
+    Generate smart contract code based on a user's prompt.
+    """
+    try:
+        config = global_config["capabilities"]["smart_contract_tools"]["generate_smart_contract"]
+        return await acached_call('generate_smart_contract', config, prompt,
+                                  lambda: aroute('generate_smart_contract', config, lambda endpoint: _acomplete(config, endpoint, GENERATE_SYSTEM_PROMPT, prompt)))
+    except RequestShed as e:
+        logger.warning(f"Failed to generate smart contract: {e}")
+        return f"Error: {e}"
     except Exception as e:
         logger.error(f"Failed to generate smart contract: {e}")
         return "Error: Failed to generate smart contract."
-    
+
+generate_smart_contract.async_variant = agenerate_smart_contract
+
 def analyze_smart_contract(prompt: str) -> str:
     """
     Analyze smart contracts for security vulnerabilities, refactoring, etc.
     """
+    try:
+        config = global_config["capabilities"]["smart_contract_tools"]["analyze_smart_contract"]
+        # Functions unchanged since an earlier analysis are answered from the per-part cache
+        analysis = ContractAnalysis(config, prompt)
+        analysis.run(lambda unit_prompt, system_prompt: route(
+            'analyze_smart_contract', config,
+            lambda endpoint: _complete(config, endpoint, system_prompt or ANALYZE_SYSTEM_PROMPT, unit_prompt)))
+        return analysis.report()
+    except RequestShed as e:
+        logger.warning(f"Failed to analyze smart contract: {e}")
+        return f"Error: {e}"
+    except Exception as e:
+        logger.error(f"Failed to analyze smart contract: {e}")
+        return "Error: Failed to analyze smart contract."
 
-    system_prompt = """
-    Analyze the smart contract for any security vulnerabilities, refactoring, or other issues. Return nothing but the analysis in the text form"""
+async def aanalyze_smart_contract(prompt: str) -> str:
+    """
+    Analyze smart contracts for security vulnerabilities, refactoring, etc.
+    """
     try:
         config = global_config["capabilities"]["smart_contract_tools"]["analyze_smart_contract"]
-        edgecloud_endpoint = config["edgecloud_endpoint"]
-        edgecloud_endpoint_type = config["edgecloud_endpoint_type"]
-        model_name = config["model_name"]
-        api_key = config.get("api_key")
-
-        if edgecloud_endpoint_type == "gradio":
-            client = client_gradio(edgecloud_endpoint)
-            result = client.predict(
-                prompt,
-                api_name="/predict"
-            )
-            return result.get('output', '')
-        elif edgecloud_endpoint_type == 'openai':
-            client = OpenAI(api_key=api_key, base_url=edgecloud_endpoint)
-            response = client.chat.completions.create(
-                model=model_name,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            content = response.choices[0].message.content
-            return content
-        else:
-            logger.error("Invalid edgecloud endpoint type.")
-            return "Error: Invalid endpoint type."
+        analysis = await ContractAnalysis.acreate(config, prompt)
+        await analysis.arun(lambda unit_prompt, system_prompt: aroute(
+            'analyze_smart_contract', config,
+            lambda endpoint: _acomplete(config, endpoint, system_prompt or ANALYZE_SYSTEM_PROMPT, unit_prompt)))
+        return analysis.report()
+    except RequestShed as e:
+        logger.warning(f"Failed to analyze smart contract: {e}")
+        return f"Error: {e}"
     except Exception as e:
-        logger.error(f"Failed to generate smart contract: {e}")
-        return "Error: Failed to generate smart contract."    
-    
-def deploy_smart_contract(contract_source_code, 
-                    contract_name, 
+        logger.error(f"Failed to analyze smart contract: {e}")
+        return "Error: Failed to analyze smart contract."
+
+analyze_smart_contract.async_variant = aanalyze_smart_contract
+
+def submit_smart_contract_deploy(contract_source_code,
+                    contract_name,
                     initial_supply=1000000):
     """
-    Deploys a smart contract to the Theta testnet blockchain
+    Compile and broadcast a deployment without waiting for it to be mined.
+    Returns a Future that resolves to the contract address (its `tx_hash` attribute is set).
     """
-    
     config = global_config["capabilities"]["smart_contract_tools"]["deploy_smart_contract"]
-    public_address = config["theta_wallet_public_address"]
     private_key = config["theta_wallet_private_key"]
 
-    theta_rpc_url = "https://eth-rpc-api-testnet.thetatoken.org/rpc" #testnet
-    w3 = Web3(Web3.HTTPProvider(theta_rpc_url))
-    
-    compiled_sol = compile_source(contract_source_code)
-    contract_interface = compiled_sol[f'<stdin>:{contract_name}']
+    compiled_sol = compile_contract(contract_source_code)
+    contract_interface = compiled_sol[contract_name]
 
     # Get the contract bytecode and ABI
     bytecode = contract_interface['bin']
     abi = contract_interface['abi']
 
-    # Create the contract instance
-    MyToken = w3.eth.contract(abi=abi, bytecode=bytecode)
+    # Nonces, gas and receipts are handled by the shared pipeline so concurrent deploys don't collide
+    return get_deploy_pipeline().submit(abi, bytecode, (initial_supply,), private_key)
 
-    # Build the transaction
-    nonce = w3.eth.get_transaction_count(public_address)
-    tx = MyToken.constructor(initial_supply).build_transaction({
-        'chainId': 365,  # Theta testnet chain ID
-        'gas': 2000000,
-        'gasPrice': 4000000000000,  # Minimum required gas price for Theta testnet
-        'nonce': nonce,
-    })
-
-    # Sign the transaction
-    signed_tx = w3.eth.account.sign_transaction(tx, private_key=private_key)
-
-    # Send the transaction
-    tx_hash = w3.eth.send_raw_transaction(signed_tx.rawTransaction)
+def deploy_smart_contract(contract_source_code, 
+                    contract_name, 
+                    initial_supply=1000000):
+    """
+    Deploys a smart contract to the Theta testnet blockchain
+    """
+    return submit_smart_contract_deploy(contract_source_code, contract_name, initial_supply).result()
 
-    # Wait for the transaction receipt
-    tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
+async def adeploy_smart_contract(contract_source_code,
+                    contract_name,
+                    initial_supply=1000000):
+    """
+    Deploys a smart contract to the Theta testnet blockchain
+    """
+    # Compiling and signing are blocking; the receipt is awaited without holding a worker
+    loop = asyncio.get_running_loop()
+    future = await loop.run_in_executor(None, submit_smart_contract_deploy, contract_source_code, contract_name, initial_supply)
+    return await asyncio.wrap_future(future)
 
-    return tx_receipt.contractAddress
\ No newline at end of file
+deploy_smart_contract.async_variant = adeploy_smart_contract
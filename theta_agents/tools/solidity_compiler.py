@@ -0,0 +1,184 @@
+import contextlib
+import functools
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from theta_agents.config.default_config import global_config
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+SOLC_VERSION = '0.8.0'
+
+logger = logging.getLogger(__name__)
+
+@functools.lru_cache(maxsize=None)
+def _ensure_solc(version: str = SOLC_VERSION) -> str:
+    """
+    Install the solc compiler on first use instead of at import time.
+    """
+    from solcx import get_installed_solc_versions, install_solc
+    if not any(str(installed) == version for installed in get_installed_solc_versions()):
+        logger.info(f"Installing solc {version}")
+        install_solc(version)
+    return version
+
+
+class CompilationCache:
+    """
+    Content-addressed on-disk cache of compiled Solidity artifacts (ABI and bytecode).
+
+    Entries are keyed by a hash of the source, compiler version and settings. Writes are
+    atomic renames and concurrent compiles of the same key are serialised with a striped
+    file lock, so several worker processes can share one cache directory. When the
+    directory grows past `max_bytes` the least recently used entries are removed.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 256 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._thread_lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(source: str, solc_version: str, settings: dict = None) -> str:
+        payload = json.dumps({
+            "source": source,
+            "solc_version": solc_version,
+            "settings": settings or {}
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    @contextlib.contextmanager
+    def _file_lock(self, name: str):
+        if fcntl is None:
+            with self._thread_lock:
+                yield
+            return
+        with open(os.path.join(self.cache_dir, name), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def get(self, key: str):
+        path = self._path(key)
+        try:
+            with open(path, 'r') as file:
+                artifacts = json.load(file)
+        except (FileNotFoundError, ValueError):
+            return None
+        # Touch the entry so eviction sees it as recently used
+        with contextlib.suppress(OSError):
+            os.utime(path)
+        return artifacts
+
+    def put(self, key: str, artifacts: dict):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as file:
+                json.dump(artifacts, file)
+            os.replace(tmp_path, self._path(key))
+        except Exception:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+            raise
+        self.evict()
+
+    def get_or_compile(self, key: str, compile_fn):
+        artifacts = self.get(key)
+        if artifacts is not None:
+            return artifacts
+        # Lock files are striped by key prefix and never deleted, so every process
+        # contending for a key always locks the same inode
+        with self._file_lock(f".lock-{key[:2]}"):
+            # Another process may have compiled it while we waited for the lock
+            artifacts = self.get(key)
+            if artifacts is None:
+                artifacts = compile_fn()
+                self.put(key, artifacts)
+        return artifacts
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache fits in `max_bytes`.
+        """
+        with self._file_lock('.evict.lock'):
+            entries = []
+            total = 0
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith('.json'):
+                    continue
+                with contextlib.suppress(OSError):
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                    entries.append((stat.st_mtime, stat.st_size, name))
+                    total += stat.st_size
+            entries.sort()
+            for _, size, name in entries:
+                if total <= self.max_bytes:
+                    break
+                with contextlib.suppress(OSError):
+                    os.remove(os.path.join(self.cache_dir, name))
+                    total -= size
+
+    def clear(self):
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.json'):
+                with contextlib.suppress(OSError):
+                    os.remove(os.path.join(self.cache_dir, name))
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_compilation_cache() -> CompilationCache:
+    """
+    Return the process-wide compilation cache configured by `solidity_compiler` in `global_config`.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            config = global_config["solidity_compiler"]
+            _cache = CompilationCache(
+                cache_dir=os.path.expanduser(config["cache_dir"]),
+                max_bytes=int(config["cache_max_mb"]) * 1024 * 1024
+            )
+        return _cache
+
+def compile_contract(contract_source_code: str, solc_version: str = SOLC_VERSION, settings: dict = None,
+                     use_cache: bool = True) -> dict:
+    """
+    Compile Solidity source and return {contract_name: {"abi": ..., "bin": ...}}.
+
+    `settings` are passed through to `solcx.compile_source` (e.g. optimize, optimize_runs,
+    evm_version) and are part of the cache key.
+    """
+    settings = settings or {}
+
+    def compile_fn():
+        from solcx import compile_source
+        compiled = compile_source(
+            contract_source_code,
+            output_values=['abi', 'bin'],
+            solc_version=_ensure_solc(solc_version),
+            **settings
+        )
+        return {
+            name.split(':', 1)[-1]: {"abi": output['abi'], "bin": output['bin']}
+            for name, output in compiled.items()
+        }
+
+    if not use_cache:
+        return compile_fn()
+    cache = get_compilation_cache()
+    key = cache.make_key(contract_source_code, solc_version, settings)
+    return cache.get_or_compile(key, compile_fn)
@@ -1,47 +1,243 @@
+import asyncio
+import contextlib
+import contextvars
+import functools
+import hashlib
+import json
 import logging
+import os
+import tempfile
+import threading
 import time
-import requests
-from eth_account.messages import encode_defunct
-from web3 import Web3
-import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Union
+from theta_agents.clients import get_client_registry
 from theta_agents.config.default_config import global_config
+from theta_agents.scheduler import BULK, priority
+from theta_agents.tools.chunked_upload import get_uploader, is_url
 
 logger = logging.getLogger(__name__)
 
-def upload_to_edgestore(filepath: str) -> str:
+_auth_tokens = {}
+_auth_tokens_lock = threading.Lock()
+
+def _auth_token(config, refresh=False) -> str:
     """
-    Uploads a file to the Edge Store network.
+    Return a signed EdgeStore auth token, reusing it until `auth_token_ttl` seconds have passed.
     """
-    try:
-        config = global_config["capabilities"]["theta_edgestore_tools"]["upload_to_edgestore"]
-        w3_provider_endpoint = config["w3_provider_endpoint"]
-        address = config["theta_wallet_public_address"]
-        private_key = config["theta_wallet_private_key"]
-        w3 = Web3(Web3.HTTPProvider(w3_provider_endpoint))
+    from eth_account import Account
+    from eth_account.messages import encode_defunct
+
+    private_key = config["theta_wallet_private_key"]
+    address = config["address"] or Account.from_key(private_key).address
+    key = (address, hashlib.sha256(str(private_key).encode('utf-8')).hexdigest())
+    with _auth_tokens_lock:
+        cached = _auth_tokens.get(key)
+        if cached is not None and not refresh and cached[1] > time.monotonic():
+            return cached[0]
 
-        # Step 1: Generate the authentication token
         timestamp = str(int(time.time() * 1000))
         message = f'Theta EdgeStore Call {timestamp}'
         message_encoded = encode_defunct(text=message)
-        signed_message = w3.eth.account.sign_message(message_encoded, private_key=private_key)
+        signed_message = Account.sign_message(message_encoded, private_key=private_key)
         signature = signed_message.signature.hex()
         auth_token = f"{timestamp}.{address}.{signature}"
+        _auth_tokens[key] = (auth_token, time.monotonic() + float(config["auth_token_ttl"]))
+        return auth_token
 
-        # Step 2: Define the URL and headers for the request
-        url = 'https://api.thetaedgestore.com/api/v2/data'
-        headers = { 'x-theta-edgestore-auth': auth_token}
+def _upload_file(config, filepath: str):
+    """
+    Stream one file, or the body of an http(s) URL, to EdgeStore. Returns the response,
+    re-signing once if the cached token was refused.
+    """
+    url = config["api_url"]
+    uploader = get_uploader(session=get_client_registry().get_session(url))
+    upload = uploader.upload_multipart_from_url if is_url(filepath) else uploader.upload_multipart
+    response = upload(filepath, url, headers={'x-theta-edgestore-auth': _auth_token(config)})
+    if response.status_code in (401, 403):
+        logger.info("EdgeStore refused the cached auth token, signing a new one")
+        headers = {'x-theta-edgestore-auth': _auth_token(config, refresh=True)}
+        response = upload(filepath, url, headers=headers)
+    return response
 
-        # Step 3: Define the file to upload
-        with open(filepath, 'rb') as file:
-            files = {'file': file}
-            response = requests.post(url, headers=headers, files=files)
+def _response_result(response):
+    try:
+        return response.json()
+    except ValueError:
+        return response.text
 
-        # Step 4: Return response from Edge Store            
-        try:
-            response_json = response.json()
-            return response_json
-        except requests.exceptions.JSONDecodeError:
-            return response.text    
+def upload_to_edgestore(filepath: str) -> str:
+    """
+    Uploads a file (path or URL) to the Edge Store network.
+    """
+    try:
+        config = global_config["capabilities"]["theta_edgestore_tools"]["upload_to_edgestore"]
+        # Stream the file as multipart/form-data, retrying the request on failure
+        return _response_result(_upload_file(config, filepath))
     except Exception as e:
         logger.error(f"Failed to upload file: {e}")
-        return "Error: " + str(e)
\ No newline at end of file
+        return "Error: " + str(e)
+
+async def aupload_to_edgestore(filepath: str) -> str:
+    """
+    Uploads a file (path or URL) to the Edge Store network.
+    """
+    try:
+        config = global_config["capabilities"]["theta_edgestore_tools"]["upload_to_edgestore"]
+        registry = get_client_registry()
+
+        # Uploads go through the shared memory-bounded engine in the default executor;
+        # the context is copied so upload_progress callbacks still apply
+        upload = functools.partial(contextvars.copy_context().run, _upload_file, config, filepath)
+        async with registry.endpoint_semaphore(config["api_url"]):
+            response = await asyncio.get_running_loop().run_in_executor(None, upload)
+        return _response_result(response)
+    except Exception as e:
+        logger.error(f"Failed to upload file: {e}")
+        return "Error: " + str(e)
+
+upload_to_edgestore.async_variant = aupload_to_edgestore
+
+
+class UploadManifest:
+    """
+    Local record of the content already stored on EdgeStore, keyed by SHA-256.
+
+    File hashes are remembered by path, size and mtime so unchanged files are not
+    re-read on every bulk upload. Recorded uploads are written out every `flush_every`
+    records or `flush_interval` seconds, and by `save()`; a crash loses at most that
+    batch, whose files are uploaded again next time.
+    """
+
+    def __init__(self, path: str, flush_every: int = 64, flush_interval: float = 5.0):
+        self.path = path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        # Serializes writers so an older snapshot never replaces a newer one
+        self._write_lock = threading.Lock()
+        self._unsaved = 0
+        self._saved_at = time.monotonic()
+        self.state = {"files": {}, "content": {}}
+        with contextlib.suppress(FileNotFoundError, ValueError):
+            with open(path, 'r') as file:
+                self.state = json.load(file)
+
+    def content_hash(self, filepath: str) -> str:
+        stat = os.stat(filepath)
+        identity = [stat.st_size, stat.st_mtime_ns]
+        abspath = os.path.abspath(filepath)
+        with self._lock:
+            known = self.state["files"].get(abspath)
+        if known is not None and known[:2] == identity:
+            return known[2]
+        digest = hashlib.sha256()
+        with open(filepath, 'rb') as file:
+            for block in iter(lambda: file.read(1024 * 1024), b''):
+                digest.update(block)
+        with self._lock:
+            self.state["files"][abspath] = identity + [digest.hexdigest()]
+        return digest.hexdigest()
+
+    def get(self, content_hash: str):
+        with self._lock:
+            return self.state["content"].get(content_hash)
+
+    def record(self, content_hash: str, result):
+        with self._lock:
+            self.state["content"][content_hash] = result
+            self._unsaved += 1
+            due = self._unsaved >= self.flush_every or time.monotonic() - self._saved_at >= self.flush_interval
+        if due:
+            self.save()
+
+    def save(self):
+        with self._write_lock:
+            with self._lock:
+                data = json.dumps(self.state)
+                self._unsaved = 0
+                self._saved_at = time.monotonic()
+            # Written outside `_lock` so upload workers recording results are not held up
+            self._write(data)
+
+    def _write(self, data: str):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as file:
+            file.write(data)
+        os.replace(tmp_path, self.path)
+
+
+def _collect_paths(paths: Union[str, Iterable[str]]) -> list:
+    if isinstance(paths, str):
+        paths = [paths]
+    collected = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+                collected.extend(os.path.join(root, name) for name in sorted(files) if not name.startswith('.'))
+        else:
+            collected.append(path)
+    return collected
+
+def upload_directory_to_edgestore(paths: Union[str, Iterable[str]], max_workers: int = None) -> dict:
+    """
+    Uploads a directory (or a list of files) to the Edge Store network, skipping files that were already uploaded.
+    """
+    config = global_config["capabilities"]["theta_edgestore_tools"]["upload_to_edgestore"]
+    manifest = UploadManifest(os.path.expanduser(config["manifest_path"]))
+    max_workers = max_workers or int(config["bulk_max_workers"])
+    results = {}
+    by_hash = {}
+    skipped = 0
+
+    for filepath in _collect_paths(paths):
+        try:
+            content_hash = manifest.content_hash(filepath)
+        except OSError as e:
+            results[filepath] = "Error: " + str(e)
+            continue
+        stored = manifest.get(content_hash)
+        if stored is not None:
+            results[filepath] = stored
+            skipped += 1
+        else:
+            # Identical files in the same batch are uploaded once
+            by_hash.setdefault(content_hash, []).append(filepath)
+
+    def upload(content_hash, filepath):
+        try:
+            response = _upload_file(config, filepath)
+            result = _response_result(response)
+            if response.ok:
+                manifest.record(content_hash, result)
+            return result if response.ok else f"Error: HTTP {response.status_code}: {result}"
+        except Exception as e:
+            logger.error(f"Failed to upload {filepath}: {e}")
+            return "Error: " + str(e)
+
+    # Bulk uploads yield to interactive turns for the upstream rate limits
+    with priority(BULK, override=False), ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            content_hash: executor.submit(contextvars.copy_context().run, upload, content_hash, filepaths[0])
+            for content_hash, filepaths in by_hash.items()
+        }
+        for content_hash, future in futures.items():
+            result = future.result()
+            for filepath in by_hash[content_hash]:
+                results[filepath] = result
+    manifest.save()
+
+    logger.info(f"EdgeStore bulk upload: {len(by_hash)} uploaded, {skipped} already stored")
+    return results
+
+async def aupload_directory_to_edgestore(paths: Union[str, Iterable[str]], max_workers: int = None) -> dict:
+    """
+    Uploads a directory (or a list of files) to the Edge Store network, skipping files that were already uploaded.
+    """
+    upload = functools.partial(contextvars.copy_context().run, upload_directory_to_edgestore, paths, max_workers)
+    return await asyncio.get_running_loop().run_in_executor(None, upload)
+
+upload_directory_to_edgestore.async_variant = aupload_directory_to_edgestore
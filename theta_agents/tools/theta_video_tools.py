@@ -1,15 +1,29 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
 import logging
-import requests
-from theta_agents.config.default_config import global_config
+import os
+import threading
+from theta_agents.clients import get_client_registry
+from theta_agents.config.default_config import config_bool, global_config
+from theta_agents.tools.chunked_upload import UploadError, get_journal, get_uploader, is_url
+from theta_agents.tools.transcode_tracker import TranscodeError, TranscodeJobTracker
 
 logger = logging.getLogger(__name__)
 
+def _api_url():
+    return global_config["capabilities"]["theta_video_tools"]["upload_video_to_theta"]["api_url"]
+
+def _session():
+    return get_client_registry().get_session(_api_url())
+
 def _get_presigned_url_and_upload_id(filepath, service_account_id, service_account_secret):
       
-      url = 'https://api.thetavideoapi.com/upload'
+      url = f'{_api_url()}/upload'
       headers = { 'x-tva-sa-id': service_account_id, 'x-tva-sa-secret': service_account_secret }
 
-      response = requests.post(url, headers=headers)
+      response = _session().post(url, headers=headers)
       response_data = response.json()
 
       if response.status_code == 200 and response_data['status'] == 'success':
@@ -19,13 +33,60 @@ def _get_presigned_url_and_upload_id(filepath, service_account_id, service_accou
           return pre_signed_url, upload_id
       return None, None   
 
-def _upload_video(filepath, pre_signed_url):
-    with open(filepath, 'rb') as file:
-        response = requests.put(pre_signed_url, headers={'Content-Type': 'application/octet-stream'}, data=file)
+def _chunked():
+    # Only resumable-upload backends accept Content-Range chunks; a plain presigned PUT
+    # would store just the first chunk, so chunking is opt-in
+    return config_bool(global_config["uploads"]["video_api_chunked"])
+
+def _forget_upload(journal):
+    # The presigned URL was refused (e.g. it expired); the next attempt requests a new one
+    journal.reset()
+    journal.update_metadata(presigned_url=None, upload_id=None)
+
+def _upload_video(filepath, pre_signed_url, journal=None):
+    """
+    Upload a video to its presigned URL. Returns True once uploaded; a URL refused with
+    a client error is dropped from the journal.
+    """
+    headers = {'Content-Type': 'application/octet-stream'}
+    uploader = get_uploader()
+    if is_url(filepath):
+        # Relayed from the source as it downloads; a URL has no local file to chunk or resume
+        response = uploader.upload_stream_from_url(filepath, pre_signed_url, headers=headers)
+        return response.status_code == 200
+    if journal is not None:
+        try:
+            return uploader.upload(filepath, pre_signed_url, headers=headers, journal=journal)
+        except UploadError as e:
+            if e.status_code is not None and 400 <= e.status_code < 500:
+                _forget_upload(journal)
+            raise
+    response = uploader.upload_stream(filepath, pre_signed_url, headers=headers)
     return response.status_code == 200
 
+def _resume_or_get_upload(filepath, service_account_id, service_account_secret):
+    """
+    Reuse the presigned URL and upload ID of an interrupted chunked upload of the same file,
+    otherwise request new ones and, for chunked uploads, record them in the file's upload
+    journal. Whole-file uploads cannot resume, so they always get a fresh URL and no journal.
+    Returns (presigned URL, upload ID, journal, resumed).
+    """
+    if is_url(filepath) or not _chunked():
+        pre_signed_url, upload_id = _get_presigned_url_and_upload_id(filepath, service_account_id, service_account_secret)
+        return pre_signed_url, upload_id, None, False
+    journal = get_journal(filepath, 'theta_video')
+    pre_signed_url = journal.metadata.get('presigned_url')
+    upload_id = journal.metadata.get('upload_id')
+    if pre_signed_url and upload_id:
+        logger.info(f"Resuming upload {upload_id} for {filepath}")
+        return pre_signed_url, upload_id, journal, True
+    pre_signed_url, upload_id = _get_presigned_url_and_upload_id(filepath, service_account_id, service_account_secret)
+    if pre_signed_url and upload_id:
+        journal.update_metadata(presigned_url=pre_signed_url, upload_id=upload_id)
+    return pre_signed_url, upload_id, journal, False
+
 def _transcode_video(upload_id, service_account_id, service_account_secret):
-    url = 'https://api.thetavideoapi.com/video'
+    url = f'{_api_url()}/video'
     headers = {
         'x-tva-sa-id': service_account_id,
         'x-tva-sa-secret': service_account_secret,
@@ -39,65 +100,162 @@ def _transcode_video(upload_id, service_account_id, service_account_secret):
             "key": "value"
         }
     }
-    response = requests.post(url, headers=headers, json=data)
+    response = _session().post(url, headers=headers, json=data)
     response_data = response.json()
 
     if response.status_code == 200 and response_data['status'] == 'success':
-        video_id = response_data['body']['video_id']
+        return response_data['body']['video_id']
     else:
         return None
-    
-def _get_video_playback_url(video_id, service_account_id, service_account_secret):
-    url = f'https://api.thetavideoapi.com/video/{video_id}'
+
+def _get_video_status(video_id, service_account_id, service_account_secret):
+    url = f'{_api_url()}/video/{video_id}'
     headers = {
         'x-tva-sa-id': service_account_id,
         'x-tva-sa-secret': service_account_secret
     }
 
-    response = requests.get(url, headers=headers)
+    response = _session().get(url, headers=headers)
     response_data = response.json()
 
     if response.status_code == 200 and response_data['status'] == 'success':
         video_info = response_data['body']['videos'][0]
-        playback_uri = video_info.get('playback_uri')
-        if playback_uri:
-            return playback_uri
-        else:
-            return None
+        return video_info.get('state'), video_info.get('playback_uri')
+    return None, None
+
+def _get_video_playback_url(video_id, service_account_id, service_account_secret):
+    _, playback_uri = _get_video_status(video_id, service_account_id, service_account_secret)
+    return playback_uri or None
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+def get_transcode_tracker() -> TranscodeJobTracker:
+    """
+    Return the process-wide transcode tracker. Jobs left pending by a previous
+    process sharing the same job table are resumed when it is created.
+    """
+    global _tracker
+    with _tracker_lock:
+        if _tracker is None:
+            config = global_config["capabilities"]["theta_video_tools"]["upload_video_to_theta"]
+            service_account_id = config["service_account_id"]
+            service_account_secret = config["service_account_secret"]
+            db_path = os.path.expanduser(config["job_db_path"])
+            os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+            _tracker = TranscodeJobTracker(
+                create_fn=lambda upload_id: _transcode_video(upload_id, service_account_id, service_account_secret),
+                status_fn=lambda video_id: _get_video_status(video_id, service_account_id, service_account_secret),
+                db_path=db_path,
+                initial_interval=float(config["poll_initial_interval"]),
+                max_interval=float(config["poll_max_interval"])
+            )
+            _tracker.resume()
+        return _tracker
+
+def _upload_and_submit(filepath):
+    """
+    Upload a video and start transcoding it. Returns a future resolving to the playback URI.
+    """
+    config = global_config["capabilities"]["theta_video_tools"]["upload_video_to_theta"]
+    service_account_id = config["service_account_id"]
+    service_account_secret = config["service_account_secret"]
+
+    pre_signed_url, upload_id, journal, resumed = _resume_or_get_upload(filepath, service_account_id, service_account_secret)
+    if pre_signed_url is None:
+        raise TranscodeError("Failed to get pre-signed URL.")
+    if upload_id is None:
+        raise TranscodeError("Failed to get upload ID.")
+    try:
+        uploaded = _upload_video(filepath, pre_signed_url, journal)
+    except UploadError:
+        if not (resumed and journal.metadata.get('presigned_url') is None):
+            raise
+        # The journaled URL has expired; start over once with a fresh one
+        logger.info(f"Presigned URL of upload {upload_id} was refused, requesting a new one")
+        return _upload_and_submit(filepath)
+    if not uploaded:
+        raise TranscodeError("Failed to upload video.")
+    if journal is not None:
+        journal.delete()
+    return get_transcode_tracker().submit(upload_id)
+
+def submit_videos_to_theta(filepaths, max_workers: int = 4) -> dict:
+    """
+    Upload many videos concurrently and hand their transcodes to the shared tracker.
+    Returns {filepath: Future} where each future resolves to the playback URI.
+    """
+    results = {}
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    for filepath in filepaths:
+        result = concurrent.futures.Future()
+        results[filepath] = result
+        upload = executor.submit(_upload_and_submit, filepath)
+        upload.add_done_callback(functools.partial(_chain_transcode, result))
+    executor.shutdown(wait=False)
+    return results
+
+def _chain_transcode(result, upload):
+    if upload.cancelled() or upload.exception() is not None:
+        _resolve_from(result, upload)
+        return
+    upload.result().add_done_callback(functools.partial(_resolve_from, result))
+
+def _resolve_from(result, done):
+    if result.done():
+        # Cancelled by the caller
+        return
+    if done.cancelled():
+        result.cancel()
+    elif done.exception() is not None:
+        result.set_exception(done.exception())
     else:
-        return None    
+        result.set_result(done.result())
+
+def _wait_for_playback(transcode, config):
+    try:
+        return transcode.result(timeout=float(config["transcode_wait_timeout"]))
+    except concurrent.futures.TimeoutError:
+        return f"Video {transcode.video_id} was uploaded and is still transcoding."
 
 def upload_video_to_theta(filepath: str) -> str:
     """
-    Uploads a viddo to Theta's Video Delivery Network.
+    Uploads a viddo (path or URL) to Theta's Video Delivery Network.
     """
     try:
       config = global_config["capabilities"]["theta_video_tools"]["upload_video_to_theta"]
-      service_account_id = config["service_account_id"]
-      service_account_secret = config["service_account_secret"]
+      transcode = _upload_and_submit(filepath)
+      return _wait_for_playback(transcode, config)
+
+    except Exception as e:
+        logger.error(f"Failed to upload video: {e}")
+        return "Error: " + str(e)
 
-      pre_signed_url, upload_id = _get_presigned_url_and_upload_id(filepath, service_account_id, service_account_secret)
+async def _run_blocking(func, *args):
+    # Upload I/O is done by the shared sync engine; copy the context so progress callbacks follow
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(contextvars.copy_context().run, func, *args))
 
-      if pre_signed_url is None:
-          return "Error: Failed to get pre-signed URL."
-      if upload_id is None:
-          return "Error: Failed to get upload ID."
-      
-      is_video_upload_successful = _upload_video(filepath, pre_signed_url)
+async def aupload_video_to_theta(filepath: str) -> str:
+    """
+    Uploads a viddo (path or URL) to Theta's Video Delivery Network.
+    """
+    try:
+        config = global_config["capabilities"]["theta_video_tools"]["upload_video_to_theta"]
 
-      if not is_video_upload_successful:
-          return "Error: Failed to upload video." 
-      
-      video_id = _transcode_video(upload_id, service_account_id, service_account_secret)
-      if video_id is None:
-          return "Error: Failed to transcode video."
-      
-      playback_uri = _get_video_playback_url(video_id, service_account_id, service_account_secret)
-      if playback_uri is None:
-          return "Error: Failed to get playback URI."
-      else:
-          return playback_uri
+        async with get_client_registry().endpoint_semaphore(config["api_url"]):
+            # The same upload, resume and refused-URL handling as the sync path, run off the loop
+            transcode = await _run_blocking(_upload_and_submit, filepath)
+
+        # Wait outside the semaphore; the tracker's polling thread resolves the future
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(transcode)),
+                                          timeout=float(config["transcode_wait_timeout"]))
+        except asyncio.TimeoutError:
+            return f"Video {transcode.video_id} was uploaded and is still transcoding."
 
     except Exception as e:
         logger.error(f"Failed to upload video: {e}")
-        return "Error: " + str(e)
\ No newline at end of file
+        return "Error: " + str(e)
+
+upload_video_to_theta.async_variant = aupload_video_to_theta
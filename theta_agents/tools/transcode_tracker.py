@@ -0,0 +1,193 @@
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+SUCCESS = 'success'
+FAILED = 'failed'
+
+# Video API states that end tracking; anything else is still transcoding
+FAILED_STATES = ('error', 'failed')
+
+
+class TranscodeError(Exception):
+    pass
+
+
+class _Job:
+    def __init__(self, video_id, upload_id, next_poll_at, interval):
+        self.video_id = video_id
+        self.upload_id = upload_id
+        self.next_poll_at = next_poll_at
+        self.interval = interval
+        self.future = Future()
+        self.future.video_id = video_id
+
+
+class TranscodeJobTracker:
+    """
+    Tracks outstanding Video API transcodes from a single background thread.
+
+    `submit()` starts a transcode and `track()` follows an existing video ID; both return a
+    `concurrent.futures.Future` that resolves to the playback URI. Each job is polled with
+    its own interval, growing by `backoff_factor` up to `max_interval` while the state is
+    unchanged. Jobs are stored in SQLite, so `resume()` picks them up after a restart.
+
+    `create_fn(upload_id)` must return a video ID (or None), and `status_fn(video_id)` a
+    `(state, playback_uri)` pair.
+    """
+
+    def __init__(self, create_fn, status_fn, db_path: str = ':memory:', initial_interval: float = 2.0,
+                 max_interval: float = 60.0, backoff_factor: float = 1.5):
+        self.create_fn = create_fn
+        self.status_fn = status_fn
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.backoff_factor = backoff_factor
+        self._jobs = {}
+        self._states = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._stopped = False
+        self._thread = None
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS transcode_jobs ("
+            "video_id TEXT PRIMARY KEY, upload_id TEXT, status TEXT, playback_uri TEXT, "
+            "error TEXT, created_at REAL, updated_at REAL)"
+        )
+        self._db.commit()
+
+    def _save(self, video_id, upload_id=None, status=PENDING, playback_uri=None, error=None):
+        now = time.time()
+        with self._db_lock:
+            self._db.execute(
+                "INSERT INTO transcode_jobs (video_id, upload_id, status, playback_uri, error, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(video_id) DO UPDATE SET "
+                "status = excluded.status, playback_uri = excluded.playback_uri, "
+                "error = excluded.error, updated_at = excluded.updated_at",
+                (video_id, upload_id, status, playback_uri, error, now, now)
+            )
+            self._db.commit()
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='theta-transcode-tracker', daemon=True)
+            self._thread.start()
+
+    def track(self, video_id: str, upload_id: str = None) -> Future:
+        """
+        Follow an existing video until it is transcoded.
+        """
+        with self._lock:
+            if self._stopped:
+                raise RuntimeError("Transcode tracker has been shut down.")
+            job = self._jobs.get(video_id)
+            if job is not None:
+                return job.future
+            job = _Job(video_id, upload_id, time.monotonic(), self.initial_interval)
+            self._jobs[video_id] = job
+            self._save(video_id, upload_id)
+            self._ensure_thread()
+            self._wakeup.notify()
+        return job.future
+
+    def submit(self, upload_id: str) -> Future:
+        """
+        Start transcoding an upload and track it. Raises TranscodeError if the API refuses the job.
+        """
+        video_id = self.create_fn(upload_id)
+        if video_id is None:
+            raise TranscodeError(f"Failed to start transcode for upload {upload_id}")
+        return self.track(video_id, upload_id)
+
+    def resume(self) -> dict:
+        """
+        Resume tracking every job left pending by a previous process. Returns {video_id: Future}.
+        """
+        with self._db_lock:
+            rows = self._db.execute("SELECT video_id, upload_id FROM transcode_jobs WHERE status = ?", (PENDING,)).fetchall()
+        return {video_id: self.track(video_id, upload_id) for video_id, upload_id in rows}
+
+    def pending(self) -> list:
+        with self._lock:
+            return list(self._jobs)
+
+    def _poll(self, job):
+        try:
+            state, playback_uri = self.status_fn(job.video_id)
+        except Exception as e:
+            logger.error(f"Failed to poll video {job.video_id}: {e}")
+            state, playback_uri = None, None
+
+        if state == SUCCESS and playback_uri:
+            self._save(job.video_id, status=SUCCESS, playback_uri=playback_uri)
+            return SUCCESS, playback_uri
+        if state in FAILED_STATES:
+            self._save(job.video_id, status=FAILED, error=state)
+            return FAILED, TranscodeError(f"Transcoding of video {job.video_id} failed with state '{state}'")
+        return state, None
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._stopped:
+                    now = time.monotonic()
+                    due = [job for job in self._jobs.values() if job.next_poll_at <= now]
+                    if due:
+                        break
+                    if not self._jobs:
+                        self._wakeup.wait()
+                    else:
+                        next_poll_at = min(job.next_poll_at for job in self._jobs.values())
+                        self._wakeup.wait(timeout=next_poll_at - now)
+                if self._stopped:
+                    return
+
+            for job in due:
+                try:
+                    self._advance(job)
+                except Exception as e:
+                    # One bad job must not end polling for the others; it is retried later
+                    logger.error(f"Failed to track video {job.video_id}: {e}")
+                    with self._lock:
+                        job.next_poll_at = time.monotonic() + job.interval
+
+    def _advance(self, job):
+        outcome, value = self._poll(job)
+        with self._lock:
+            if outcome in (SUCCESS, FAILED):
+                self._jobs.pop(job.video_id, None)
+                self._states.pop(job.video_id, None)
+            else:
+                # Reset the interval when the state moves, back off while it is unchanged
+                if self._states.get(job.video_id) != outcome:
+                    job.interval = self.initial_interval
+                else:
+                    job.interval = min(job.interval * self.backoff_factor, self.max_interval)
+                self._states[job.video_id] = outcome
+                job.next_poll_at = time.monotonic() + job.interval
+        if job.future.done():
+            # Cancelled by the caller; the job is still tracked so its outcome is recorded
+            return
+        if outcome == SUCCESS:
+            job.future.set_result(value)
+        elif outcome == FAILED:
+            job.future.set_exception(value)
+
+    def shutdown(self, wait: bool = True):
+        """
+        Stop polling. Pending jobs stay in the job table and can be resumed later.
+        """
+        with self._lock:
+            self._stopped = True
+            self._wakeup.notify_all()
+        if wait and self._thread is not None:
+            self._thread.join()
+        with self._db_lock:
+            self._db.close()
@@ -0,0 +1,267 @@
+import contextlib
+import hashlib
+import json
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from theta_agents.clients import get_client_registry
+from theta_agents.config.default_config import global_config
+
+logger = logging.getLogger(__name__)
+
+# Node errors meaning the locally tracked nonce no longer matches the chain
+NONCE_ERRORS = ('nonce too low', 'nonce too high', 'already known', 'replacement transaction underpriced', 'invalid nonce')
+
+
+class DeployError(Exception):
+    pass
+
+
+class NonceManager:
+    """
+    Hands out consecutive nonces per sending address without a round trip per transaction.
+
+    The first nonce for an address is read from the node's pending transaction count; after
+    that nonces are counted locally. `resync()` drops the local count so the next `reserve()`
+    reads it from the node again, e.g. after a send failed.
+    """
+
+    def __init__(self, w3):
+        self.w3 = w3
+        self._next = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def lock(self, address: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(address, threading.Lock())
+
+    def reserve(self, address: str) -> int:
+        """
+        Return the next nonce for `address`. Callers should hold `lock(address)` until the
+        transaction is sent so transactions reach the node in nonce order.
+        """
+        nonce = self._next.get(address)
+        if nonce is None:
+            nonce = self.w3.eth.get_transaction_count(address, 'pending')
+        self._next[address] = nonce + 1
+        return nonce
+
+    def resync(self, address: str):
+        self._next.pop(address, None)
+
+
+class DeployPipeline:
+    """
+    Sends contract deployments without waiting for each one to be mined.
+
+    `submit()` estimates gas for the constructor (cached per bytecode and arguments), signs
+    with a locally managed nonce and broadcasts, then returns a `concurrent.futures.Future`
+    that resolves to the contract address. A single background thread polls the receipts
+    of every in-flight transaction, as one JSON-RPC batch request per round on HTTP
+    providers, so many deployments can be in flight from the same wallet at once.
+    """
+
+    def __init__(self, w3, chain_id: int = None, gas_multiplier: float = 1.2, min_gas_price: int = 0,
+                 poll_interval: float = 1.0, receipt_timeout: float = 300, gas_price_ttl: float = 15):
+        self.w3 = w3
+        self.chain_id = chain_id
+        self.gas_multiplier = gas_multiplier
+        self.min_gas_price = min_gas_price
+        self.poll_interval = poll_interval
+        self.receipt_timeout = receipt_timeout
+        self.gas_price_ttl = gas_price_ttl
+        self.nonces = NonceManager(w3)
+        self._gas_estimates = {}
+        self._gas_price = None
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._stopped = False
+        self._thread = None
+
+    def _get_chain_id(self) -> int:
+        if self.chain_id is None:
+            self.chain_id = self.w3.eth.chain_id
+        return self.chain_id
+
+    def _get_gas_price(self) -> int:
+        now = time.monotonic()
+        if self._gas_price is None or self._gas_price[1] <= now:
+            self._gas_price = (max(self.w3.eth.gas_price, self.min_gas_price), now + self.gas_price_ttl)
+        return self._gas_price[0]
+
+    def _estimate_gas(self, constructor, bytecode: str, args: tuple, address: str) -> int:
+        key = hashlib.sha256(json.dumps([bytecode, list(args)], default=str).encode('utf-8')).hexdigest()
+        gas = self._gas_estimates.get(key)
+        if gas is None:
+            gas = int(constructor.estimate_gas({'from': address}) * self.gas_multiplier)
+            self._gas_estimates[key] = gas
+        return gas
+
+    def submit(self, abi: list, bytecode: str, constructor_args: tuple = (), private_key: str = None) -> Future:
+        """
+        Sign and broadcast a deployment. Raises DeployError if the node rejects the transaction;
+        the returned future fails if the deployment reverts or is not mined in `receipt_timeout`.
+        """
+        # The client is held until the receipt arrives, so a config reload does not close it under the wait
+        held = contextlib.ExitStack()
+        held.enter_context(get_client_registry().lease(self.w3))
+        try:
+            future = self._submit(abi, bytecode, constructor_args, private_key)
+        except BaseException:
+            held.close()
+            raise
+        future.add_done_callback(lambda _: held.close())
+        return future
+
+    def _submit(self, abi: list, bytecode: str, constructor_args: tuple, private_key: str) -> Future:
+        account = self.w3.eth.account.from_key(private_key)
+        contract = self.w3.eth.contract(abi=abi, bytecode=bytecode)
+        constructor = contract.constructor(*constructor_args)
+        gas = self._estimate_gas(constructor, bytecode, constructor_args, account.address)
+        base_tx = {'chainId': self._get_chain_id(), 'from': account.address, 'gas': gas, 'gasPrice': self._get_gas_price()}
+
+        with self.nonces.lock(account.address):
+            nonce = self.nonces.reserve(account.address)
+            try:
+                tx = constructor.build_transaction(dict(base_tx, nonce=nonce))
+                signed_tx = account.sign_transaction(tx)
+                tx_hash = self.w3.to_hex(self.w3.eth.send_raw_transaction(signed_tx.rawTransaction))
+            except Exception as e:
+                # The nonce was not used (or the chain moved on without us); read it again next time
+                self.nonces.resync(account.address)
+                if any(marker in str(e).lower() for marker in NONCE_ERRORS):
+                    logger.warning(f"Nonce {nonce} for {account.address} rejected, resyncing: {e}")
+                raise DeployError(f"Failed to send deployment: {e}") from e
+
+        future = Future()
+        future.tx_hash = tx_hash
+        with self._lock:
+            if self._stopped:
+                raise RuntimeError("Deploy pipeline has been shut down.")
+            self._pending[tx_hash] = (future, time.monotonic() + self.receipt_timeout)
+            self._ensure_thread()
+            self._wakeup.notify()
+        logger.info(f"Sent deployment {tx_hash} from {account.address} with nonce {nonce}")
+        return future
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='theta-deploy-receipts', daemon=True)
+            self._thread.start()
+
+    def _fetch_receipts(self, tx_hashes: list) -> dict:
+        """
+        Return {tx_hash: (status, contract_address)} for the mined transactions among `tx_hashes`.
+        """
+        from web3 import Web3
+        from web3.exceptions import TransactionNotFound
+
+        endpoint = getattr(self.w3.provider, 'endpoint_uri', None)
+        receipts = {}
+        if endpoint and len(tx_hashes) > 1:
+            payload = [{"jsonrpc": "2.0", "id": index, "method": "eth_getTransactionReceipt", "params": [tx_hash]}
+                       for index, tx_hash in enumerate(tx_hashes)]
+            response = get_client_registry().get_session(str(endpoint)).post(str(endpoint), json=payload)
+            response.raise_for_status()
+            for item in response.json():
+                receipt = item.get("result")
+                if receipt:
+                    address = receipt.get("contractAddress")
+                    status = receipt.get("status", "0x1")
+                    receipts[tx_hashes[item["id"]]] = (
+                        int(status, 16) if isinstance(status, str) else int(status),
+                        Web3.to_checksum_address(address) if address else None
+                    )
+            return receipts
+
+        # Providers without an HTTP endpoint (e.g. eth-tester) are polled one call at a time
+        for tx_hash in tx_hashes:
+            try:
+                receipt = self.w3.eth.get_transaction_receipt(tx_hash)
+            except TransactionNotFound:
+                continue
+            receipts[tx_hash] = (receipt.get("status", 1), receipt.get("contractAddress"))
+        return receipts
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._pending and not self._stopped:
+                    self._wakeup.wait()
+                if self._stopped:
+                    return
+                pending = dict(self._pending)
+
+            try:
+                receipts = self._fetch_receipts(list(pending))
+            except Exception as e:
+                logger.error(f"Failed to poll deployment receipts: {e}")
+                receipts = {}
+
+            now = time.monotonic()
+            for tx_hash, (future, deadline) in pending.items():
+                if future.done():
+                    # Cancelled by the caller
+                    pass
+                elif tx_hash in receipts:
+                    status, address = receipts[tx_hash]
+                    if status == 1 and address:
+                        future.set_result(address)
+                    else:
+                        future.set_exception(DeployError(f"Deployment {tx_hash} reverted"))
+                elif deadline <= now:
+                    future.set_exception(TimeoutError(f"Deployment {tx_hash} was not mined within {self.receipt_timeout}s"))
+                else:
+                    continue
+                with self._lock:
+                    self._pending.pop(tx_hash, None)
+
+            # Sleep out the full interval even if new deployments arrive; they join the next batch
+            next_poll_at = time.monotonic() + self.poll_interval
+            with self._lock:
+                while not self._stopped and next_poll_at > time.monotonic():
+                    self._wakeup.wait(timeout=next_poll_at - time.monotonic())
+
+    def pending(self) -> list:
+        with self._lock:
+            return list(self._pending)
+
+    def shutdown(self, wait: bool = True):
+        """
+        Stop polling. Futures of transactions still in flight are cancelled.
+        """
+        with self._lock:
+            self._stopped = True
+            pending = list(self._pending.values())
+            self._pending.clear()
+            self._wakeup.notify_all()
+        for future, _ in pending:
+            future.cancel()
+        if wait and self._thread is not None:
+            self._thread.join()
+
+
+_pipelines = {}
+_pipelines_lock = threading.Lock()
+
+def get_deploy_pipeline() -> DeployPipeline:
+    """
+    Return the process-wide pipeline for the RPC endpoint in the `deploy_smart_contract` config.
+    """
+    config = global_config["capabilities"]["smart_contract_tools"]["deploy_smart_contract"]
+    rpc_url = config["rpc_url"]
+    with _pipelines_lock:
+        pipeline = _pipelines.get(rpc_url)
+        if pipeline is None:
+            pipeline = _pipelines[rpc_url] = DeployPipeline(
+                get_client_registry().get_web3(rpc_url),
+                chain_id=int(config["chain_id"]),
+                gas_multiplier=float(config["gas_multiplier"]),
+                min_gas_price=int(config["min_gas_price"]),
+                poll_interval=float(config["receipt_poll_interval"]),
+                receipt_timeout=float(config["receipt_timeout"])
+            )
+        return pipeline
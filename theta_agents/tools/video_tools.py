@@ -1,28 +1,59 @@
 import logging
-from gradio_client import Client as client_gradio
+from theta_agents.clients import get_client_registry
 from theta_agents.config.default_config import global_config
+from theta_agents.routing import aroute, route
+from theta_agents.scheduler import RequestShed
 
 logger = logging.getLogger(__name__)
 
+def _create_video(config, edgecloud_endpoint, filename_or_url):
+    edgecloud_endpoint_type = config["edgecloud_endpoint_type"]
+    api_key = config.get("api_key")
+
+    if edgecloud_endpoint_type == "gradio":
+        result = get_client_registry().predict_gradio(edgecloud_endpoint, api_key, filename_or_url, api_name="/predict")
+        return result.get('url', '')
+    else:
+        logger.error("Invalid edgecloud endpoint type.")
+        return "Error: Invalid endpoint type."
+
 def create_video_from_image(filename_or_url: str) -> str:
     """
     Create a video from an image (URL or filename) and return the video URL.
     """
     try:
-        config = global_config["capabilities"]["image_tools"]["create_video_from_image"]
-        edgecloud_endpoint = config["edgecloud_endpoint"]
-        edgecloud_endpoint_type = config["edgecloud_endpoint_type"]
-
-        if edgecloud_endpoint_type == "gradio":
-            client = client_gradio(edgecloud_endpoint)
-            result = client.predict(
-                filename_or_url,
-                api_name="/predict"
-            )
-            return result.get('url', '')
-        else:
-            logger.error("Invalid edgecloud endpoint type.")
-            return "Error: Invalid endpoint type."
+        config = global_config["capabilities"]["video_tools"]["create_video_from_image"]
+        return route('create_video_from_image', config, lambda endpoint: _create_video(config, endpoint, filename_or_url))
+    except RequestShed as e:
+        logger.warning(f"Failed to create video: {e}")
+        return f"Error: {e}"
+    except Exception as e:
+        logger.error(f"Failed to create video: {e}")
+        return "Error: Failed to create video."
+
+async def _acreate_video(config, edgecloud_endpoint, filename_or_url):
+    edgecloud_endpoint_type = config["edgecloud_endpoint_type"]
+    api_key = config.get("api_key")
+
+    if edgecloud_endpoint_type == "gradio":
+        result = await get_client_registry().apredict_gradio(edgecloud_endpoint, api_key, filename_or_url, api_name="/predict")
+        return result.get('url', '')
+    else:
+        logger.error("Invalid edgecloud endpoint type.")
+        return "Error: Invalid endpoint type."
+
+async def acreate_video_from_image(filename_or_url: str) -> str:
+    """
+    Create a video from an image (URL or filename) and return the video URL.
+    """
+    try:
+        config = global_config["capabilities"]["video_tools"]["create_video_from_image"]
+        return await aroute('create_video_from_image', config, lambda endpoint: _acreate_video(config, endpoint, filename_or_url))
+    except RequestShed as e:
+        logger.warning(f"Failed to create video: {e}")
+        return f"Error: {e}"
     except Exception as e:
         logger.error(f"Failed to create video: {e}")
-        return "Error: Failed to create video."
\ No newline at end of file
+        return "Error: Failed to create video."
+
+create_video_from_image.async_variant = acreate_video_from_image